@@ -2,7 +2,7 @@ from django.contrib import admin
 from treebeard.admin import TreeAdmin
 from treebeard.forms import movenodeform_factory
 
-from bom.models import Assembly, Component
+from bom.models import Assembly, Component, ImportJob
 
 
 class MyAdmin(TreeAdmin):
@@ -15,3 +15,4 @@ class MyAdmin(TreeAdmin):
 
 admin.site.register(Assembly, MyAdmin)
 admin.site.register(Component)
+admin.site.register(ImportJob)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class Bom1Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bom'
+
+    def ready(self):
+        from bom import signals  # noqa: F401
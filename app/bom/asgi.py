@@ -0,0 +1,143 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from weakref import WeakKeyDictionary
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler as DjangoASGIHandler
+
+
+class Workers:
+    """ Slots for sync code of requests of one event loop. Unlimited requests would share the interpreter
+        and make every one of them as slow as all together, and a slot taken for a whole streamed tree
+        (like a worker of gunicorn is) would keep small requests waiting for it.
+
+        Requests waiting to run their views get free slots before parts of streamed trees, newest of them
+        first: when requests come faster than they are served, most of them are served at once instead of
+        every one waiting for all older ones. At most stream_size slots read parts of streamed trees at once,
+        the others are left for views.
+    """
+
+    def __init__(self, size: int, stream_size: int):
+        self.stream_size = min(stream_size, size)
+        self._free = size
+        self._reading = 0
+        self._views = deque()
+        self._parts = deque()
+
+    def _take(self, part: bool):
+        self._free -= 1
+        self._reading += part
+
+    def _release(self, part: bool):
+        self._free += 1
+        self._reading -= part
+        while self._free:
+            if self._views:
+                waiter, part = self._views.pop(), False
+            elif self._parts and self._reading < self.stream_size:
+                waiter, part = self._parts.popleft(), True
+            else:
+                return
+            # requests which went away while waiting leave cancelled waiters behind
+            if not waiter.done():
+                self._take(part)
+                waiter.set_result(None)
+
+    def _is_free(self, part: bool) -> bool:
+        if part:
+            return self._free > 0 and not self._views and not self._parts and self._reading < self.stream_size
+        return self._free > 0 and not self._views
+
+    @asynccontextmanager
+    async def _slot(self, part: bool):
+        if self._is_free(part):
+            self._take(part)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            (self._parts if part else self._views).append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # slot was given to the request just before it went away
+                if waiter.done() and not waiter.cancelled():
+                    self._release(part)
+                raise
+        try:
+            yield
+        finally:
+            self._release(part)
+
+    def view(self):
+        """ Slot for view of a request with its middleware. """
+        return self._slot(part=False)
+
+    def part(self):
+        """ Slot for reading one part of streamed tree. """
+        return self._slot(part=True)
+
+
+class ASGIHandler(DjangoASGIHandler):
+    """ ASGI handler reading parts of streamed responses in the thread of their request, where their sync views
+        ran, and sending them from the event loop. Django 4.0 iterates streamed responses in the event loop, where
+        queries of stream_dump fail (SynchronousOnlyOperation), and any other iterator would keep every request
+        of the process waiting until the whole tree was sent.
+
+        Views run with sync middleware in one call to the thread of their request, instead of a call for
+        every middleware which isn't async capable (django's handler adapts each of them separately).
+        Views and reading of every part of streamed responses share settings.BOM_ASGI_WORKERS slots, see Workers.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # asyncio primitives are bound to event loop of their first use (python 3.9 binds them when created)
+        self._workers = WeakKeyDictionary()
+
+    @property
+    def workers(self) -> Workers:
+        loop = asyncio.get_running_loop()
+        if loop not in self._workers:
+            self._workers[loop] = Workers(settings.BOM_ASGI_WORKERS, settings.BOM_ASGI_STREAM_WORKERS)
+        return self._workers[loop]
+
+    def load_middleware(self, is_async=False):
+        # sync chain, get_response_async runs it in the thread of request
+        super().load_middleware(is_async=False)
+
+    async def get_response_async(self, request):
+        async with self.workers.view():
+            return await sync_to_async(self.get_response, thread_sensitive=True)(request)
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        parts = iter(response)
+        # thread sensitive calls of a request run in its own thread (ThreadSensitiveContext of django's handler),
+        # so server-side cursor of streamed tree stays in the thread of its connection
+        read_part = sync_to_async(next, thread_sensitive=True)
+
+        async def next_part():
+            async with self.workers.part():
+                return await read_part(parts, None)
+
+        async def send_parts(message):
+            # django's handler sends headers and the final empty body, parts are sent before the latter
+            if message['type'] == 'http.response.body':
+                part = await next_part()
+                while part is not None:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    part = await next_part()
+            await send(message)
+
+        response.streaming_content = ()
+        await super().send_response(response, send_parts)
+
+
+def get_asgi_application() -> ASGIHandler:
+    """ Returns ASGI application of the project, see django.core.asgi.get_asgi_application. """
+    django.setup(set_prefix=False)
+    return ASGIHandler()
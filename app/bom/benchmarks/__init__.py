@@ -0,0 +1,4 @@
+"""
+Benchmarks of bom services, run with `python manage.py benchmark <scenario>`.
+Every scenario runs on a freshly created test database, so real data is never touched.
+"""
@@ -0,0 +1,58 @@
+import json
+from typing import Dict, List
+
+# measured values which may differ between runs, query counts have to be the same
+TOLERATED = ("seconds", "peak_mb")
+
+Results = Dict[str, List[dict]]
+
+
+def _keyed(results: Results) -> Dict[tuple, dict]:
+    return {(scenario, result["name"], result.get("rows")): result
+            for scenario, scenario_results in results.items() for result in scenario_results}
+
+
+def save_baseline(path: str, results: Results, rows: int, seed: int):
+    """ Saves results of scenarios as JSON baseline for later runs with the same rows and seed. """
+    with open(path, "w") as file:
+        json.dump({"rows": rows, "seed": seed, "results": results}, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def load_baseline(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(results: Results, baseline: dict, tolerance: float) -> List[str]:
+    """ Compares results with baseline saved by save_baseline. Results of scenarios or runs which are
+        not in baseline are skipped.
+
+        Parameters
+        -----------
+        results: Dict[str, List[dict]]
+            results of scenarios, by scenario name
+        baseline: dict
+            loaded baseline
+        tolerance: float
+            allowed relative growth of time and peak memory, e.g. 0.25 for 25%
+
+        Returns
+        ----------
+        List[str]
+            descriptions of regressions: time or memory which grew more than tolerance,
+            any growth of number of queries
+    """
+    regressions = []
+    expected = _keyed(baseline["results"])
+    for key, result in _keyed(results).items():
+        base = expected.get(key)
+        if base is None:
+            continue
+        label = ":".join(str(part) for part in key)
+        for field in TOLERATED:
+            if field in result and base.get(field) and result[field] > base[field] * (1 + tolerance):
+                regressions.append(f"{label} {field} {base[field]} -> {result[field]}")
+        if "queries" in base and result.get("queries", 0) > base["queries"]:
+            regressions.append(f"{label} queries {base['queries']} -> {result['queries']}")
+    return regressions
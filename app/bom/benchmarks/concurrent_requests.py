@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+from typing import List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from bom.asgi import ASGIHandler
+from bom.benchmarks.generator import generated_file
+from bom.models import Assembly, Component, TreeVersion
+from bom.services import save_to_db
+
+CLIENTS = 100
+# requests made by every client one after another
+REQUESTS = 5
+# every LARGE_EVERY-th client reads the whole large tree, the others the first page of children of a small one
+LARGE_EVERY = 10
+SMALL_ROWS = 50
+# sync workers of gunicorn (2 * cores + 1 of a small host), each serves one request at a time
+SYNC_WORKERS = 5
+# sync workers are processes, debug toolbar isn't used in production
+MIDDLEWARE = [path for path in settings.MIDDLEWARE if not path.startswith("debug_toolbar")]
+
+Plan = List[Tuple[bool, str]]
+
+
+def _read(response) -> int:
+    content = b"".join(response.streaming_content) if response.streaming else response.content
+    response.close()
+    return len(content)
+
+
+def _serve_sync(plans: List[Plan]) -> List[Tuple[bool, float]]:
+    """ Clients are threads, which wait for a free sync worker to get and read every response. """
+    workers = threading.Semaphore(SYNC_WORKERS)
+
+    def client(plan: Plan):
+        http = Client()
+        latencies = []
+        for large, url in plan:
+            start = perf_counter()
+            with workers:
+                _read(http.get(url))
+            latencies.append((large, perf_counter() - start))
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=len(plans)) as pool:
+        return [latency for latencies in pool.map(client, plans) for latency in latencies]
+
+
+async def _get(application: ASGIHandler, url: str) -> int:
+    path, _, query = url.partition("?")
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'query_string': query.encode(), 'headers': [(b'host', b'testserver')],
+             'server': ('testserver', 80)}
+    size = 0
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal size
+        size += len(message.get('body', b''))
+
+    await application(scope, receive, send)
+    return size
+
+
+def _serve_async(plans: List[Plan]) -> List[Tuple[bool, float]]:
+    """ Clients are tasks of one event loop, which send their requests to ASGI application of bom.asgi. """
+    application = ASGIHandler()
+
+    async def client(plan: Plan):
+        latencies = []
+        for large, url in plan:
+            start = perf_counter()
+            await _get(application, url)
+            latencies.append((large, perf_counter() - start))
+        return latencies
+
+    async def clients():
+        return await asyncio.gather(*(client(plan) for plan in plans))
+
+    return [latency for latencies in asyncio.run(clients()) for latency in latencies]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def _result(name: str, serve, plans: List[Plan]) -> dict:
+    # responses of small tree are cached by the first requests, like they are on a running server
+    cache.clear()
+    start = perf_counter()
+    latencies = serve(plans)
+    seconds = perf_counter() - start
+    small = [latency for large, latency in latencies if not large]
+    large = [latency for large, latency in latencies if large]
+    return {"name": name, "seconds": round(seconds, 4), "requests": len(latencies),
+            "requests_per_second": round(len(latencies) / seconds, 1),
+            "small_p50_ms": _ms(quantiles(small, n=100)[49]), "small_p95_ms": _ms(quantiles(small, n=100)[94]),
+            "large_p95_ms": _ms(quantiles(large, n=100)[94])}
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Serves CLIENTS concurrent clients, some of which read a large streamed tree of rows nodes, while
+        the others page children of a small one, by sync workers like gunicorn and by ASGI application
+        of bom.asgi (served e.g. by uvicorn), and reports throughput and latencies of both.
+        Servers run in this process, so that they share the test database, HTTP isn't measured.
+        Trees are committed to be visible to connections of other threads and deleted at the end.
+    """
+    large_root, = save_to_db(generated_file(rows, seed=seed))
+    small_root, = save_to_db(generated_file(SMALL_ROWS, seed=seed + 1))
+    large_url = reverse('bom:item_details', args=[large_root.pk])
+    small_url = f"{reverse('bom:item_details', args=[small_root.pk])}?children=true&page_size=20"
+    plans = [[(True, large_url) if idx % LARGE_EVERY == 0 else (False, small_url)] * REQUESTS
+             for idx in range(CLIENTS)]
+
+    try:
+        # large tree is streamed however many rows are generated, pages of children never are
+        with override_settings(MIDDLEWARE=MIDDLEWARE, BOM_STREAMING_MIN_NODES=1):
+            results = [_result("sync_gunicorn", _serve_sync, plans), _result("async_asgi", _serve_async, plans)]
+    finally:
+        Assembly.objects.all().delete()
+        Component.objects.all().delete()
+        TreeVersion.objects.all().delete()
+
+    for result in results:
+        result["rows"] = rows
+        result["clients"] = CLIENTS
+    return results
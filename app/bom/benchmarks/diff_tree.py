@@ -0,0 +1,32 @@
+from typing import List
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+
+from bom.benchmarks.generator import bom_csv, generate_bom_rows, mutate_bom_rows
+from bom.benchmarks.utils import measure
+from bom.diff import diff_trees
+from bom.services import save_to_db
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Diffs generated trees with their mutated revisions, of half and of full size, so that growth
+        of time with size of trees can be seen. About one row in thousand is changed in each way.
+    """
+    results = []
+
+    with transaction.atomic():
+        for size in (rows // 2, rows):
+            tree_rows = list(generate_bom_rows(size, seed=seed))
+            old, = save_to_db(SimpleUploadedFile("old.csv", bom_csv(tree_rows)))
+            new, = save_to_db(SimpleUploadedFile("new.csv",
+                                                 bom_csv(mutate_bom_rows(tree_rows, max(size // 1000, 1), seed=seed))))
+            diffs = []
+            result = measure("diff", lambda: diffs.append(diff_trees(old, new)))
+            result["rows"] = size
+            result["us_per_row"] = round(result["seconds"] * 1_000_000 / size, 2)
+            result.update({key: len(value) for key, value in diffs[0].items()})
+            results.append(result)
+        transaction.set_rollback(True)
+
+    return results
@@ -0,0 +1,28 @@
+from typing import List
+
+from django.db import transaction
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.reference import serializer_dump_bulk
+from bom.benchmarks.utils import measure
+from bom.models import Assembly
+from bom.services import save_to_db
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Compares dump_bulk built on django serializers with values_list based one on a generated tree. """
+    results, dumps = [], []
+
+    with transaction.atomic():
+        root, = save_to_db(generated_file(rows, seed=seed))
+        for name, dump in (("serializers", serializer_dump_bulk), ("values_list", Assembly.dump_bulk)):
+            result = measure(name, lambda: dumps.append(dump(root, keep_ids=False)))
+            result["rows"] = rows
+            results.append(result)
+        transaction.set_rollback(True)
+
+    for dump in dumps:
+        del dump["total_cost"]  # serializer based dump doesn't multiply quantities down the path
+    for result in results:
+        result["identical_tree"] = dumps[0] == dumps[1]
+    return results
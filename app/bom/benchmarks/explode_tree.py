@@ -0,0 +1,35 @@
+from typing import List
+
+from django.db import transaction
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.reference import dump_explode
+from bom.benchmarks.utils import measure
+from bom.costs import COST_QUANTUM
+from bom.explosion import explode
+from bom.services import save_to_db
+
+MAX_DEPTH = 15
+UNITS = 10
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Compares server-side parts explosion with flattening of dump_bulk output on a deep generated tree. """
+    results, quantities = [], []
+
+    def explode_quantities(root, units):
+        return {(part['identifier'], part['name']): part['quantity']
+                for group in explode(root, units) for part in group['parts']}
+
+    with transaction.atomic():
+        root, = save_to_db(generated_file(rows, max_depth=MAX_DEPTH, seed=seed))
+        for name, func in (("dump_bulk", dump_explode), ("explode", explode_quantities)):
+            result = measure(name, lambda: quantities.append(func(root, UNITS)))
+            result["rows"] = rows
+            results.append(result)
+        transaction.set_rollback(True)
+
+    expected = {key: quantity.quantize(COST_QUANTUM) for key, quantity in quantities[0].items()}
+    for result in results:
+        result["identical_parts"] = expected == quantities[1]
+    return results
@@ -0,0 +1,115 @@
+import csv
+import io
+import random
+from typing import Iterable, Iterator, List, Optional
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+HEADER = ["level", "item_number", "item_name", "item_category", "unit_of_measure", "procurement_type",
+          "quantity", "Price by Unit"]
+QUANTITIES = ["1", "1", "1", "2", "4", "0.5", "1.12"]
+UNITS = ["EA", "EA", "EA", "M", "KG"]
+PROCUREMENT_TYPES = ["MTS", "MTS", "BUY"]
+
+
+def generate_bom_rows(rows: int, max_depth: int = 6, components: int = 500, seed: int = 0,
+                      max_children: Optional[int] = None) -> Iterator[List[str]]:
+    """ Generates rows of a single BOM tree in the format accepted by validated_line.
+
+        Parameters
+        -----------
+        rows: int
+            number of rows, including root
+        max_depth: int
+            maximal level of a row (root has level 0)
+        components: int
+            size of the pool of components which are reused across the tree, smaller pool means more reuse
+        seed: int
+            seed of random generator, same seed always gives the same file
+        max_children: int
+            width of tree, not limited by default. Root gets max_children children, other nodes above
+            max_depth get between 1 and max_children of them, tree has to be able to hold all rows
+
+        Returns
+        ----------
+        Iterator[List[str]]
+            rows of csv file without header
+    """
+    rnd = random.Random(seed)
+    pool = [
+        (f"{100 + idx % 900:03d}-{idx:04d}-00", f"component {idx}", rnd.choice(UNITS),
+         rnd.choice(PROCUREMENT_TYPES), f"{rnd.randint(1, 10000) / 100:.2f}")
+        for idx in range(components)
+    ]
+
+    yield ["0", "999-0001-00", "generated product", "", "EA", "MTS", "1", ""]
+    level = 0
+    # numbers of children open nodes still have to get, by their level
+    remaining = [max_children]
+    for _ in range(rows - 1):
+        if max_children is None:
+            level = rnd.randint(1, min(level + 1, max_depth))
+        else:
+            while remaining and not remaining[-1]:
+                remaining.pop()
+            if not remaining:
+                raise ValueError(f"Tree with at most {max_children} children per node and depth {max_depth} "
+                                 f"can't have {rows} rows.")
+            level = len(remaining)
+            remaining[-1] -= 1
+            remaining.append(rnd.randint(1, max_children) if level < max_depth else 0)
+        identifier, name, unit, procurement_type, price = rnd.choice(pool)
+        yield [str(level), identifier, name, "", unit, procurement_type, rnd.choice(QUANTITIES), price]
+
+
+def mutate_bom_rows(rows: List[List[str]], changes: int, seed: int = 0) -> List[List[str]]:
+    """ Makes next revision of generated rows: changes quantities of some rows, removes some leaves
+        and adds new leaves, changes of each kind are made changes times.
+
+        Parameters
+        -----------
+        rows: List[List[str]]
+            rows of a tree as returned by generate_bom_rows
+        changes: int
+            number of changes of each kind
+        seed: int
+            seed of random generator
+
+        Returns
+        ----------
+        List[List[str]]
+            rows of mutated tree
+    """
+    rnd = random.Random(seed)
+    rows = [list(row) for row in rows]
+    for _ in range(changes):
+        row = rows[rnd.randrange(1, len(rows))]
+        row[6] = rnd.choice([quantity for quantity in QUANTITIES if quantity != row[6]])
+    for _ in range(changes):
+        leaves = [idx for idx in range(1, len(rows))
+                  if idx + 1 == len(rows) or int(rows[idx + 1][0]) <= int(rows[idx][0])]
+        del rows[rnd.choice(leaves)]
+    for idx in range(changes):
+        position = rnd.randrange(len(rows))
+        level = str(int(rows[position][0]) + 1)
+        rows.insert(position + 1, [level, f"900-{idx:04d}-00", f"new component {idx}", "", "EA", "BUY", "1", "1.00"])
+    return rows
+
+
+def generate_bom_csv(rows: int, **kwargs) -> bytes:
+    """ Generates whole csv file (with header) as bytes, see generate_bom_rows for arguments. """
+    return bom_csv(generate_bom_rows(rows, **kwargs))
+
+
+def bom_csv(rows: Iterable[List[str]]) -> bytes:
+    """ Writes rows to csv file (with header) as bytes. """
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    return output.getvalue().encode("utf-8")
+
+
+def generated_file(rows: int, file_name="generated.csv", **kwargs) -> SimpleUploadedFile:
+    """ Generates csv file wrapped the same way as files uploaded by users. """
+    return SimpleUploadedFile(file_name, generate_bom_csv(rows, **kwargs), content_type="text/csv")
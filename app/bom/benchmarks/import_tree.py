@@ -0,0 +1,42 @@
+from typing import List
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import override_settings
+
+from bom.benchmarks.generator import generate_bom_csv
+from bom.benchmarks.reference import treebeard_save_to_db
+from bom.benchmarks.utils import measure
+from bom.columnar import save_columns_to_db
+from bom.models import Assembly
+from bom.services import save_to_db
+
+BULK_CREATE_INGEST, COPY_INGEST = "bom.ingest.BulkCreateIngest", "bom.ingest.CopyIngest"
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Compares node by node treebeard import with bulk import and columnar import of the same generated file,
+        with PostgreSQL also bulk and columnar imports written with COPY (see bom.ingest).
+        All imports are rolled back, resulting trees are compared row by row.
+    """
+    content = generate_bom_csv(rows, seed=seed)
+    results, trees = [], []
+    imports = [("treebeard", treebeard_save_to_db, BULK_CREATE_INGEST), ("bulk", save_to_db, BULK_CREATE_INGEST),
+               ("columnar", save_columns_to_db, BULK_CREATE_INGEST)]
+    if connection.vendor == "postgresql":
+        imports += [("bulk_copy", save_to_db, COPY_INGEST), ("columnar_copy", save_columns_to_db, COPY_INGEST)]
+
+    for name, save, ingest in imports:
+        with transaction.atomic(), override_settings(BOM_INGEST_BACKEND=ingest):
+            file = SimpleUploadedFile("generated.csv", content, content_type="text/csv")
+            result = measure(name, save, file)
+            result["rows"] = rows
+            trees.append(list(Assembly.objects.values_list(
+                "path", "depth", "numchild", "component__identifier", "quantity"
+            )))
+            transaction.set_rollback(True)
+        results.append(result)
+
+    for result in results:
+        result["identical_trees"] = all(tree == trees[0] for tree in trees)
+    return results
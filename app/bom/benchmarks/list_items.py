@@ -0,0 +1,51 @@
+from itertools import chain
+from typing import List
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from bom.benchmarks.generator import bom_csv, generate_bom_rows
+from bom.benchmarks.utils import measure
+from bom.services import save_to_db
+
+TREES = 200
+PAGE_SIZE = 50
+QUERIES = (
+    ("all_fields", ""),
+    ("projected", "&fields=identifier,name,quantity"),
+)
+
+
+def _pages(client: Client, url: str) -> int:
+    pages = 0
+    while url:
+        url = client.get(url).json()["next"]
+        pages += 1
+    return pages
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Walks all pages of item list over TREES generated trees, which have rows in total, with all fields
+        of items and with projection to some of them. Response cache is cleared before every walk.
+    """
+    trees = chain.from_iterable(generate_bom_rows(max(rows // TREES, 1), seed=seed + idx) for idx in range(TREES))
+    results = []
+    client = Client()
+
+    with transaction.atomic():
+        save_to_db(SimpleUploadedFile("generated.csv", bom_csv(trees), content_type="text/csv"))
+        for name, query in QUERIES:
+            url = f"{reverse('bom:item_list')}?page_size={PAGE_SIZE}{query}"
+            pages = []
+            cache.clear()
+            result = measure(name, lambda: pages.append(_pages(client, url)))
+            result["rows"] = rows
+            result["pages"] = pages[0]
+            result["ms_per_page"] = round(result["seconds"] * 1000 / pages[0], 2)
+            results.append(result)
+        transaction.set_rollback(True)
+
+    return results
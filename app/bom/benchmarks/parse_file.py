@@ -0,0 +1,38 @@
+from itertools import islice
+from typing import List
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from bom.benchmarks.generator import generate_bom_csv
+from bom.benchmarks.utils import measure
+from bom.columnar import BATCH_SIZE, parse_columns
+from bom.importers import _decode_file
+from bom.validation import checked_rows
+
+
+def _parse_rows(file: SimpleUploadedFile):
+    decoded_file, _ = _decode_file(file)
+    for _ in checked_rows(decoded_file):
+        pass
+
+
+def _parse_columns(file: SimpleUploadedFile):
+    decoded_file, _ = _decode_file(file)
+    start, previous_level = 0, -1
+    for rows in iter(lambda: list(islice(decoded_file, BATCH_SIZE)), []):
+        batch, _ = parse_columns(rows, start, previous_level)
+        start, previous_level = start + len(rows), batch.levels[-1]
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Compares parsing and validation of generated file row at a time (CSVLineEntity per row) with
+        parsing into typed columns. Nothing is written to database, both include csv decoding.
+    """
+    content = generate_bom_csv(rows, seed=seed)
+    results = []
+    for name, parse in (("rows", _parse_rows), ("columns", _parse_columns)):
+        result = measure(name, parse, SimpleUploadedFile("generated.csv", content, content_type="text/csv"))
+        result["rows"] = rows
+        result["us_per_row"] = round(result["seconds"] * 1_000_000 / rows, 2)
+        results.append(result)
+    return results
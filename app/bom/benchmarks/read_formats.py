@@ -0,0 +1,99 @@
+import io
+import json
+from typing import Callable, Dict, List
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from bom.benchmarks.generator import HEADER, bom_csv, generate_bom_rows
+from bom.benchmarks.utils import measure
+from bom.importers import COLUMNS, file_rows, get_importers
+
+# rows of binary formats are written in groups of this size, read one group at a time
+ROW_GROUP_SIZE = 50_000
+
+
+def _csv(rows: List[List[str]]) -> bytes:
+    return bom_csv(rows)
+
+
+def _tsv(rows: List[List[str]]) -> bytes:
+    return "".join("\t".join(row) + "\n" for row in [HEADER] + rows).encode()
+
+
+def _jsonl(rows: List[List[str]]) -> bytes:
+    return "".join(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows).encode()
+
+
+def _xlsx(rows: List[List[str]]) -> bytes:
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append([int(row[0]), *row[1:6], float(row[6]), float(row[7]) if row[7] else None])
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+def _arrow_table(rows: List[List[str]]):
+    import pyarrow
+    columns = dict(zip(COLUMNS, map(list, zip(*rows))))
+    columns["level"] = list(map(int, columns["level"]))
+    columns["quantity"] = list(map(float, columns["quantity"]))
+    columns["Price by Unit"] = [float(price) if price else None for price in columns["Price by Unit"]]
+    return pyarrow.table(columns)
+
+
+def _parquet(rows: List[List[str]]) -> bytes:
+    import pyarrow.parquet
+    content = io.BytesIO()
+    pyarrow.parquet.write_table(_arrow_table(rows), content, row_group_size=ROW_GROUP_SIZE)
+    return content.getvalue()
+
+
+def _arrow(rows: List[List[str]]) -> bytes:
+    import pyarrow.ipc
+    table = _arrow_table(rows)
+    content = io.BytesIO()
+    with pyarrow.ipc.new_file(content, table.schema) as writer:
+        writer.write_table(table, max_chunksize=ROW_GROUP_SIZE)
+    return content.getvalue()
+
+
+WRITERS: Dict[str, Callable[[List[List[str]]], bytes]] = {
+    "csv": _csv,
+    "tsv": _tsv,
+    "json lines": _jsonl,
+    "xlsx": _xlsx,
+    "parquet": _parquet,
+    "arrow": _arrow,
+}
+
+
+def _read(file: SimpleUploadedFile):
+    rows, _ = file_rows(file)
+    for _ in rows:
+        pass
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Measures throughput of every configured importer reading the same generated BOM, without validation.
+        Formats whose packages are not installed are skipped.
+    """
+    generated = list(generate_bom_rows(rows, seed=seed))
+    results = []
+    for importer in get_importers():
+        write = WRITERS.get(importer.name)
+        if write is None or not importer.is_available():
+            results.append({"name": importer.name, "skipped": f"{importer.requires or 'writer'} is not available"})
+            continue
+        content = write(generated)
+        file = SimpleUploadedFile(f"generated{importer.extensions[0]}", content,
+                                  content_type=importer.content_types[0])
+        result = measure(importer.name, _read, file)
+        result["rows"] = rows
+        result["megabytes"] = round(len(content) / 2 ** 20, 2)
+        result["rows_per_second"] = round(rows / result["seconds"])
+        results.append(result)
+    return results
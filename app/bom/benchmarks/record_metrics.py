@@ -0,0 +1,77 @@
+from collections import deque
+from typing import Callable, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from bom.benchmarks.generator import generate_bom_csv
+from bom.benchmarks.utils import measure
+from bom.metrics import import_spans
+from bom.services import file_entities, save_to_db
+
+REQUESTS = 200
+# runs of every variant, the fastest one is reported, overhead is smaller than noise of single runs
+REPEAT = 5
+
+
+def _compare(name: str, plain: Callable, instrumented: Callable) -> List[dict]:
+    """ Runs both variants in turns, so that they are slowed down by the same noise, and reports the fastest
+        run of each with overhead of instrumented one.
+    """
+    runs = [(measure(name, plain), measure(f"{name}_instrumented", instrumented)) for _ in range(REPEAT)]
+    plain_result, instrumented_result = (min(results, key=lambda result: result["seconds"]) for results in zip(*runs))
+    instrumented_result["overhead_pct"] = round((instrumented_result["seconds"] / plain_result["seconds"] - 1) * 100, 1)
+    return [plain_result, instrumented_result]
+
+
+def _read(content: bytes):
+    deque(file_entities(SimpleUploadedFile("generated.csv", content, content_type="text/csv")), maxlen=0)
+
+
+def _save(content: bytes):
+    with transaction.atomic():
+        save_to_db(SimpleUploadedFile("generated.csv", content, content_type="text/csv"))
+        transaction.set_rollback(True)
+
+
+def _instrumented(func: Callable, *args):
+    with import_spans("benchmark"):
+        func(*args)
+
+
+def _get(client: Client, url: str):
+    for _ in range(REQUESTS):
+        client.get(url)
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Measures overhead of bom.metrics: reading and validating a generated file (the hot loop of imports)
+        and its whole import with and without timing of import phases, and REQUESTS cached requests of first
+        level of tree details with and without MetricsMiddleware.
+    """
+    content = generate_bom_csv(rows, seed=seed)
+    results = []
+    for name, func in (("read", _read), ("import", _save)):
+        results += _compare(name, lambda: func(content), lambda: _instrumented(func, content))
+
+    with transaction.atomic():
+        root, = save_to_db(SimpleUploadedFile("generated.csv", content, content_type="text/csv"))
+        # small response, so that overhead isn't hidden by rendering
+        url = f"{reverse('bom:item_details', args=[root.pk])}?max_depth=1"
+        cache.clear()
+        middleware = [path for path in settings.MIDDLEWARE if path != "bom.middleware.MetricsMiddleware"]
+        with override_settings(MIDDLEWARE=middleware):
+            # middleware of client's handler is loaded with its first request
+            plain_client = Client()
+            plain_client.get(url)
+        client = Client()
+        results += _compare("requests", lambda: _get(plain_client, url), lambda: _get(client, url))
+        transaction.set_rollback(True)
+
+    for result in results:
+        result["rows"] = rows
+    return results
@@ -0,0 +1,162 @@
+from decimal import Decimal
+
+from django.core import serializers
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+
+from bom.importers import _decode_file
+from bom.models import Assembly, Component
+from bom.services import validated_line
+
+
+@transaction.atomic
+def treebeard_save_to_db(file: UploadedFile):
+    """ Original implementation of save_to_db, which adds nodes one by one with treebeard API.
+        Kept as a reference for benchmarks and for checking that faster import produces identical trees.
+    """
+    decoded_file, validation_result = _decode_file(file)
+    assembly = None
+
+    if validation_result:
+        raise Exception("This should already be validated!")
+
+    for idx, row in enumerate(decoded_file):
+        entity, errors = validated_line(row)
+        if errors:
+            raise Exception("This should already be validated!")
+
+        component, _ = Component.objects.get_or_create(identifier=entity.identifier,
+                                                       name=entity.name,
+                                                       defaults={
+                                                           'category': entity.category,
+                                                           'unit': entity.unit,
+                                                           'procurement_type': entity.procurement_type,
+                                                           'price': entity.price,
+                                                       })
+        entity.depth += 1
+        if entity.depth == 1:
+            assembly = Assembly.add_root(
+                component=component,
+                quantity=entity.quantity,
+                depth=entity.depth,
+            )
+        else:
+            if assembly.depth == entity.depth:
+                assembly = assembly.add_sibling(
+                    component=component,
+                    quantity=entity.quantity,
+                    depth=entity.depth,
+                )
+            elif (assembly.depth + 1) == entity.depth:
+                assembly = assembly.add_child(
+                    component=component,
+                    quantity=entity.quantity,
+                    depth=entity.depth,
+                )
+            else:
+                diff = assembly.depth - entity.depth
+
+                for i in range(diff):
+                    assembly = assembly.get_parent()
+
+                assembly = assembly.add_sibling(
+                    component=component,
+                    quantity=entity.quantity,
+                    depth=entity.depth,
+                )
+
+
+def serializer_dump_bulk(parent=None, keep_ids=True):
+    """ Original implementation of Assembly.dump_bulk, which runs django serializers twice per node.
+        Kept as a reference for benchmarks and for checking that output of faster dump_bulk is identical.
+    """
+    qset = Assembly.objects.select_related('component').all()
+    if parent:
+        qset = qset.filter(path__startswith=parent.path)
+    ret, lnk = [], {}
+    pk_field = Assembly._meta.pk.attname
+
+    for assembly in qset:
+        assembly_obj = serializers.serialize('python', [assembly])
+        component = serializers.serialize('python', [assembly.component])
+        fields = assembly_obj[0]['fields']
+
+        fields['component'] = component[0]['fields']
+        path = fields['path']
+        depth = int(len(path) / Assembly.steplen)
+        del fields['depth']
+        del fields['path']
+        del fields['numchild']
+        # references of shared sub-assemblies are not dumped
+        del fields['shared']
+        del fields['is_shared']
+        if pk_field in fields:
+            del fields[pk_field]
+
+        newobj = {'assembly': fields}
+        if keep_ids:
+            newobj[pk_field] = assembly_obj[0]['pk']
+
+        if (not parent and depth == 1) or \
+                (parent and len(path) == len(parent.path)):
+            ret.append(newobj)
+        else:
+            parentpath = Assembly._get_basepath(path, depth - 1)
+            parentobj = lnk[parentpath]
+            if 'children' not in parentobj:
+                parentobj['children'] = []
+            parentobj['children'].append(newobj)
+        lnk[path] = newobj
+
+    total_cost = 0
+    for el in qset:
+        if not el.depth == 1:
+            total_cost += el.price
+    total = {'total_cost': str(total_cost)}
+    ret = {**total, **ret[0]}
+
+    return ret
+
+
+def scan_where_used():
+    """ Finds where-used entries of all assemblies by scanning every tree, like clients had to do
+        before the where-used index existed.
+
+        Returns
+        ----------
+        List[tuple]
+            assembly pk, component pk, root pk and quantity multiplied down the path from the root
+    """
+    results, stack = [], []
+    rows = Assembly.objects.order_by('path').values_list('pk', 'path', 'quantity', 'component_id')
+    for pk, path, quantity, component_id in rows.iterator():
+        while stack and not path.startswith(stack[-1][0]):
+            stack.pop()
+        root_id, multiplier = (stack[-1][2], stack[-1][1]) if stack else (pk, 1)
+        stack.append((path, multiplier * quantity, root_id))
+        results.append((pk, component_id, root_id, multiplier * quantity))
+    return results
+
+
+def dump_explode(root: Assembly, units=1) -> dict:
+    """ Flattens nested dump_bulk output into total quantities of leaf components, the way clients
+        did it before the explosion endpoint existed.
+
+        Returns
+        ----------
+        dict
+            quantities keyed by identifier and name of components
+    """
+    quantities = {}
+    stack = [(Assembly.dump_bulk(root, keep_ids=False), Decimal(units), True)]
+    while stack:
+        node, multiplier, is_root = stack.pop()
+        if not is_root:
+            multiplier *= node['assembly']['quantity']
+        if 'children' in node:
+            stack.extend((child, multiplier, False) for child in node['children'])
+            continue
+        component = node['assembly']['component']
+        key = (component['identifier'], component['name'])
+        quantities[key] = quantities.get(key, 0) + multiplier
+    return quantities
@@ -0,0 +1,40 @@
+from typing import List
+
+from django.db import transaction
+from django.db.models import F
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.utils import measure
+from bom.models import Assembly, AssemblyRollup
+from bom.rollups import rebuild_rollups, update_rollups
+from bom.services import save_to_db
+
+
+def _rollups(root: Assembly) -> list:
+    return list(AssemblyRollup.objects.filter(assembly__path__startswith=root.path).order_by('assembly_id')
+                .values_list('cost', 'descendants', 'max_depth', 'signature'))
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Compares rebuild of costs (rollups) of whole generated tree with update after change of quantity
+        of its deepest node, which recomputes only its ancestors, and measures dump of tree with costs.
+        Updated rollups are compared with rebuilt ones.
+    """
+    results = []
+
+    with transaction.atomic():
+        root, = save_to_db(generated_file(rows, seed=seed))
+        leaf = Assembly.objects.filter(path__startswith=root.path).order_by('-depth', 'path').first()
+        results.append(measure("rebuild", rebuild_rollups, root.path))
+        Assembly.objects.filter(pk=leaf.pk).update(quantity=F('quantity') + 1)
+        results.append(measure("update", update_rollups, [leaf.path]))
+        updated = _rollups(root)
+        rebuild_rollups(root.path)
+        identical = updated == _rollups(root)
+        results.append(measure("dump_costs", Assembly.dump_bulk, root, with_costs=True))
+        transaction.set_rollback(True)
+
+    for result in results:
+        result["rows"] = rows
+        result["identical_rollups"] = identical
+    return results
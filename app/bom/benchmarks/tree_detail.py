@@ -0,0 +1,47 @@
+from typing import List
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.utils import measure
+from bom.services import save_to_db
+
+QUERIES = (
+    ("tree", ""),
+    ("max_depth", "max_depth=2"),
+    ("children", "children=true&page_size=100"),
+)
+
+
+def response_size(client: Client, url: str) -> int:
+    """ Requests url and reads whole response, streamed or not, returns its size in bytes. """
+    response = client.get(url)
+    content = b"".join(response.streaming_content) if response.streaming else response.content
+    return len(content)
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Requests item details of a generated tree: whole tree (streamed when it has at least
+        BOM_STREAMING_MIN_NODES nodes), its first levels and a page of children of root. Every request is
+        made with empty response cache and then again, served from the cache unless it is streamed.
+    """
+    results = []
+    client = Client()
+
+    with transaction.atomic():
+        root, = save_to_db(generated_file(rows, seed=seed))
+        for name, query in QUERIES:
+            url = f"{reverse('bom:item_details', args=[root.pk])}?{query}"
+            cache.clear()
+            for state in ("cold", "cached"):
+                sizes = []
+                result = measure(f"{name}_{state}", lambda: sizes.append(response_size(client, url)))
+                result["rows"] = rows
+                result["kilobytes"] = round(sizes[0] / 1024, 1)
+                results.append(result)
+        transaction.set_rollback(True)
+
+    return results
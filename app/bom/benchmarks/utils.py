@@ -0,0 +1,52 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable
+
+from django.db import connection
+
+# peak memory is traced only on request, tracemalloc makes python code several times slower
+_trace_memory = False
+
+
+class QueryCounter:
+    """ Counts queries executed on default connection, without storing them like CaptureQueriesContext does. """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def tracing_memory():
+    """ Makes measure report peak memory allocated by measured functions. """
+    global _trace_memory
+    _trace_memory = True
+    try:
+        yield
+    finally:
+        _trace_memory = False
+
+
+def measure(name: str, func: Callable, *args, **kwargs) -> dict:
+    """ Runs func once and returns its wall time and number of executed queries,
+        and peak of memory allocated by it (in MB) when called in tracing_memory.
+    """
+    counter = QueryCounter()
+    if _trace_memory:
+        tracemalloc.start()
+    try:
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            func(*args, **kwargs)
+            seconds = time.perf_counter() - start
+        result = {"name": name, "seconds": round(seconds, 4), "queries": counter.count}
+        if _trace_memory:
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        return result
+    finally:
+        if _trace_memory:
+            tracemalloc.stop()
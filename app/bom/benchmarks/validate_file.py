@@ -0,0 +1,27 @@
+from typing import List
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+
+from bom.benchmarks.generator import generate_bom_csv
+from bom.benchmarks.utils import measure
+from bom.services import validate_file
+
+WARM_UP_ROWS = 1000
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Validates generated file in the calling thread and in worker processes (see BOM_VALIDATION_WORKERS).
+        Worker processes are started before measuring.
+    """
+    content = generate_bom_csv(rows, seed=seed)
+    results = []
+    for name, workers in (("serial", 0), ("parallel", settings.BOM_VALIDATION_WORKERS or 2)):
+        with override_settings(BOM_VALIDATION_WORKERS=workers, BOM_PARALLEL_VALIDATION_MIN_SIZE=0):
+            validate_file(SimpleUploadedFile("warm_up.csv", generate_bom_csv(WARM_UP_ROWS), content_type="text/csv"))
+            result = measure(name, validate_file, SimpleUploadedFile("generated.csv", content, content_type="text/csv"))
+        result["rows"] = rows
+        result["us_per_row"] = round(result["seconds"] * 1_000_000 / rows, 2)
+        results.append(result)
+    return results
@@ -0,0 +1,38 @@
+from collections import defaultdict
+from typing import List
+
+from django.db import transaction
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.reference import scan_where_used
+from bom.benchmarks.utils import measure
+from bom.models import Component
+from bom.services import save_to_db
+from bom.usage import where_used
+
+LOOKUPS = 100
+
+
+def _scan_lookup(component_id) -> dict:
+    quantities = defaultdict(int)
+    for _, used_component_id, root_id, quantity in scan_where_used():
+        if used_component_id == component_id:
+            quantities[root_id] += quantity
+    return quantities
+
+
+def run(rows: int, seed: int) -> List[dict]:
+    """ Compares where-used lookups served from the index with scans of every tree. """
+    results = []
+
+    with transaction.atomic():
+        save_to_db(generated_file(rows, seed=seed))
+        component_ids = list(Component.objects.order_by('pk').values_list('pk', flat=True)[:LOOKUPS])
+        for name, lookup, count in (("index", where_used, len(component_ids)), ("scan", _scan_lookup, 1)):
+            result = measure(name, lambda: [lookup(component_id) for component_id in component_ids[:count]])
+            result["rows"] = rows
+            result["ms_per_lookup"] = round(result["seconds"] * 1000 / count, 3)
+            results.append(result)
+        transaction.set_rollback(True)
+
+    return results
@@ -0,0 +1,299 @@
+import hashlib
+import math
+import operator
+from array import array
+from itertools import islice, repeat
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+
+from bom.components import ComponentResolver
+from bom.models import Assembly
+from bom.rollups import rebuild_rollups
+from bom.importers import file_rows
+from bom.ingest import get_ingest
+from bom.metrics import span
+from bom.services import InvalidFileError, _is_validated
+from bom.usage import rebuild_usage
+from bom.validation import ROW_LENGTH, checked_rows, row_errors, row_level
+from bom.versions import bump_tree_versions
+
+# rows of bigger batches survive long enough to be traversed by garbage collector, which makes parsing slower
+BATCH_SIZE = 1000
+LEVEL, IDENTIFIER, NAME, CATEGORY, UNIT, PROCUREMENT_TYPE, QUANTITY, PRICE = range(ROW_LENGTH)
+REQUIRED_COLUMNS = (LEVEL, IDENTIFIER, NAME, UNIT, PROCUREMENT_TYPE, QUANTITY)
+# taking columns one by one is several times faster than transposing rows with zip(*rows)
+COLUMN_GETTERS = [operator.itemgetter(idx) for idx in range(ROW_LENGTH)]
+
+
+class ColumnBatch(NamedTuple):
+    """ Rows of file parsed into typed columns. """
+    start: int
+    levels: array
+    identifiers: Tuple[str, ...]
+    names: Tuple[str, ...]
+    categories: Tuple[str, ...]
+    units: Tuple[str, ...]
+    procurement_types: Tuple[str, ...]
+    quantities: array
+    prices: array
+
+    def component_values(self) -> Iterator[tuple]:
+        return zip(self.identifiers, self.names, self.categories, self.units, self.procurement_types, self.prices)
+
+
+def _prices(column: Tuple[str, ...]) -> array:
+    if "" in column:
+        return array('d', (float(price) if price else 0 for price in column))
+    return array('d', map(float, column))
+
+
+def _typed_columns(rows: List[List[str]], start: int, previous_level: Optional[int],
+                   validated: bool) -> Optional[ColumnBatch]:
+    """ Converts rows to typed columns with checks done on whole columns. Returns None when any check fails,
+        rows then have to be validated one by one to find errors.
+    """
+    if not rows or set(map(len, rows)) != {ROW_LENGTH}:
+        return None
+    columns = [tuple(map(getter, rows)) for getter in COLUMN_GETTERS]
+    if not validated and any("" in columns[idx] for idx in REQUIRED_COLUMNS):
+        return None
+    try:
+        levels = array('l', map(int, columns[LEVEL]))
+        quantities = array('d', map(float, columns[QUANTITY]))
+        prices = _prices(columns[PRICE])
+    except ValueError:
+        return None
+    # sum isn't finite when any number is nan or inf (or when it overflows, then rows are only checked one by one)
+    if not math.isfinite(sum(quantities) + sum(prices)):
+        return None
+    # every level is at most one deeper than the previous one, level of the first row isn't checked
+    # when level of the previous row is not known. Checked for validated files too, they are compared with
+    # their token only at the end and the tree can't be built from levels which are not valid
+    previous = array('l', [levels[0] - 1 if previous_level is None else previous_level])
+    previous.extend(levels[:-1])
+    if min(levels) < 0 or any(map(operator.gt, levels, map(operator.add, previous, repeat(1)))):
+        return None
+    return ColumnBatch(start, levels, columns[IDENTIFIER], columns[NAME], columns[CATEGORY], columns[UNIT],
+                       columns[PROCUREMENT_TYPE], quantities, prices)
+
+
+def parse_columns(rows: List[List[str]], start: int = 0, previous_level: Optional[int] = -1,
+                  validated: bool = False) -> Tuple[Optional[ColumnBatch], dict]:
+    """ Parses batch of csv rows into typed columns, validating them column by column instead of row by row.
+        Batches which don't pass are validated again with checked_rows, so errors are the same as errors
+        of the row at a time path.
+
+        Parameters
+        -----------
+        rows: List[List[str]]
+            csv rows, without header
+        start: int
+            index of the first row in file
+        previous_level: int
+            level of the row preceding the first one, -1 when rows start the file, None when it is not known
+        validated: bool
+            rows come from already validated file and are only converted
+
+        Returns
+        ----------
+        ColumnBatch
+            parsed batch, None when there are errors
+        Dict
+            errors of invalid rows in validate_file format
+    """
+    batch = _typed_columns(rows, start, previous_level, validated)
+    if batch is not None:
+        return batch, {}
+    entities, errors = [], {}
+    for idx, entity, row_errors_ in checked_rows(rows, start, previous_level):
+        if row_errors_:
+            errors[f"row_{idx}"] = row_errors(idx, row_errors_)
+        entities.append(entity)
+    if errors:
+        return None, errors
+    return ColumnBatch(start, array('l', (entity.depth for entity in entities)),
+                       *(tuple(getattr(entity, name) for entity in entities)
+                         for name in ('identifier', 'name', 'category', 'unit', 'procurement_type')),
+                       array('d', (entity.quantity for entity in entities)),
+                       array('d', (entity.price for entity in entities))), {}
+
+
+class ColumnTreeBuilder:
+    """ Computes paths, depths and numchild of parsed batches like TreeBuilder does, but from the level column,
+        with only a stack of open ancestors kept as objects. Model instances are created just for writing them
+        (see bom.ingest).
+        Numchild of ancestors written with an earlier batch is fixed when they are closed.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        # [path, numchild, written numchild or None] of open ancestors of the next row, by level
+        self._open: List[list] = []
+        self._steps: List[str] = [""]
+        self._root_step: Optional[int] = None
+        self._numchild_updates = {}
+        self.root_paths: List[str] = []
+        self.created = 0
+        self._ingest = get_ingest(batch_size)
+
+    def _step(self, step: int) -> str:
+        while len(self._steps) <= step:
+            self._steps.append(Assembly._get_path(None, 1, len(self._steps)))
+        return self._steps[step]
+
+    def _next_root_step(self) -> int:
+        if self._root_step is None:
+            last_root = Assembly.get_last_root_node()
+            self._root_step = Assembly._str2int(last_root.path) if last_root else 0
+        self._root_step += 1
+        return self._root_step
+
+    def _close(self, node: list, numchild: array, offsets: dict):
+        path, children, written = node
+        if written is None:
+            numchild[offsets.pop(path)] = children
+        elif written != children:
+            self._numchild_updates[path] = children
+
+    def add(self, batch: ColumnBatch, component_ids: List[int]):
+        """ Writes batch of rows, batches have to be added in order of file.
+
+            Parameters
+            -----------
+            batch: ColumnBatch
+                parsed and validated rows
+            component_ids: List[int]
+                id of component of every row
+        """
+        size = len(batch.levels)
+        paths = [""] * size
+        numchild = array('l', [0]) * size
+        offsets = {}
+        stack = self._open
+        for offset, level in enumerate(batch.levels):
+            while len(stack) > level:
+                self._close(stack.pop(), numchild, offsets)
+            if level:
+                parent = stack[-1]
+                parent[1] += 1
+                path = parent[0] + self._step(parent[1])
+            else:
+                path = self._step(self._next_root_step())
+                self.root_paths.append(path)
+            stack.append([path, 0, None])
+            paths[offset] = path
+            offsets[path] = offset
+        for node in stack:
+            if node[2] is None:
+                numchild[offsets.pop(node[0])] = node[1]
+                node[2] = node[1]
+
+        # positional arguments in order of fields: id, path, depth, numchild, component, quantity
+        self._ingest.add_assemblies([
+            Assembly(None, path, level + 1, children, component_id, quantity)
+            for path, level, children, component_id, quantity
+            in zip(paths, batch.levels, numchild, component_ids, batch.quantities)
+        ])
+        self.created += size
+
+    def finish(self) -> int:
+        """ Closes remaining nodes and fixes numchild of nodes that were written before all their
+            children were known.
+
+            Returns
+            ----------
+            int
+                number of created nodes
+        """
+        self._ingest.finish()
+        while self._open:
+            self._close(self._open.pop(), array('l'), {})
+        for path, numchild in self._numchild_updates.items():
+            Assembly.objects.filter(path=path).update(numchild=numchild)
+        self._numchild_updates = {}
+        return self.created
+
+
+def _read_batch(rows: Iterator[List[str]], batch_size: int) -> List[List[str]]:
+    with span("decode"):
+        return list(islice(rows, batch_size))
+
+
+@transaction.atomic
+def save_columns_to_db(file: UploadedFile, token: Optional[str] = None,
+                       progress: Optional[Callable[[int], None]] = None,
+                       batch_size: int = BATCH_SIZE) -> List[Assembly]:
+    """ Columnar alternative of save_to_db. Batches of rows are parsed into typed columns and validated
+        column by column (see parse_columns), tree columns are computed from levels by ColumnTreeBuilder,
+        no object is created per row before nodes are written. Creates the same rows as save_to_db.
+
+        Parameters
+        -----------
+        file: UploadedFile
+            file uploaded by users
+        token: str
+            token returned by validate_file_with_token, rows of already validated file are only converted.
+            Token is checked against content of file when it is read to the end.
+        progress: Callable[[int], None]
+            called after every batch with number of rows processed so far
+        batch_size: int
+            number of rows parsed at once
+
+        Returns
+        ----------
+        List[Assembly]
+            root nodes of created trees, in order of file
+
+        Raises
+        ----------
+        InvalidFileError
+            when file is not valid or doesn't match token
+    """
+    hasher = hashlib.sha256() if token else None
+    validated = bool(token) and _is_validated(token)
+    with span("decode"):
+        decoded_file, validation_result = file_rows(file, hasher)
+    component_resolver = ComponentResolver()
+    tree_builder = ColumnTreeBuilder()
+    start, previous_level = 0, -1
+
+    if validation_result:
+        raise InvalidFileError(validation_result)
+
+    for rows in iter(lambda: _read_batch(decoded_file, batch_size), []):
+        with span("validate"):
+            batch, errors = parse_columns(rows, start, previous_level, validated)
+        validation_result.update(errors)
+        start += len(rows)
+        previous_level = batch.levels[-1] if batch is not None else row_level(rows[-1])
+        if validation_result:
+            continue
+        with span("resolve"):
+            component_resolver.resolve_values(batch.component_values())
+            component_ids = component_resolver.ids(batch.identifiers, batch.names)
+        with span("insert"):
+            tree_builder.add(batch, component_ids)
+        if progress:
+            progress(start)
+
+    if token and hasher.hexdigest() != token:
+        validation_result['token'] = "Validation token doesn't match uploaded file."
+    if validation_result:
+        raise InvalidFileError(validation_result)
+
+    with span("insert"):
+        tree_builder.finish()
+    with span("index"):
+        for path in tree_builder.root_paths:
+            rebuild_rollups(path, new=True)
+            rebuild_usage(path, new=True)
+    bump_tree_versions(tree_builder.root_paths)
+    if progress:
+        progress(tree_builder.created)
+    # range instead of path__in, files can have more roots than parameters of a query
+    root_paths = set(tree_builder.root_paths)
+    roots = Assembly.objects.filter(depth=1, path__gte=min(root_paths, default=""),
+                                    path__lte=max(root_paths, default="")).order_by('path')
+    return [root for root in roots if root.path in root_paths]
@@ -0,0 +1,88 @@
+from typing import Dict, Iterable, List, Tuple
+
+from bom.entities import CSVLineEntity
+from bom.ingest import get_ingest
+from bom.models import Component
+from bom.utils import chunks
+
+QUERY_CHUNK_SIZE = 500
+
+ComponentKey = Tuple[str, str]
+ComponentValues = Tuple[str, str, str, str, str, float]
+
+
+class ComponentResolver:
+    """ Resolves components of csv rows by (identifier, name), like get_or_create did for each row,
+        but with one query per chunk of unknown components and one bulk insert of missing ones (see bom.ingest).
+        Resolved components are kept in memory for the whole import, so repeated parts cost nothing.
+    """
+
+    def __init__(self, chunk_size: int = QUERY_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._components: Dict[ComponentKey, Component] = {}
+
+    def _fetch(self, keys: List[ComponentKey]):
+        wanted = set(keys)
+        existing = Component.objects.filter(identifier__in={identifier for identifier, _ in keys}).order_by('pk')
+        for component in existing:
+            key = (component.identifier, component.name)
+            if key in wanted:
+                self._components.setdefault(key, component)
+
+    def resolve(self, entities: Iterable[CSVLineEntity]):
+        """ Fetches or creates components of all given entities.
+            Components which are created get values from the first entity they appear in.
+
+            Parameters
+            -----------
+            entities: Iterable[CSVLineEntity]
+                validated csv lines
+        """
+        self.resolve_values((entity.identifier, entity.name, entity.category, entity.unit, entity.procurement_type,
+                             entity.price) for entity in entities)
+
+    def resolve_values(self, values: Iterable[ComponentValues]):
+        """ Like resolve, but takes values of components of rows, e.g. zipped columns of parsed file.
+
+            Parameters
+            -----------
+            values: Iterable[ComponentValues]
+                identifier, name, category, unit, procurement type and price of component of every row
+        """
+        missing: Dict[ComponentKey, ComponentValues] = {}
+        for row in values:
+            key = row[:2]
+            if key not in self._components and key not in missing:
+                missing[key] = row
+        if not missing:
+            return
+
+        for keys in chunks(list(missing), self.chunk_size):
+            self._fetch(keys)
+
+        to_create = [
+            Component(identifier=identifier,
+                      name=name,
+                      category=category,
+                      unit=unit,
+                      procurement_type=procurement_type,
+                      price=price)
+            for key, (identifier, name, category, unit, procurement_type, price) in missing.items()
+            if key not in self._components
+        ]
+        get_ingest(self.chunk_size).add_components(to_create)
+        if any(component.pk is None for component in to_create):
+            # database can't return ids from bulk insert
+            self._fetch([(component.identifier, component.name) for component in to_create])
+        else:
+            for component in to_create:
+                self._components[(component.identifier, component.name)] = component
+
+    def get(self, entity: CSVLineEntity) -> Component:
+        """ Returns component of already resolved entity. """
+        return self._components[(entity.identifier, entity.name)]
+
+    def ids(self, identifiers: Iterable[str], names: Iterable[str]) -> List[int]:
+        """ Returns ids of already resolved components with given identifiers and names. """
+        components = self._components
+        return [components[key].pk for key in zip(identifiers, names)]
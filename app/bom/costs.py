@@ -0,0 +1,102 @@
+from decimal import Decimal
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from bom.signatures import child_entry, entries_signature
+
+COST_QUANTUM = Decimal('0.00001')
+
+
+class NodeRollup(NamedTuple):
+    cost: Decimal
+    extended_cost: Decimal
+    descendants: int
+    max_depth: int
+    signature: Optional[str] = None
+
+
+class TreeRollup:
+    """ Rolls up costs and sizes of tree nodes in one pass over path ordered rows.
+        Quantity of a node is relative to its parent, so cost of a node is its quantity multiplied by its
+        own price and costs of its children. Extended cost is cost multiplied by quantities of ancestors
+        added before the node. Like in total_cost of dump_bulk, price of root items (depth 1) is not counted.
+        Signatures (see bom.signatures) are computed for nodes added with identity.
+        Nodes referencing shared sub-assemblies (see bom.shared) are added with rollups of children of the
+        sub-assembly, its nodes are not added.
+    """
+
+    def __init__(self, steplen: int, on_close: Optional[Callable[[Any, NodeRollup], None]] = None):
+        """ Parameters
+            -----------
+            steplen: int
+                steplen of tree model, used to find depth of path
+            on_close: Callable
+                called with key given to add and NodeRollup of a node when its subtree is complete
+        """
+        self.steplen = steplen
+        self.on_close = on_close
+        self.total = Decimal(0)
+        # [path, quantity, multiplier, own price, children cost, stored cost, descendants, max depth, key,
+        #  identity, entries of children in signature]
+        self._stack: List[list] = []
+
+    def _close(self):
+        (_, quantity, multiplier, price, children_cost, cost, descendants, max_depth, key,
+         identity, children_entries) = self._stack.pop()
+        if cost is None:
+            cost = quantity * (price + children_cost)
+        signature = entries_signature(*identity, children_entries) if identity else None
+        if self._stack:
+            parent = self._stack[-1]
+            parent[4] += cost
+            parent[6] += descendants + 1
+            parent[7] = max(parent[7], max_depth + 1)
+            if signature:
+                parent[10].append(child_entry(quantity, signature))
+        else:
+            self.total += cost
+        if self.on_close:
+            self.on_close(key, NodeRollup(cost=cost,
+                                          extended_cost=(multiplier * cost).quantize(COST_QUANTUM),
+                                          descendants=descendants,
+                                          max_depth=max_depth,
+                                          signature=signature))
+
+    def add(self, path: str, quantity: Decimal, price: Decimal, key: Any = None, cost: Optional[Decimal] = None,
+            identity: Optional[Tuple[str, str]] = None, children: Iterable[tuple] = ()):
+        """ Adds node, nodes have to be added in path order.
+
+            Parameters
+            -----------
+            path: str
+                path of node
+            quantity: Decimal
+                quantity of node, relative to its parent
+            price: Decimal
+                price of component of node
+            key: Any
+                passed to on_close
+            cost: Decimal
+                already known (stored) cost of node, then costs of its children are not summed
+            identity: Tuple[str, str]
+                identifier and name of component of node, needed for signature of node
+            children: Iterable[tuple]
+                quantity, cost, descendants, max depth and signature of children which are not added,
+                children of shared sub-assembly referenced by node
+        """
+        while self._stack and not path.startswith(self._stack[-1][0]):
+            self._close()
+        multiplier = self._stack[-1][1] * self._stack[-1][2] if self._stack else Decimal(1)
+        price = price if len(path) > self.steplen else Decimal(0)
+        node = [path, quantity, multiplier, price, Decimal(0), cost, 0, 0, key, identity, []]
+        for child_quantity, child_cost, descendants, max_depth, signature in children:
+            node[4] += child_cost
+            node[6] += descendants + 1
+            node[7] = max(node[7], max_depth + 1)
+            node[10].append(child_entry(child_quantity, signature))
+        self._stack.append(node)
+
+    def finish(self) -> Decimal:
+        """ Closes remaining nodes and returns summed cost of all added top nodes. """
+        while self._stack:
+            self._close()
+        return self.total.quantize(COST_QUANTUM)
@@ -0,0 +1,125 @@
+from itertools import zip_longest
+from typing import Dict, Iterator, List, NamedTuple
+
+from bom.models import Assembly
+
+CHUNK_SIZE = 2000
+KEY_SEPARATOR = "\x1f"
+
+
+class DiffNode(NamedTuple):
+    key: str
+    pk: int
+    identifier: str
+    name: str
+    quantity: object
+    price: object
+    path: str
+
+
+def child_key(parent_key: str, identifier: str, occurrences: Dict[str, int]) -> str:
+    """ Returns key of a child of node with parent_key. occurrences counts identifiers of already keyed
+        children of the node and is updated.
+    """
+    occurrence = occurrences.get(identifier, 0)
+    occurrences[identifier] = occurrence + 1
+    return f"{parent_key}{KEY_SEPARATOR}{identifier}#{occurrence}"
+
+
+def keyed_nodes(parent: Assembly, chunk_size: int) -> Iterator[DiffNode]:
+    """ Yields nodes of subtree in path order, keyed by identifiers of components on the path from
+        parent (without parent itself). Children with the same identifier are told apart by their order.
+        Nodes of shared sub-assemblies are yielded under every node referencing them, with their own ids.
+    """
+    # [path, key, {identifier: occurrences}] of ancestors of current row
+    stack = []
+    fields = ('pk', 'path', 'quantity', 'component__identifier', 'component__name', 'component__price', 'shared')
+    rows = Assembly.objects.filter(path__startswith=parent.path).values_list(*fields).iterator(chunk_size=chunk_size)
+    for pk, path, quantity, identifier, name, price, _ in Assembly.expand_shared(rows, fields):
+        while stack and not path.startswith(stack[-1][0]):
+            stack.pop()
+        key = ""
+        if stack:
+            _, parent_key, occurrences = stack[-1]
+            key = child_key(parent_key, identifier, occurrences)
+        stack.append((path, key, {}))
+        yield DiffNode(key, pk, identifier, name, quantity, price, path)
+
+
+def _identifiers(key: str) -> List[str]:
+    return [part.rsplit("#", 1)[0] for part in key.split(KEY_SEPARATOR)[1:]]
+
+
+def _node(node: DiffNode, **extra) -> dict:
+    return {'id': node.pk, 'identifier': node.identifier, 'name': node.name, 'identifiers': _identifiers(node.key),
+            **extra}
+
+
+def _top_nodes(pending: Dict[str, DiffNode]) -> List[dict]:
+    # pending nodes are in path order, so descendants of a node directly follow it
+    nodes, top = [], None
+    for key, node in pending.items():
+        if top is not None and key.startswith(top['key'] + KEY_SEPARATOR):
+            top['descendants'] += 1
+            continue
+        top = {'key': key, **_node(node, quantity=node.quantity, descendants=0)}
+        nodes.append(top)
+    for node in nodes:
+        del node['key']
+    return nodes
+
+
+def diff_trees(old: Assembly, new: Assembly, chunk_size: int = CHUNK_SIZE) -> dict:
+    """ Compares two revisions of a tree by walking both of them at once in path order.
+        Nodes are matched by identifiers of components on their path from the compared item, so only
+        nodes which weren't matched yet are kept in memory, few of them when the revisions are similar.
+        Runs in time linear in sizes of both trees.
+
+        Parameters
+        -----------
+        old: Assembly
+            top node of old revision
+        new: Assembly
+            top node of new revision
+        chunk_size: int
+            number of rows fetched from database at once
+
+        Returns
+        ----------
+        dict
+            added and removed subtrees (their top nodes with number of descendants), nodes with changed
+            quantity and nodes with changed price of component. Ids are ids of nodes of new revision,
+            except for removed nodes and old_id keys.
+    """
+    pending_old: Dict[str, DiffNode] = {}
+    pending_new: Dict[str, DiffNode] = {}
+    quantity_changed, price_changed = [], []
+
+    def compare(old_node: DiffNode, new_node: DiffNode):
+        if old_node.quantity != new_node.quantity:
+            quantity_changed.append(_node(new_node, old_id=old_node.pk, old_quantity=old_node.quantity,
+                                          new_quantity=new_node.quantity))
+        if old_node.price != new_node.price:
+            price_changed.append(_node(new_node, old_id=old_node.pk, old_price=old_node.price,
+                                       new_price=new_node.price))
+
+    for old_node, new_node in zip_longest(keyed_nodes(old, chunk_size), keyed_nodes(new, chunk_size)):
+        if old_node is not None:
+            matched = pending_new.pop(old_node.key, None)
+            if matched is None:
+                pending_old[old_node.key] = old_node
+            else:
+                compare(old_node, matched)
+        if new_node is not None:
+            matched = pending_old.pop(new_node.key, None)
+            if matched is None:
+                pending_new[new_node.key] = new_node
+            else:
+                compare(matched, new_node)
+
+    return {
+        'added': _top_nodes(pending_new),
+        'removed': _top_nodes(pending_old),
+        'quantity_changed': quantity_changed,
+        'price_changed': price_changed,
+    }
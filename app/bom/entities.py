@@ -4,6 +4,9 @@ from typing import Optional
 
 @dataclass
 class CSVLineEntity:
+    # rows are buffered in batches and kept by patch and deduplication, so they don't have per-instance __dict__
+    __slots__ = ("depth", "identifier", "name", "category", "unit", "procurement_type", "quantity", "price")
+
     depth: int
     identifier: str
     name: str
@@ -0,0 +1,67 @@
+from decimal import Decimal
+from typing import Dict, List, Union
+
+from bom.costs import COST_QUANTUM
+from bom.models import Assembly, Component
+
+CHUNK_SIZE = 2000
+QUERY_CHUNK_SIZE = 500
+PART_FIELD_NAMES = ('identifier', 'name', 'category', 'procurement_type', 'unit', 'price')
+
+
+def explode(parent: Assembly, units: Union[int, Decimal] = 1, chunk_size: int = CHUNK_SIZE) -> List[dict]:
+    """ Flattens subtree of parent into a buy list: total quantity of every leaf component needed for
+        given number of units of parent, with quantities multiplied down the path. Computed in one pass
+        over path ordered rows, only quantities of open ancestors and summed parts are kept in memory.
+        Shared sub-assemblies are exploded under every node referencing them.
+        Fields of parts are fetched afterwards, once per component instead of once per row.
+
+        Parameters
+        -----------
+        parent: Assembly
+            exploded item, its own quantity is not counted
+        units: Decimal
+            number of units of parent
+        chunk_size: int
+            number of rows fetched from database at once
+
+        Returns
+        ----------
+        List[dict]
+            groups of parts with the same procurement_type and unit, each with summed quantity and cost
+            and list of its parts, ordered by procurement_type, unit and identifier of parts
+    """
+    quantities: Dict[int, Decimal] = {}
+    # [path, quantity of one unit of parent] of ancestors of current row
+    stack = []
+    fields = ('path', 'quantity', 'numchild', 'component_id', 'shared')
+    rows = Assembly.objects.filter(path__startswith=parent.path).values_list(*fields).iterator(chunk_size=chunk_size)
+    for path, quantity, numchild, component_id, _ in Assembly.expand_shared(rows, fields):
+        while stack and not path.startswith(stack[-1][0]):
+            stack.pop()
+        multiplier = stack[-1][1] * quantity if stack else Decimal(units)
+        if numchild:
+            stack.append((path, multiplier))
+        else:
+            quantities[component_id] = quantities.get(component_id, 0) + multiplier
+
+    parts = []
+    component_ids = list(quantities)
+    for start in range(0, len(component_ids), QUERY_CHUNK_SIZE):
+        components = Component.objects.filter(pk__in=component_ids[start:start + QUERY_CHUNK_SIZE])
+        for pk, *fields in components.values_list('pk', *PART_FIELD_NAMES):
+            parts.append({**dict(zip(PART_FIELD_NAMES, fields)), 'quantity': quantities[pk]})
+
+    groups: Dict[tuple, dict] = {}
+    for part in sorted(parts, key=lambda part: (part['procurement_type'], part['unit'], part['identifier'])):
+        part['quantity'] = part['quantity'].quantize(COST_QUANTUM)
+        part['cost'] = (part['quantity'] * part['price']).quantize(COST_QUANTUM)
+        key = (part['procurement_type'], part['unit'])
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'procurement_type': key[0], 'unit': key[1], 'quantity': Decimal(0),
+                                   'cost': Decimal(0), 'parts': []}
+        group['quantity'] += part['quantity']
+        group['cost'] += part['cost']
+        group['parts'].append(part)
+    return list(groups.values())
@@ -0,0 +1,342 @@
+import codecs
+import csv
+import importlib
+import json
+import os
+import zipfile
+from functools import lru_cache
+from itertools import chain, repeat
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.module_loading import import_string
+
+from bom.validation import ROW_LENGTH
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_SIZE = 8 * 1024
+# names of columns of formats which have named columns (json lines, parquet, arrow), in order of csv columns
+COLUMNS = ("level", "item_number", "item_name", "item_category", "unit_of_measure", "procurement_type",
+           "quantity", "Price by Unit")
+REQUIRED_COLUMNS = ("level", "item_number", "item_name", "unit_of_measure", "procurement_type", "quantity")
+
+FileRows = Tuple[Iterator[List[str]], dict]
+
+
+def _iter_decoded_lines(file: UploadedFile, chunk_size: int = CHUNK_SIZE, hasher=None) -> Iterator[str]:
+    """ Decodes file chunk by chunk with incremental utf-8 decoder and yields its lines,
+        so that whole file is never held in memory.
+        Chunks are read directly, because InMemoryUploadedFile.chunks() returns whole file at once.
+        If hasher (e.g. hashlib.sha256()) is given, it is updated with every raw chunk.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        if hasher is not None:
+            hasher.update(chunk)
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _decoded_lines(file: UploadedFile, hasher=None, delimiter: str = ",") -> Tuple[Iterator[str], dict]:
+    """ Decodes file uploaded by user like _decode_file, but returns its lines without header
+        instead of csv rows.
+    """
+    lines = _iter_decoded_lines(file, CHUNK_SIZE, hasher)
+    head, head_size = [], 0
+    for line in lines:
+        head.append(line)
+        head_size += len(line)
+        if head_size >= SNIFF_SIZE:
+            break
+    has_header = csv.Sniffer().has_header("".join(head))
+    lines = chain(head, lines)
+
+    errors = {}
+    if has_header:
+        next(csv.reader(lines, delimiter=delimiter), None)  # skip first row (header), reader takes only its lines
+    else:
+        errors['file_structure'] = "File doesn't have header."
+    return lines, errors
+
+
+def _decode_file(file: UploadedFile, hasher=None, delimiter: str = ",") -> FileRows:
+    """ Decodes file uploaded by user.
+        File is read lazily, only first SNIFF_SIZE characters are used to detect header.
+
+        Parameters
+        -----------
+        file: UploadedFile
+            file uploaded by users
+        hasher
+            optional hashlib object, updated with content of file as it is read
+        delimiter: str
+            delimiter of values in rows
+
+        Returns
+        ----------
+        Iterator[List[str]]
+            csv rows, without header
+        Dict
+            file structure errors
+    """
+    lines, errors = _decoded_lines(file, hasher, delimiter)
+    return csv.reader(lines, delimiter=delimiter), errors
+
+
+def _hash_file(file: UploadedFile, hasher):
+    # binary formats are read by their libraries, so raw content is hashed before
+    if hasher is not None:
+        file.seek(0)
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    file.seek(0)
+
+
+def _cell(value) -> str:
+    """ Converts typed value of binary formats to text like in csv files. """
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _named_row(values: dict) -> List[str]:
+    return [_cell(values.get(name)) for name in COLUMNS]
+
+
+def _missing_columns(names) -> dict:
+    missing = [name for name in REQUIRED_COLUMNS if name not in names]
+    if missing:
+        return {'file_structure': f"File doesn't have columns: {', '.join(missing)}."}
+    return {}
+
+
+def _table_rows(table, names: List[str]) -> Iterator[List[str]]:
+    """ Yields rows of pyarrow table (or record batch) converted to text in order of COLUMNS. """
+    columns = [table.column(name).to_pylist() if name in names else repeat(None) for name in COLUMNS]
+    for values in zip(*columns):
+        yield list(map(_cell, values))
+
+
+class Importer:
+    """ Reads uploaded files of one format as rows of text values in order of csv columns (see COLUMNS),
+        so that every format is validated and saved the same way. Rows are read lazily, files are never
+        held in memory as a whole.
+        Formats which need a package that isn't installed are rejected with file_format error.
+    """
+    name = ""
+    content_types: Tuple[str, ...] = ()
+    extensions: Tuple[str, ...] = ()
+    # module needed to read the format
+    requires: Optional[str] = None
+
+    def module(self):
+        return importlib.import_module(self.requires)
+
+    def is_available(self) -> bool:
+        if self.requires is None:
+            return True
+        try:
+            self.module()
+        except ImportError:
+            return False
+        return True
+
+    def read(self, file: UploadedFile, hasher=None) -> FileRows:
+        raise NotImplementedError
+
+    def rows(self, file: UploadedFile, hasher=None) -> FileRows:
+        """ Reads file uploaded by user.
+
+            Parameters
+            -----------
+            file: UploadedFile
+                file uploaded by users
+            hasher
+                optional hashlib object, updated with content of file as it is read
+
+            Returns
+            ----------
+            Iterator[List[str]]
+                rows, without header
+            Dict
+                file structure errors
+        """
+        if not self.is_available():
+            return iter(()), {'file_format': f"Reading {self.name} files requires {self.requires.split('.')[0]} package."}
+        return self.read(file, hasher)
+
+
+class CSVImporter(Importer):
+    name = "csv"
+    content_types = ("text/csv", "application/csv")
+    extensions = (".csv",)
+    delimiter = ","
+
+    def lines(self, file: UploadedFile, hasher=None) -> Tuple[Iterator[str], dict]:
+        """ Returns decoded lines of file without header, used by parallel validation. """
+        return _decoded_lines(file, hasher, self.delimiter)
+
+    def read(self, file: UploadedFile, hasher=None) -> FileRows:
+        return _decode_file(file, hasher, self.delimiter)
+
+
+class TSVImporter(CSVImporter):
+    name = "tsv"
+    content_types = ("text/tab-separated-values",)
+    extensions = (".tsv", ".tab")
+    delimiter = "\t"
+
+
+class JSONLinesImporter(Importer):
+    """ Every line is an object with values of COLUMNS, or an array of them in their order. """
+    name = "json lines"
+    content_types = ("application/jsonl", "application/x-ndjson", "application/jsonlines")
+    extensions = (".jsonl", ".ndjson")
+
+    @staticmethod
+    def _row(line: str) -> List[str]:
+        try:
+            values = json.loads(line)
+        except ValueError:
+            return []
+        if isinstance(values, dict):
+            return _named_row(values)
+        if isinstance(values, list):
+            return list(map(_cell, values))
+        return []
+
+    def read(self, file: UploadedFile, hasher=None) -> FileRows:
+        lines = _iter_decoded_lines(file, CHUNK_SIZE, hasher)
+        return (self._row(line) for line in lines if line.strip()), {}
+
+
+class XLSXImporter(Importer):
+    """ Reads first sheet in read-only mode of openpyxl, which parses sheet while its rows are iterated. """
+    name = "xlsx"
+    content_types = ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",)
+    extensions = (".xlsx",)
+    requires = "openpyxl"
+
+    @staticmethod
+    def _rows(workbook, rows) -> Iterator[List[str]]:
+        try:
+            for values in rows:
+                values = list(values)
+                # empty cells at the end of row are not told apart from missing ones, cells formatted beyond
+                # table are read as empty too
+                while len(values) > ROW_LENGTH and values[-1] is None:
+                    values.pop()
+                if any(value is not None for value in values):
+                    yield list(map(_cell, values)) + [""] * (ROW_LENGTH - len(values))
+        finally:
+            workbook.close()
+
+    def read(self, file: UploadedFile, hasher=None) -> FileRows:
+        openpyxl = self.module()
+        _hash_file(file, hasher)
+        try:
+            workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, KeyError, openpyxl.utils.exceptions.InvalidFileException):
+            return iter(()), {'file_structure': "File is not a valid xlsx file."}
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header or _cell(header[0]) != COLUMNS[0]:
+            workbook.close()
+            return iter(()), {'file_structure': "File doesn't have header."}
+        return self._rows(workbook, rows), {}
+
+
+class ParquetImporter(Importer):
+    """ Reads parquet file one row group at a time, columns are matched by names. """
+    name = "parquet"
+    content_types = ("application/vnd.apache.parquet", "application/x-parquet")
+    extensions = (".parquet",)
+    requires = "pyarrow.parquet"
+
+    def read(self, file: UploadedFile, hasher=None) -> FileRows:
+        pyarrow_parquet = self.module()
+        _hash_file(file, hasher)
+        try:
+            parquet_file = pyarrow_parquet.ParquetFile(file)
+        except (OSError, ValueError):  # pyarrow.ArrowInvalid is a ValueError
+            return iter(()), {'file_structure': "File is not a valid parquet file."}
+        names = [name for name in parquet_file.schema_arrow.names if name in COLUMNS]
+        errors = _missing_columns(names)
+        if errors:
+            return iter(()), errors
+        return chain.from_iterable(_table_rows(parquet_file.read_row_group(idx, columns=names), names)
+                                   for idx in range(parquet_file.num_row_groups)), {}
+
+
+class ArrowImporter(Importer):
+    """ Reads Arrow IPC (feather v2) file one record batch at a time, columns are matched by names. """
+    name = "arrow"
+    content_types = ("application/vnd.apache.arrow.file",)
+    extensions = (".arrow", ".feather")
+    requires = "pyarrow.ipc"
+
+    def read(self, file: UploadedFile, hasher=None) -> FileRows:
+        pyarrow_ipc = self.module()
+        _hash_file(file, hasher)
+        try:
+            reader = pyarrow_ipc.open_file(file)
+        except (OSError, ValueError):
+            return iter(()), {'file_structure': "File is not a valid arrow file."}
+        names = [name for name in reader.schema.names if name in COLUMNS]
+        errors = _missing_columns(names)
+        if errors:
+            return iter(()), errors
+        return chain.from_iterable(_table_rows(reader.get_batch(idx), names)
+                                   for idx in range(reader.num_record_batches)), {}
+
+
+@lru_cache(maxsize=None)
+def _importers(paths: Tuple[str, ...]) -> List[Importer]:
+    return [import_string(path)() for path in paths]
+
+
+def get_importers() -> List[Importer]:
+    """ Returns instances of importers configured in settings.BOM_IMPORTERS. """
+    return _importers(tuple(settings.BOM_IMPORTERS))
+
+
+def get_importer(file: UploadedFile) -> Optional[Importer]:
+    """ Finds importer of file by its content type, then by extension of its name (content types sent
+        by browsers are not reliable, stored files of import jobs have content type saved with the job).
+        Returns None when format of file is not known.
+    """
+    importers = get_importers()
+    content_type = getattr(file, "content_type", None)
+    for importer in importers:
+        if content_type in importer.content_types:
+            return importer
+    extension = os.path.splitext(file.name or "")[1].lower()
+    for importer in importers:
+        if extension in importer.extensions:
+            return importer
+    return None
+
+
+def unknown_format_error() -> str:
+    names = ", ".join(importer.name for importer in get_importers())
+    return f"Format of file is not known, upload it with content type or extension of one of: {names}."
+
+
+def file_rows(file: UploadedFile, hasher=None) -> FileRows:
+    """ Reads file with its importer, see Importer.rows. Files of unknown formats are rejected
+        with file_format error.
+    """
+    importer = get_importer(file)
+    if importer is None:
+        return iter(()), {'file_format': unknown_format_error()}
+    return importer.rows(file, hasher)
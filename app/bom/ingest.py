@@ -0,0 +1,134 @@
+import io
+from functools import lru_cache
+from typing import Iterable, List, Sequence, Type
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Field, Model
+from django.utils.module_loading import import_string
+
+from bom.models import COMPONENT_FIELD_NAMES, Assembly, Component
+
+ASSEMBLY_FIELD_NAMES = ('path', 'depth', 'numchild', 'component', 'quantity', 'shared', 'is_shared')
+STAGING_TABLE = "{table}_staging"
+
+
+def _fields(model: Type[Model], names: Sequence[str]) -> List[Field]:
+    return [model._meta.get_field(name) for name in names]
+
+
+def _copy_value(value) -> str:
+    """ Formats value for text format of COPY. """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class BulkCreateIngest:
+    """ Writes new rows of imports with bulk_create, works with every database. """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+
+    @classmethod
+    def supports(cls, db_connection) -> bool:
+        return True
+
+    def add_assemblies(self, nodes: List[Assembly]):
+        """ Writes new nodes, they are visible in bom_assembly after finish. """
+        Assembly.objects.bulk_create(nodes, batch_size=self.batch_size)
+
+    def add_components(self, components: List[Component]):
+        """ Writes new components immediately, their ids are set if database returns them. """
+        Component.objects.bulk_create(components, batch_size=self.batch_size)
+
+    def finish(self):
+        """ Moves written nodes to bom_assembly, if they were not written directly. """
+
+
+class CopyIngest(BulkCreateIngest):
+    """ Streams rows into temporary staging tables with COPY FROM STDIN of psycopg2, which doesn't build
+        INSERT statements, and moves them to model tables with a single INSERT ... SELECT.
+        Nodes are staged until finish, components are moved at once, because nodes reference their ids.
+        Staging tables are created with the columns of model tables and are dropped at the end of transaction
+        at the latest. PostgreSQL only, used inside transactions.
+    """
+
+    @classmethod
+    def supports(cls, db_connection) -> bool:
+        # staging tables live until the end of transaction
+        return db_connection.vendor == "postgresql" and db_connection.in_atomic_block
+
+    def __init__(self, batch_size: int):
+        super().__init__(batch_size)
+        self._staged = False
+
+    @staticmethod
+    def _tables(model: Type[Model]):
+        table = model._meta.db_table
+        return connection.ops.quote_name(table), connection.ops.quote_name(STAGING_TABLE.format(table=table))
+
+    @staticmethod
+    def _stage(cursor, model: Type[Model], fields: List[Field], objs: Iterable[Model]):
+        table, staging = CopyIngest._tables(model)
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+        cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS "
+                       f"SELECT {columns} FROM {table} WITH NO DATA")
+        # values are prepared like bulk_create prepares them, e.g. decimals are rounded to places of their fields
+        content = io.StringIO("".join(
+            "\t".join(_copy_value(field.get_db_prep_save(getattr(obj, field.attname), connection))
+                      for field in fields) + "\n"
+            for obj in objs
+        ))
+        cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN", content)
+        return table, staging, columns
+
+    def add_assemblies(self, nodes: List[Assembly]):
+        if not nodes:
+            return
+        with connection.cursor() as cursor:
+            self._stage(cursor, Assembly, _fields(Assembly, ASSEMBLY_FIELD_NAMES), nodes)
+        self._staged = True
+
+    def add_components(self, components: List[Component]):
+        if not components:
+            return
+        with connection.cursor() as cursor:
+            table, staging, columns = self._stage(cursor, Component, _fields(Component, COMPONENT_FIELD_NAMES),
+                                                  components)
+            returned = ", ".join(map(connection.ops.quote_name, ("id", "identifier", "name")))
+            cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} RETURNING {returned}")
+            ids = {(identifier, name): pk for pk, identifier, name in cursor.fetchall()}
+            cursor.execute(f"DROP TABLE {staging}")
+        for component in components:
+            component.pk = ids[(component.identifier, component.name)]
+            component._state.adding = False
+            component._state.db = connection.alias
+
+    def finish(self):
+        if not self._staged:
+            return
+        table, staging = self._tables(Assembly)
+        columns = ", ".join(connection.ops.quote_name(field.column)
+                            for field in _fields(Assembly, ASSEMBLY_FIELD_NAMES))
+        with connection.cursor() as cursor:
+            # ids are given in path order, like bulk_create gives them in order of file
+            cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} "
+                           f"ORDER BY {connection.ops.quote_name('path')}")
+            cursor.execute(f"DROP TABLE {staging}")
+        self._staged = False
+
+
+@lru_cache(maxsize=None)
+def _ingest_class(path: str) -> Type[BulkCreateIngest]:
+    return import_string(path)
+
+
+def get_ingest(batch_size: int) -> BulkCreateIngest:
+    """ Returns new ingest of class configured in settings.BOM_INGEST_BACKEND, or BulkCreateIngest
+        when it doesn't support the database (e.g. CopyIngest with SQLite).
+    """
+    ingest_class = _ingest_class(settings.BOM_INGEST_BACKEND)
+    if not ingest_class.supports(connection):
+        ingest_class = BulkCreateIngest
+    return ingest_class(batch_size)
@@ -0,0 +1,177 @@
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from bom.columnar import save_columns_to_db
+from bom.importers import get_importer
+from bom.metrics import IMPORT_JOBS, IMPORT_ROWS, import_spans
+from bom.models import Assembly, ImportJob
+from bom.patch import patch_tree
+from bom.services import InvalidFileError, save_to_db
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_KEY = "bom:job:{job_id}:progress"
+
+
+def _set_progress(job_id, rows: int):
+    cache.set(PROGRESS_KEY.format(job_id=job_id), rows, timeout=settings.BOM_IMPORT_PROGRESS_TIMEOUT)
+
+
+def job_progress(job: ImportJob) -> int:
+    """ Returns number of rows processed by job.
+        Import runs in a single transaction, so progress of running job is reported through cache.
+    """
+    if job.status == ImportJob.RUNNING:
+        return cache.get(PROGRESS_KEY.format(job_id=job.pk), job.rows_processed)
+    return job.rows_processed
+
+
+def run_import_job(job_id):
+    """ Imports file of the job with save_to_db, or applies it to target tree with patch_tree,
+        and stores the result in the job. Time of import phases is recorded in bom.metrics.
+    """
+    job = ImportJob.objects.get(pk=job_id)
+    ImportJob.objects.filter(pk=job_id).update(status=ImportJob.RUNNING, started_at=timezone.now())
+    rows_processed = 0
+    changes = {}
+
+    def progress(rows: int):
+        nonlocal rows_processed
+        rows_processed = rows
+        _set_progress(job_id, rows)
+
+    if job.target_id:
+        kind = "patch"
+    elif settings.BOM_COLUMNAR_IMPORT and not job.deduplicate:
+        kind = "columnar"
+    else:
+        kind = "rows"
+
+    try:
+        with job.file.open("rb") as stored_file, import_spans(kind):
+            # stored files don't keep content type of upload, format isn't known from name of files without extension
+            file = UploadedFile(stored_file, name=stored_file.name, content_type=job.content_type)
+            if kind == "patch":
+                changes = patch_tree(file, job.target, token=job.token or None, progress=progress)
+                roots = [job.target]
+            elif kind == "columnar":
+                roots = save_columns_to_db(file, token=job.token or None, progress=progress)
+            else:
+                roots = save_to_db(file, token=job.token or None, progress=progress, deduplicate=job.deduplicate)
+    except InvalidFileError as e:
+        status, errors, root = ImportJob.FAILED, e.errors, None
+    except Exception as e:
+        logger.exception("Import job %s failed", job_id)
+        status, errors, root = ImportJob.FAILED, {"detail": str(e)}, None
+    else:
+        status, errors, root = ImportJob.FINISHED, {}, roots[0] if roots else None
+    IMPORT_JOBS.inc((kind, status))
+    IMPORT_ROWS.inc((kind,), rows_processed)
+
+    job.file.delete(save=False)
+    ImportJob.objects.filter(pk=job_id).update(
+        file="",
+        status=status,
+        errors=errors,
+        changes=changes,
+        root=root,
+        rows_processed=rows_processed,
+        finished_at=timezone.now(),
+    )
+    cache.delete(PROGRESS_KEY.format(job_id=job_id))
+
+
+def _run_in_worker(job_id):
+    try:
+        run_import_job(job_id)
+    finally:
+        connections.close_all()
+
+
+class SyncBackend:
+    """ Runs jobs immediately in the calling thread, useful for tests and debugging. """
+
+    def submit(self, job_id):
+        run_import_job(job_id)
+
+
+class _ExecutorBackend:
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.BOM_IMPORT_WORKERS
+        self._executor: Optional[Executor] = None
+
+    def _create_executor(self) -> Executor:
+        raise NotImplementedError
+
+    def submit(self, job_id):
+        if self._executor is None:
+            self._executor = self._create_executor()
+        # job row has to be committed before worker reads it
+        transaction.on_commit(lambda: self._executor.submit(_run_in_worker, job_id))
+
+
+class ThreadPoolBackend(_ExecutorBackend):
+    """ Runs jobs in a pool of threads of the web server process, doesn't need any broker. """
+
+    def _create_executor(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bom-import")
+
+
+class ProcessPoolBackend(_ExecutorBackend):
+    """ Runs jobs in a pool of separate processes, so that imports don't compete for GIL with requests. """
+
+    def _create_executor(self) -> Executor:
+        return ProcessPoolExecutor(max_workers=self.max_workers,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=django.setup)
+
+
+@lru_cache(maxsize=None)
+def _backend(path: str):
+    return import_string(path)()
+
+
+def get_backend():
+    """ Returns instance of backend configured in settings.BOM_IMPORT_BACKEND. """
+    return _backend(settings.BOM_IMPORT_BACKEND)
+
+
+def submit_import(file: UploadedFile, token: Optional[str] = None, deduplicate: bool = False,
+                  target: Optional[Assembly] = None) -> ImportJob:
+    """ Stores uploaded file and schedules its import with configured backend.
+
+        Parameters
+        -----------
+        file: UploadedFile
+            file uploaded by users
+        token: str
+            optional validation token, see save_to_db
+        deduplicate: bool
+            reuse stored trees identical to trees from file, see save_to_db
+        target: Assembly
+            root of stored tree to patch with the file, see patch_tree
+
+        Returns
+        ----------
+        ImportJob
+            created job
+    """
+    importer = get_importer(file)
+    job = ImportJob(token=token or "", deduplicate=deduplicate, target=target,
+                    content_type=importer.content_types[0] if importer else "")
+    job.file.save(file.name, file, save=False)
+    job.save()
+    get_backend().submit(job.pk)
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,72 @@
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from bom.benchmarks import concurrent_requests, diff_tree, dump_tree, explode_tree, import_tree, list_items, \
+    parse_file, read_formats, record_metrics, roll_up_costs, tree_detail, validate_file, where_used
+from bom.benchmarks.baseline import compare, load_baseline, save_baseline
+from bom.benchmarks.utils import tracing_memory
+
+SCENARIOS = {
+    "import": import_tree.run,
+    "concurrency": concurrent_requests.run,
+    "cost": roll_up_costs.run,
+    "detail": tree_detail.run,
+    "diff": diff_tree.run,
+    "dump": dump_tree.run,
+    "explode": explode_tree.run,
+    "formats": read_formats.run,
+    "list": list_items.run,
+    "metrics": record_metrics.run,
+    "parse": parse_file.run,
+    "validate": validate_file.run,
+    "where_used": where_used.run,
+}
+
+
+class Command(BaseCommand):
+    help = "Runs benchmark scenario (or all of them) on a temporary test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=sorted(SCENARIOS) + ["all"])
+        parser.add_argument("--rows", type=int, default=100_000, help="Number of rows of generated BOM.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of BOM generator.")
+        parser.add_argument("--memory", action="store_true",
+                            help="Report peak memory traced with tracemalloc, which slows measured code down.")
+        parser.add_argument("--save-baseline", metavar="PATH", help="Save results as JSON baseline.")
+        parser.add_argument("--baseline", metavar="PATH",
+                            help="Compare results with JSON baseline saved with the same rows and seed.")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed relative growth of time and memory compared with baseline.")
+
+    def handle(self, *args, **options):
+        baseline = load_baseline(options["baseline"]) if options["baseline"] else None
+        if baseline and (baseline["rows"], baseline["seed"]) != (options["rows"], options["seed"]):
+            raise CommandError(f"Baseline was saved with --rows {baseline['rows']} --seed {baseline['seed']}.")
+        scenarios = sorted(SCENARIOS) if options["scenario"] == "all" else [options["scenario"]]
+
+        results = {}
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # debug mode logs every query and enables debug toolbar for requests of test client
+            with override_settings(DEBUG=False), tracing_memory() if options["memory"] else nullcontext():
+                for scenario in scenarios:
+                    results[scenario] = SCENARIOS[scenario](rows=options["rows"], seed=options["seed"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for scenario, scenario_results in results.items():
+            for result in scenario_results:
+                self.stdout.write(", ".join(f"{key}={value}" for key, value in {"scenario": scenario, **result}.items()))
+
+        if options["save_baseline"]:
+            save_baseline(options["save_baseline"], results, options["rows"], options["seed"])
+        if baseline:
+            regressions = compare(results, baseline, options["tolerance"])
+            for regression in regressions:
+                self.stderr.write(f"regression: {regression}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions compared with baseline.")
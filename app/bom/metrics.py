@@ -0,0 +1,220 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import chain, islice
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# seconds, like default buckets of prometheus client
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+QUERY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# items of iterators timed by timed() at once, see its docs. Batches are kept smaller than threshold of
+# garbage collector (700 allocations), otherwise buffered items are traversed by collections
+TIMED_BATCH_SIZE = 100
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: list = _registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}",
+                          *self.samples()])
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: list = _registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    """ Counts observations in buckets, exposed cumulatively like prometheus histograms. """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS, registry: list = _registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+        # labels: [counts of buckets (and of +Inf), sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            values[0][bisect_left(self.buckets, value)] += 1
+            values[1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        values = self._values.get(labels)
+        return sum(values[0]) if values else 0
+
+    def sum(self, labels: tuple = ()) -> float:
+        values = self._values.get(labels)
+        return values[1] if values else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+def render() -> str:
+    """ Returns all metrics of this process in prometheus text format. """
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+REQUEST_SECONDS = Histogram("ravacan_http_request_duration_seconds", "Time of handling requests, by view.",
+                            ("view", "method", "status"))
+REQUEST_QUERIES = Histogram("ravacan_http_request_db_queries", "Number of database queries of requests, by view.",
+                            ("view",), QUERY_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("ravacan_http_request_db_duration_seconds",
+                               "Time spent in database queries of requests, by view.", ("view",))
+IMPORT_PHASE_SECONDS = Histogram("ravacan_import_phase_duration_seconds",
+                                 "Time spent in phases of file imports, by kind of import.", ("kind", "phase"))
+IMPORT_ROWS = Counter("ravacan_import_rows_total", "Rows of imported files, by kind of import.", ("kind",))
+IMPORT_JOBS = Counter("ravacan_import_jobs_total", "Finished import jobs, by kind and status.", ("kind", "status"))
+
+
+class QueryTimer:
+    """ Database execute wrapper counting queries and time spent in them. """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - start
+            self.count += 1
+
+
+class ImportSpans:
+    """ Sums exclusive time of phases of one import: time of a phase which runs inside another one
+        (e.g. decoding of rows pulled by validation) is not counted in the outer one.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        # time of phases measured inside the one measured now
+        self.nested = 0.0
+
+    def measure(self, phase: str, elapsed: float, nested: float):
+        self.seconds[phase] = self.seconds.get(phase, 0) + elapsed - self.nested
+        self.nested = nested + elapsed
+
+
+_state = threading.local()
+
+
+def _spans() -> Optional[ImportSpans]:
+    return getattr(_state, 'spans', None)
+
+
+@contextmanager
+def import_spans(kind: str):
+    """ Collects time of phases (see span and timed) of import running inside, observed into
+        IMPORT_PHASE_SECONDS with the kind of import when it finishes.
+    """
+    spans = _state.spans = ImportSpans()
+    try:
+        yield spans
+    finally:
+        _state.spans = None
+        for phase, seconds in spans.seconds.items():
+            IMPORT_PHASE_SECONDS.observe(seconds, (kind, phase))
+
+
+@contextmanager
+def span(phase: str):
+    """ Counts time spent inside to the phase of current import, does nothing outside import_spans. """
+    spans = _spans()
+    if spans is None:
+        yield
+        return
+    nested, spans.nested = spans.nested, 0.0
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        spans.measure(phase, perf_counter() - start, nested)
+
+
+def timed(phase: str, items: Iterable, batch_size: int = TIMED_BATCH_SIZE) -> Iterator:
+    """ Counts time spent in getting items to the phase of current import, items are returned as they are
+        outside import_spans.
+        Items are taken in batches, so that time is measured once per batch instead of for every item,
+        which would cost more than getting items from the fastest iterators (e.g. csv reader).
+    """
+    if _spans() is None:
+        return iter(items)
+    return chain.from_iterable(_timed_batches(phase, iter(items), batch_size))
+
+
+def _timed_batches(phase: str, items: Iterator, batch_size: int) -> Iterator[list]:
+    while True:
+        with span(phase):
+            batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def request_labels(request, response) -> Tuple[str, str, str]:
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else "unresolved"
+    return view, request.method, f"{response.status_code // 100}xx"
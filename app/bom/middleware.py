@@ -0,0 +1,56 @@
+import asyncio
+from time import perf_counter
+
+from django.db import connection
+from django.utils.deprecation import MiddlewareMixin
+
+from bom.metrics import QueryTimer, REQUEST_DB_SECONDS, REQUEST_QUERIES, REQUEST_SECONDS, request_labels
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """ Records time of requests, number of their database queries and time spent in them, labelled by name
+        of the view (see bom.metrics). Streamed responses are recorded when their content was sent,
+        their queries run while it is iterated.
+        Should be the first middleware, so that time of the others is counted too. Works in both sync
+        and async mode (like middleware of django based on MiddlewareMixin), so that it doesn't move ASGI
+        requests to threads.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        return self._recorded(request, response, timer, start)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = perf_counter()
+        # connections of the request were opened in its thread by request_started signal, views and streamed
+        # content use them there, so the wrapper counts their queries
+        with connection.execute_wrapper(timer):
+            response = await self.get_response(request)
+        return self._recorded(request, response, timer, start)
+
+    def _recorded(self, request, response, timer: QueryTimer, start: float):
+        if response.streaming:
+            response.streaming_content = self._streamed(response.streaming_content, request, response, timer, start)
+        else:
+            self._observe(request, response, timer, start)
+        return response
+
+    def _streamed(self, content, request, response, timer: QueryTimer, start: float):
+        try:
+            with connection.execute_wrapper(timer):
+                yield from content
+        finally:
+            self._observe(request, response, timer, start)
+
+    @staticmethod
+    def _observe(request, response, timer: QueryTimer, start: float):
+        labels = request_labels(request, response)
+        REQUEST_SECONDS.observe(perf_counter() - start, labels)
+        REQUEST_QUERIES.observe(timer.count, labels[:1])
+        REQUEST_DB_SECONDS.observe(timer.seconds, labels[:1])
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='component',
+            index=models.Index(fields=['identifier', 'name'], name='bom_compone_identif_d1c8bd_idx'),
+        ),
+    ]
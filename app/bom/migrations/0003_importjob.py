@@ -0,0 +1,30 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0002_component_identifier_name_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(blank=True, upload_to='imports/', verbose_name='File')),
+                ('token', models.CharField(blank=True, max_length=64, verbose_name='Validation token')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')], default='pending', max_length=16, verbose_name='Status')),
+                ('rows_processed', models.PositiveIntegerField(default=0, verbose_name='Rows processed')),
+                ('errors', models.JSONField(blank=True, default=dict, verbose_name='Errors')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('root', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bom.assembly')),
+            ],
+        ),
+    ]
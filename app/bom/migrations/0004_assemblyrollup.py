@@ -0,0 +1,54 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def roll_up_existing_trees(apps, schema_editor):
+    Assembly = apps.get_model('bom', 'Assembly')
+    AssemblyRollup = apps.get_model('bom', 'AssemblyRollup')
+    rollups, stack = [], []
+
+    def close():
+        # open node: path, pk, quantity, own price, cost of children, descendants, max depth
+        path, pk, quantity, price, children_cost, descendants, max_depth = stack.pop()
+        cost = quantity * (price + children_cost)
+        rollups.append(AssemblyRollup(assembly_id=pk, cost=cost, descendants=descendants, max_depth=max_depth))
+        if stack:
+            parent = stack[-1]
+            parent[4] += cost
+            parent[5] += descendants + 1
+            parent[6] = max(parent[6], max_depth + 1)
+
+    rows = Assembly.objects.order_by('path').values_list('pk', 'path', 'quantity', 'component__price')
+    for pk, path, quantity, price in rows.iterator():
+        while stack and not path.startswith(stack[-1][0]):
+            close()
+        # roots don't cost their own price
+        stack.append([path, pk, quantity, price if stack else 0, 0, 0, 0])
+        if len(rollups) >= 1000:
+            AssemblyRollup.objects.bulk_create(rollups)
+            rollups = []
+    while stack:
+        close()
+    AssemblyRollup.objects.bulk_create(rollups)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0003_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssemblyRollup',
+            fields=[
+                ('assembly', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='bom.assembly')),
+                ('cost', models.DecimalField(decimal_places=8, default=0, max_digits=24, verbose_name='Cost')),
+                ('descendants', models.PositiveIntegerField(default=0, verbose_name='Descendants')),
+                ('max_depth', models.PositiveIntegerField(default=0, help_text='Number of levels below the assembly', verbose_name='Max depth')),
+            ],
+        ),
+        migrations.RunPython(roll_up_existing_trees, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0004_assemblyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeVersion',
+            fields=[
+                ('root_path', models.CharField(blank=True, max_length=255, primary_key=True, serialize=False, verbose_name='Root path')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Version')),
+            ],
+        ),
+    ]
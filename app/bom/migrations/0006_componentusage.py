@@ -0,0 +1,46 @@
+# Generated by Django 4.0.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_existing_trees(apps, schema_editor):
+    Assembly = apps.get_model('bom', 'Assembly')
+    ComponentUsage = apps.get_model('bom', 'ComponentUsage')
+    usages, stack = [], []
+    rows = Assembly.objects.order_by('path').values_list('pk', 'path', 'quantity', 'component_id')
+    for pk, path, quantity, component_id in rows.iterator():
+        while stack and not path.startswith(stack[-1][0]):
+            stack.pop()
+        root_id, multiplier = (stack[-1][2], stack[-1][1]) if stack else (pk, 1)
+        stack.append((path, multiplier * quantity, root_id))
+        usages.append(ComponentUsage(assembly_id=pk, component_id=component_id, root_id=root_id,
+                                     quantity=multiplier * quantity))
+        if len(usages) >= 1000:
+            ComponentUsage.objects.bulk_create(usages)
+            usages = []
+    ComponentUsage.objects.bulk_create(usages)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0005_treeversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComponentUsage',
+            fields=[
+                ('assembly', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='bom.assembly')),
+                ('quantity', models.DecimalField(decimal_places=8, default=0, max_digits=24, verbose_name='Quantity')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='bom.component')),
+                ('root', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bom.assembly')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='componentusage',
+            index=models.Index(fields=['component', 'root'], name='bom_compone_compone_48262f_idx'),
+        ),
+        migrations.RunPython(index_existing_trees, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.0.1 on 2026-10-18 12:10
+
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def child_entry(quantity, signature):
+    # hashing of bom.signatures at the time of migration, later changes of it must not change this one
+    return f"{Decimal(quantity).quantize(Decimal('0.001'))}\x1f{signature}"
+
+
+def entries_signature(identifier, name, entries):
+    hasher = hashlib.sha1(f"{identifier}\x1f{name}".encode())
+    for entry in sorted(entries):
+        hasher.update(f"\x1e{entry}".encode())
+    return hasher.hexdigest()
+
+
+def sign_existing_trees(apps, schema_editor):
+    Assembly = apps.get_model('bom', 'Assembly')
+    AssemblyRollup = apps.get_model('bom', 'AssemblyRollup')
+    rollups, stack = [], []
+
+    def close():
+        # open node: path, pk, quantity, identifier, name, entries of children
+        path, pk, quantity, identifier, name, entries = stack.pop()
+        signature = entries_signature(identifier, name, entries)
+        rollups.append(AssemblyRollup(assembly_id=pk, signature=signature))
+        if stack:
+            stack[-1][5].append(child_entry(quantity, signature))
+
+    rows = Assembly.objects.order_by('path').values_list('pk', 'path', 'quantity', 'component__identifier',
+                                                         'component__name')
+    for pk, path, quantity, identifier, name in rows.iterator():
+        while stack and not path.startswith(stack[-1][0]):
+            close()
+        stack.append([path, pk, quantity, identifier, name, []])
+        if len(rollups) >= 1000:
+            AssemblyRollup.objects.bulk_update(rollups, ['signature'])
+            rollups = []
+    while stack:
+        close()
+    AssemblyRollup.objects.bulk_update(rollups, ['signature'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0006_componentusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assemblyrollup',
+            name='signature',
+            field=models.CharField(blank=True, db_index=True, help_text='Canonical hash of the subtree, see bom.signatures', max_length=40, verbose_name='Signature'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='deduplicate',
+            field=models.BooleanField(default=False, help_text='Reuse stored trees identical to trees from the file', verbose_name='Deduplicate'),
+        ),
+        migrations.RunPython(sign_existing_trees, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.1 on 2026-10-18 12:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0007_subtree_signatures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='changes',
+            field=models.JSONField(blank=True, default=dict, help_text='Numbers of inserted, updated, moved and deleted nodes of patched tree', verbose_name='Changes'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='target',
+            field=models.ForeignKey(blank=True, help_text='Root of stored tree patched with the file instead of saving a new tree', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bom.assembly'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0008_patch_imports'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='content_type',
+            field=models.CharField(blank=True, help_text='Content type of format of the file found at upload', max_length=100, verbose_name='Content type'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.1 on 2026-10-18 15:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bom', '0009_importjob_content_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assembly',
+            name='is_shared',
+            field=models.BooleanField(default=False, help_text='Root of sub-assembly stored once and referenced from its parents', verbose_name='Shared'),
+        ),
+        migrations.AddField(
+            model_name='assembly',
+            name='shared',
+            field=models.ForeignKey(blank=True, help_text='Sub-assembly stored once, its children are children of this node', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='references', to='bom.assembly', verbose_name='Shared sub-assembly'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='deduplicate',
+            field=models.BooleanField(default=False, help_text='Reuse stored trees identical to trees from the file and store repeated sub-assemblies once', verbose_name='Deduplicate'),
+        ),
+    ]
@@ -1,7 +1,12 @@
-from django.core import serializers
+import uuid
+from typing import Iterable, Iterator, Optional, Sequence
+
 from django.db import models
+from django.dispatch import Signal
+
+from treebeard.mp_tree import MP_Node, MP_NodeManager, MP_NodeQuerySet, get_result_class
 
-from treebeard.mp_tree import MP_Node, get_result_class
+from bom.costs import NodeRollup, TreeRollup
 
 
 class Component(models.Model):
@@ -15,6 +20,43 @@ class Component(models.Model):
     def __str__(self) -> str:
         return f"{self.identifier}, {self.name}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['identifier', 'name']),
+        ]
+
+
+COMPONENT_FIELD_NAMES = ('identifier', 'name', 'category', 'unit', 'procurement_type', 'price')
+PROJECTION_FIELDS = COMPONENT_FIELD_NAMES + ('quantity',)
+
+
+assembly_moved = Signal()
+assemblies_deleted = Signal()
+
+
+def _set_cost(node: dict, rollup: NodeRollup):
+    node['cost'] = rollup.extended_cost
+
+
+class AssemblyQuerySet(MP_NodeQuerySet):
+    def delete(self):
+        """ Deletes nodes with their subtrees like treebeard does and sends assemblies_deleted signal once,
+            with paths of the topmost deleted nodes (their parents still exist), so that deleted descendants
+            don't have to be handled one by one.
+        """
+        paths = []
+        for path in self.order_by('path').values_list('path', flat=True):
+            if not paths or not path.startswith(paths[-1]):
+                paths.append(path)
+        super().delete()
+        if paths:
+            assemblies_deleted.send(sender=self.model, paths=paths)
+
+
+class AssemblyManager(MP_NodeManager):
+    def get_queryset(self):
+        return AssemblyQuerySet(self.model).order_by('path')
+
 
 class Assembly(MP_Node):
     steplen = 10
@@ -23,6 +65,13 @@ class Assembly(MP_Node):
     quantity = models.DecimalField(
         verbose_name="Quantity", max_digits=8, decimal_places=3, default=0.0
     )
+    shared = models.ForeignKey("self", verbose_name="Shared sub-assembly", null=True, blank=True,
+                               related_name="references", on_delete=models.PROTECT,
+                               help_text="Sub-assembly stored once, its children are children of this node")
+    is_shared = models.BooleanField(verbose_name="Shared", default=False,
+                                    help_text="Root of sub-assembly stored once and referenced from its parents")
+
+    objects = AssemblyManager()
 
     @property
     def price(self) -> float:
@@ -35,55 +84,208 @@ class Assembly(MP_Node):
         verbose_name = "Assembly"
         verbose_name_plural = "Assemblies"
 
-    @classmethod
-    def dump_bulk(cls, parent=None, keep_ids=True):
+    def move(self, target, pos=None):
+        """ Moves node like treebeard does and sends assembly_moved signal with old and new path,
+            treebeard moves nodes with raw sql, so no other signal is sent for moved subtree.
         """
-        METHOD OVERRIDDEN FROM django-treebeard
-        Dumps a tree branch to a python data structure, calculates total_cost of item.
+        old_path = self.path
+        super().move(target, pos)
+        new_path = get_result_class(type(self)).objects.values_list('path', flat=True).get(pk=self.pk)
+        assembly_moved.send(sender=type(self), instance=self, old_path=old_path, new_path=new_path)
+
+    @classmethod
+    def expand_shared(cls, rows: Iterable[tuple], fields: Sequence[str],
+                      max_depth: Optional[int] = None) -> Iterator[tuple]:
+        """ Yields path ordered rows of values_list(*fields) with nodes of shared sub-assemblies (see bom.shared)
+            placed under nodes referencing them, as if they were stored there: their paths continue paths of
+            referencing nodes and numchild of referencing nodes is numchild of the sub-assembly.
+            fields have to include 'path' and 'shared'. Rows of every shared sub-assembly are fetched once,
+            when it is referenced for the first time. max_depth drops nodes deeper than it.
         """
+        cls = get_result_class(cls)
+        path_idx, shared_idx = fields.index('path'), fields.index('shared')
+        numchild_idx = fields.index('numchild') if 'numchild' in fields else None
+        # id: length of root path, numchild of root and rows of descendants of shared sub-assembly
+        library = {}
+
+        def expand(row: tuple) -> Iterator[tuple]:
+            shared_id = row[shared_idx]
+            if shared_id not in library:
+                root_path, numchild = cls.objects.values_list('path', 'numchild').get(pk=shared_id)
+                library[shared_id] = (len(root_path), numchild, list(
+                    cls.objects.filter(path__startswith=root_path, depth__gt=1).values_list(*fields)))
+            root_length, numchild, children = library[shared_id]
+            path = row[path_idx]
+            if numchild_idx is not None:
+                row = (*row[:numchild_idx], numchild, *row[numchild_idx + 1:])
+            yield row
+            for child in children:
+                child_path = path + child[path_idx][root_length:]
+                if max_depth is not None and len(child_path) // cls.steplen > max_depth:
+                    continue
+                child = (*child[:path_idx], child_path, *child[path_idx + 1:])
+                if child[shared_idx] is None:
+                    yield child
+                else:
+                    yield from expand(child)
 
+        for row in rows:
+            if row[shared_idx] is None:
+                yield row
+            else:
+                yield from expand(row)
+
+    @classmethod
+    def _dump_nodes(cls, parent=None, keep_ids=True, max_depth=None, fields=None, chunk_size=None):
+        """ Fetches nodes dumped by dump_bulk with one path ordered query and yields path, quantity,
+            component price, stored cost and dumped dict (without children and cost) of each of them.
+            chunk_size reads rows from server-side cursor instead of fetching all of them at once.
+            Shared sub-assemblies are dumped under every node referencing them, see expand_shared.
+        """
         cls = get_result_class(cls)
 
-        qset = cls._get_serializable_model().objects.select_related('component').all()
+        qset = cls._get_serializable_model().objects.all()
         if parent:
             qset = qset.filter(path__startswith=parent.path)
-        ret, lnk = [], {}
+        last_depth = None
+        if max_depth is not None:
+            last_depth = (parent.depth if parent else 1) + max_depth
+            qset = qset.filter(depth__lte=last_depth)
         pk_field = cls._meta.pk.attname
+        component_names = [name for name in COMPONENT_FIELD_NAMES if fields is None or name in fields]
+        with_quantity = fields is None or 'quantity' in fields
 
-        for assembly in qset:
-            assembly_obj = serializers.serialize('python', [assembly])
-            component = serializers.serialize('python', [assembly.component])
-            fields = assembly_obj[0]['fields']
-
-            fields['component'] = component[0]['fields']
-            path = fields['path']
-            depth = int(len(path) / cls.steplen)
-            del fields['depth']
-            del fields['path']
-            del fields['numchild']
-            if pk_field in fields:
-                del fields[pk_field]
-
-            newobj = {f'assembly': fields}
+        row_fields = ('pk', 'path', 'quantity', 'numchild', 'rollup__cost', 'component__price', 'shared',
+                      *(f'component__{name}' for name in component_names))
+        rows = qset.values_list(*row_fields)
+        if chunk_size:
+            rows = rows.iterator(chunk_size=chunk_size)
+        for pk, path, quantity, numchild, cost, price, _, *component in cls.expand_shared(rows, row_fields,
+                                                                                          last_depth):
+            newobj = {'assembly': {'component': dict(zip(component_names, component))}}
+            if with_quantity:
+                newobj['assembly']['quantity'] = quantity
             if keep_ids:
-                newobj[pk_field] = assembly_obj[0]['pk']
+                newobj[pk_field] = pk
+            if max_depth is not None:
+                newobj['numchild'] = numchild
+            yield path, quantity, price, cost, newobj
+
+    @classmethod
+    def dump_bulk(cls, parent=None, keep_ids=True, with_costs=False, max_depth=None, fields=None):
+        """
+        METHOD OVERRIDDEN FROM django-treebeard
+        Dumps a tree branch to a python data structure, calculates total_cost of item.
+        Only needed columns are fetched (joined with component) with one query
+        and nested dicts are built directly from them.
+        Costs are rolled up with quantities multiplied down the path, with_costs adds
+        rolled-up cost of every node under 'cost' key. Costs stored in AssemblyRollup are used
+        when available, so subtrees don't have to be summed again.
+        max_depth limits number of dumped levels below parent (or below roots), nodes then get
+        'numchild' key so that cut off subtrees can be expanded later.
+        fields limits dumped component fields and quantity to the given names, see PROJECTION_FIELDS.
+        For large trees see bom.streaming, which writes the same tree as JSON without building it.
+        """
+
+        cls = get_result_class(cls)
+
+        ret, lnk = [], {}
+        rollup = TreeRollup(cls.steplen, on_close=_set_cost if with_costs else None)
+
+        for path, quantity, price, cost, newobj in cls._dump_nodes(parent, keep_ids, max_depth, fields):
+            depth = len(path) // cls.steplen
+            rollup.add(path, quantity, price, key=newobj, cost=cost)
 
             if (not parent and depth == 1) or \
                     (parent and len(path) == len(parent.path)):
                 ret.append(newobj)
             else:
-                parentpath = cls._get_basepath(path, depth - 1)
-                parentobj = lnk[parentpath]
+                parentobj = lnk[path[:(depth - 1) * cls.steplen]]
                 if 'children' not in parentobj:
                     parentobj['children'] = []
                 parentobj['children'].append(newobj)
             lnk[path] = newobj
 
-        total_cost = 0
-        for el in qset:
-            if not el.depth == 1:
-                total_cost += el.price
-        total = {'total_cost': str(total_cost)}
+        total = {'total_cost': str(rollup.finish())}
         ret = {**total, **ret[0]}
 
         return ret
+
+
+class AssemblyRollup(models.Model):
+    """ Rolled-up values of assembly subtree, maintained by bom.rollups. """
+    assembly = models.OneToOneField("Assembly", primary_key=True, related_name="rollup", on_delete=models.CASCADE)
+    cost = models.DecimalField(verbose_name="Cost", max_digits=24, decimal_places=8, default=0)
+    descendants = models.PositiveIntegerField(verbose_name="Descendants", default=0)
+    max_depth = models.PositiveIntegerField(verbose_name="Max depth", default=0,
+                                            help_text="Number of levels below the assembly")
+    signature = models.CharField(verbose_name="Signature", max_length=40, blank=True, db_index=True,
+                                 help_text="Canonical hash of the subtree, see bom.signatures")
+
+    def __str__(self) -> str:
+        return f"{self.assembly_id}, {self.cost}"
+
+
+class ComponentUsage(models.Model):
+    """ Where-used index entry of assembly, maintained by bom.usage. Quantity is the quantity of component
+        in its root product, with quantities multiplied down the path from the root.
+    """
+    assembly = models.OneToOneField("Assembly", primary_key=True, related_name="usage", on_delete=models.CASCADE)
+    component = models.ForeignKey("Component", related_name="usages", on_delete=models.CASCADE)
+    root = models.ForeignKey("Assembly", related_name="+", on_delete=models.CASCADE)
+    quantity = models.DecimalField(verbose_name="Quantity", max_digits=24, decimal_places=8, default=0)
+
+    def __str__(self) -> str:
+        return f"{self.component_id}, {self.root_id}, {self.quantity}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['component', 'root']),
+        ]
+
+
+class TreeVersion(models.Model):
+    """ Version of tree with given root path, bumped by bom.versions on every write under the root.
+        Empty root path holds version of the list of roots.
+    """
+    root_path = models.CharField(verbose_name="Root path", max_length=255, primary_key=True, blank=True)
+    version = models.PositiveBigIntegerField(verbose_name="Version", default=0)
+
+    def __str__(self) -> str:
+        return f"{self.root_path}, {self.version}"
+
+
+class ImportJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (FINISHED, "Finished"),
+        (FAILED, "Failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file = models.FileField(verbose_name="File", upload_to="imports/", blank=True)
+    content_type = models.CharField(verbose_name="Content type", max_length=100, blank=True,
+                                    help_text="Content type of format of the file found at upload")
+    token = models.CharField(verbose_name="Validation token", max_length=64, blank=True)
+    deduplicate = models.BooleanField(verbose_name="Deduplicate", default=False,
+                                      help_text="Reuse stored trees identical to trees from the file and store "
+                                                "repeated sub-assemblies once")
+    target = models.ForeignKey("Assembly", null=True, blank=True, on_delete=models.SET_NULL, related_name="+",
+                               help_text="Root of stored tree patched with the file instead of saving a new tree")
+    status = models.CharField(verbose_name="Status", max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    rows_processed = models.PositiveIntegerField(verbose_name="Rows processed", default=0)
+    errors = models.JSONField(verbose_name="Errors", default=dict, blank=True)
+    changes = models.JSONField(verbose_name="Changes", default=dict, blank=True,
+                               help_text="Numbers of inserted, updated, moved and deleted nodes of patched tree")
+    root = models.ForeignKey("Assembly", null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(verbose_name="Created at", auto_now_add=True)
+    started_at = models.DateTimeField(verbose_name="Started at", null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name="Finished at", null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.id}, {self.status}"
@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PathCursorPagination(CursorPagination):
+    """ Cursor pagination over path order, so pages are stable while trees are being added.
+        Responses are paginated only when page_size query parameter is given.
+    """
+    ordering = 'path'
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
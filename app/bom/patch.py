@@ -0,0 +1,341 @@
+import operator
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import reduce
+from itertools import zip_longest
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models, transaction
+from django.db.models import F, Q
+
+from bom.components import ComponentResolver
+from bom.diff import CHUNK_SIZE, KEY_SEPARATOR, DiffNode, child_key, keyed_nodes
+from bom.entities import CSVLineEntity
+from bom.ingest import get_ingest
+from bom.metrics import span
+from bom.models import Assembly, AssemblyRollup, TreeVersion
+from bom.rollups import rebuild_rollups, update_rollups
+from bom.services import InvalidFileError, file_entities
+from bom.signals import bulk_changes
+from bom.signatures import QUANTITY_QUANTUM, subtree_signature
+from bom.tree import BATCH_SIZE
+from bom.usage import rebuild_usage
+from bom.utils import chunks
+from bom.versions import bump_tree_versions
+
+QUERY_CHUNK_SIZE = 200
+
+
+@dataclass(eq=False)
+class _FileNode:
+    key: str
+    depth: int
+    entity: CSVLineEntity
+    parent: Optional["_FileNode"]
+    numchild: int = 0
+    signature: Optional[str] = None
+    # path of matched stored node, or path given to a new node
+    path: Optional[str] = None
+    skipped: bool = False
+    children_signatures: List[Tuple[float, str]] = field(default_factory=list)
+
+
+def _quantity(quantity) -> Decimal:
+    return Decimal(quantity).quantize(QUANTITY_QUANTUM)
+
+
+def _file_nodes(entities: Iterator[Tuple[int, CSVLineEntity]],
+                progress: Optional[Callable[[int], None]]) -> Iterator[_FileNode]:
+    """ Yields nodes of the single tree of file keyed like bom.diff keys stored nodes.
+        Depths are fixed the same way TreeBuilder does it. Signature of a node is set when its subtree is complete.
+    """
+    stack: List[Tuple[_FileNode, Dict[str, int]]] = []
+
+    def close():
+        node, _ = stack.pop()
+        node.signature = subtree_signature(node.entity.identifier, node.entity.name, node.children_signatures)
+        node.children_signatures = []
+        if stack:
+            stack[-1][0].children_signatures.append((node.entity.quantity, node.signature))
+
+    for idx, entity in entities:
+        depth = entity.depth
+        if depth == 1 and stack or depth > 1 and not stack:
+            raise InvalidFileError({'file_structure': "File has to contain exactly one tree to patch a stored one."})
+        if depth > len(stack) + 1:
+            depth = len(stack)
+        while len(stack) >= depth:
+            close()
+        parent, key = None, ""
+        if stack:
+            parent, occurrences = stack[-1]
+            parent.numchild += 1
+            key = child_key(parent.key, entity.identifier, occurrences)
+        node = _FileNode(key=key, depth=depth, entity=entity, parent=parent)
+        stack.append((node, {}))
+        yield node
+        if progress and (idx + 1) % BATCH_SIZE == 0:
+            progress(idx + 1)
+    while stack:
+        close()
+
+
+class _Patch:
+    """ Changes between stored tree and tree from file, found in one pass over both of them like in diff_trees.
+        Only unmatched nodes and matched nodes which have to be updated are kept in memory.
+    """
+
+    def __init__(self, root: Assembly, file_nodes: Iterator[_FileNode], chunk_size: int):
+        self.removed: Dict[str, DiffNode] = {}
+        self.added: Dict[str, _FileNode] = {}
+        self.updated: List[Tuple[int, str, _FileNode]] = []
+
+        for stored, new in zip_longest(keyed_nodes(root, chunk_size), file_nodes):
+            if stored is not None:
+                matched = self.added.pop(stored.key, None)
+                if matched is None:
+                    self.removed[stored.key] = stored
+                else:
+                    self._match(stored, matched)
+            if new is not None:
+                matched = self.removed.pop(new.key, None)
+                if matched is None:
+                    self.added[new.key] = new
+                else:
+                    self._match(matched, new)
+
+    def _match(self, stored: DiffNode, new: _FileNode):
+        new.path = stored.path
+        entity = new.entity
+        if (stored.quantity != _quantity(entity.quantity)
+                or (stored.identifier, stored.name) != (entity.identifier, entity.name)):
+            self.updated.append((stored.pk, stored.path, new))
+
+    def removed_tops(self) -> List[Tuple[DiffNode, int]]:
+        """ Returns top nodes of removed subtrees with numbers of their nodes. """
+        # pending nodes are in path order, so descendants of a node directly follow it
+        tops = []
+        for key, node in self.removed.items():
+            if tops and key.startswith(tops[-1][0].key + KEY_SEPARATOR):
+                tops[-1][1] += 1
+            else:
+                tops.append([node, 1])
+        return [(node, size) for node, size in tops]
+
+    def added_tops(self) -> List[_FileNode]:
+        return [node for node in self.added.values() if node.parent.key not in self.added]
+
+
+def _moves(removed: List[DiffNode], added: List[_FileNode]) -> List[Tuple[DiffNode, _FileNode]]:
+    """ Pairs removed and added sub-assemblies with the same signature, they are moved instead of being
+        deleted and inserted again. Single nodes are cheaper to insert again than to move.
+    """
+    if not removed or not added:
+        return []
+    signatures: Dict[str, List[DiffNode]] = {}
+    by_pk = {node.pk: node for node in removed}
+    for chunk in chunks(list(by_pk), QUERY_CHUNK_SIZE):
+        for pk, signature in AssemblyRollup.objects.filter(pk__in=chunk).values_list('pk', 'signature'):
+            signatures.setdefault(signature, []).append(by_pk[pk])
+    moves = []
+    for node in added:
+        candidates = signatures.get(node.signature)
+        if candidates:
+            moves.append((candidates.pop(0), node))
+    return moves
+
+
+def _tree_version(root: Assembly, for_update: bool = False) -> Optional[int]:
+    versions = TreeVersion.objects.filter(root_path=root.path[:Assembly.steplen])
+    if for_update:
+        versions = versions.select_for_update()
+    return versions.values_list('version', flat=True).first()
+
+
+def _last_step(parent_path: str) -> int:
+    last_child = (Assembly.objects.filter(path__startswith=parent_path, depth=len(parent_path) // Assembly.steplen + 1)
+                  .order_by('-path').values_list('path', flat=True).first())
+    return Assembly._str2int(last_child[len(parent_path):]) if last_child else 0
+
+
+def _delete(nodes: List[DiffNode]):
+    for chunk in chunks(nodes, QUERY_CHUNK_SIZE):
+        # treebeard's queryset delete saves every parent, numchild is fixed by the caller
+        models.QuerySet.delete(Assembly.objects.filter(
+            reduce(operator.or_, (Q(path__startswith=node.path) for node in chunk))))
+
+
+def _insert(added: Dict[str, _FileNode], component_resolver: ComponentResolver) -> List[_FileNode]:
+    """ Gives paths to added nodes which weren't moved, appending them after last children of their parents,
+        and inserts them.
+
+        Returns
+        ----------
+        List[_FileNode]
+            top nodes of inserted subtrees
+    """
+    tops, nodes, steps = [], [], {}
+    for node in added.values():
+        node.skipped = node.skipped or node.parent.skipped
+        if node.skipped:
+            continue
+        parent_path = node.parent.path
+        top = node.parent.key not in added
+        if parent_path not in steps:
+            steps[parent_path] = _last_step(parent_path) if top else 0
+        steps[parent_path] += 1
+        node.path = Assembly._get_path(parent_path, node.depth, steps[parent_path])
+        nodes.append(node)
+        if top:
+            tops.append(node)
+
+    ingest = get_ingest(BATCH_SIZE)
+    for chunk in chunks(nodes, BATCH_SIZE):
+        with span("resolve"):
+            component_resolver.resolve(node.entity for node in chunk)
+        with span("insert"):
+            ingest.add_assemblies([
+                Assembly(component=component_resolver.get(node.entity), quantity=node.entity.quantity,
+                         path=node.path, depth=node.depth, numchild=node.numchild)
+                for node in chunk
+            ])
+    with span("insert"):
+        ingest.finish()
+    return tops
+
+
+def _materialize(root: Assembly):
+    """ Copies shared sub-assemblies (see bom.shared) under nodes of the tree referencing them, so that patched
+        nodes aren't shared with other trees. Copies of nested sub-assemblies are copied in next rounds.
+    """
+    steplen = Assembly.steplen
+    copied = []
+    with transaction.atomic(), bulk_changes():
+        while True:
+            references = list(Assembly.objects.filter(path__startswith=root.path, shared__isnull=False).values_list(
+                'pk', 'path', 'shared__path', 'shared__numchild'))
+            if not references:
+                break
+            ingest = get_ingest(BATCH_SIZE)
+            for pk, path, shared_path, numchild in references:
+                rows = Assembly.objects.filter(path__startswith=shared_path, depth__gt=1).values_list(
+                    'path', 'numchild', 'component_id', 'quantity', 'shared_id')
+                for chunk in chunks(list(rows), BATCH_SIZE):
+                    ingest.add_assemblies([
+                        Assembly(path=path + node_path[len(shared_path):],
+                                 depth=(len(path) + len(node_path) - len(shared_path)) // steplen,
+                                 numchild=node_numchild, component_id=component_id, quantity=quantity,
+                                 shared_id=shared_id)
+                        for node_path, node_numchild, component_id, quantity, shared_id in chunk
+                    ])
+                Assembly.objects.filter(pk=pk).update(shared=None, numchild=numchild)
+            ingest.finish()
+            # copies of later rounds are in copies of the first one
+            copied = copied or [path for _, path, _, _ in references]
+        for path in copied:
+            rebuild_rollups(path)
+            rebuild_usage(path)
+        if copied:
+            bump_tree_versions([root.path])
+
+
+def patch_tree(file: UploadedFile, root: Assembly, token: Optional[str] = None,
+               progress: Optional[Callable[[int], None]] = None, chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+    """ Applies corrected file to stored tree, instead of saving it as a new one.
+        Nodes are matched by identifiers of components on their path from the root, like in diff_trees.
+        Quantities and components of matched nodes are updated, unmatched stored subtrees are deleted,
+        unmatched file subtrees are appended to their parents. Removed subtree identical to added one
+        (same signature, see bom.signatures) is moved to its new parent instead.
+        Unchanged nodes keep their ids and paths. File and tree are read before any write, changes are
+        then applied in bulk in a short transaction, with rollups and usage index updated only for changed
+        subtrees and their ancestors. Shared sub-assemblies of the tree are copied into it first.
+
+        Parameters
+        -----------
+        file: UploadedFile
+            file with a single tree uploaded by users
+        root: Assembly
+            root of the stored tree
+        token: str
+            optional validation token, see save_to_db
+        progress: Callable[[int], None]
+            called with number of rows read so far
+        chunk_size: int
+            number of stored rows fetched from database at once
+
+        Returns
+        ----------
+        Dict[str, int]
+            numbers of inserted, updated, moved and deleted nodes
+
+        Raises
+        ----------
+        InvalidFileError
+            when file is not valid, doesn't contain exactly one tree or the tree was changed while file was read
+    """
+    _materialize(root)
+    version = _tree_version(root)
+    with span("diff"):
+        patch = _Patch(root, _file_nodes(file_entities(file, token, share_values=True), progress), chunk_size)
+        removed_tops = patch.removed_tops()
+        moves = _moves([node for node, size in removed_tops if size > 1],
+                       [node for node in patch.added_tops() if node.numchild])
+    moved_pks = {stored.pk for stored, _ in moves}
+    deleted = [(node, size) for node, size in removed_tops if node.pk not in moved_pks]
+    component_resolver = ComponentResolver()
+
+    with transaction.atomic(), bulk_changes():
+        if _tree_version(root, for_update=True) != version:
+            raise InvalidFileError({'root': "Tree was changed while the file was read, upload the file again."})
+
+        updated = list(patch.updated)
+        changed_paths = [node.path for node, _ in deleted]
+        moved_paths = []
+        for stored, node in moves:
+            Assembly.objects.get(pk=stored.pk).move(Assembly.objects.get(path=node.parent.path), 'last-child')
+            node.skipped = True
+            moved_path = Assembly.objects.values_list('path', flat=True).get(pk=stored.pk)
+            changed_paths.append(stored.path)
+            moved_paths.append(moved_path)
+            if stored.quantity != _quantity(node.entity.quantity):
+                updated.append((stored.pk, moved_path, node))
+
+        with span("update"):
+            _delete([node for node, _ in deleted])
+        if updated:
+            with span("resolve"):
+                component_resolver.resolve(node.entity for _, _, node in updated)
+            with span("update"):
+                Assembly.objects.bulk_update([
+                    Assembly(pk=pk, component=component_resolver.get(node.entity), quantity=node.entity.quantity)
+                    for pk, _, node in updated
+                ], ['component', 'quantity'], batch_size=BATCH_SIZE)
+        inserted = _insert(patch.added, component_resolver)
+
+        numchild_changes: Dict[str, int] = {}
+        for node, _ in deleted:
+            parent_path = node.path[:-Assembly.steplen]
+            numchild_changes[parent_path] = numchild_changes.get(parent_path, 0) - 1
+        for node in inserted:
+            numchild_changes[node.parent.path] = numchild_changes.get(node.parent.path, 0) + 1
+        for path, change in numchild_changes.items():
+            if change:
+                Assembly.objects.filter(path=path).update(numchild=F('numchild') + change)
+
+        updated_paths = [path for _, path, _ in updated]
+        with span("index"):
+            for node in inserted:
+                rebuild_rollups(node.path, new=True)
+                rebuild_usage(node.path, new=True)
+            update_rollups(changed_paths + moved_paths + updated_paths + [node.parent.path for node in inserted])
+            for path in moved_paths + updated_paths:
+                rebuild_usage(path)
+        bump_tree_versions([root.path])
+
+    return {
+        'inserted': sum(1 for node in patch.added.values() if not node.skipped),
+        'updated': len(patch.updated),
+        'moved': len(moves),
+        'deleted': sum(size for _, size in deleted),
+    }
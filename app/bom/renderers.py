@@ -0,0 +1,26 @@
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer
+
+from bom.explosion import PART_FIELD_NAMES
+
+
+class ExplosionCSVRenderer(BaseRenderer):
+    """ Renders parts explosion as flat csv buy list, one row per part. """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    header = PART_FIELD_NAMES + ('quantity', 'cost')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator="\n")
+        if 'groups' not in data:
+            # errors
+            writer.writerows(data.items())
+            return output.getvalue().encode(self.charset)
+        writer.writerow(self.header)
+        for group in data['groups']:
+            writer.writerows([part[name] for name in self.header] for part in group['parts'])
+        return output.getvalue().encode(self.charset)
@@ -0,0 +1,147 @@
+import operator
+from collections import defaultdict
+from functools import reduce
+from typing import Dict, Iterable, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from bom.costs import NodeRollup, TreeRollup
+from bom.models import Assembly, AssemblyRollup
+from bom.shared import shared_children
+from bom.signatures import subtree_signature
+from bom.utils import chunks
+
+BATCH_SIZE = 1000
+QUERY_CHUNK_SIZE = 200
+
+RollupValues = Tuple[object, int, int, str]  # cost, descendants, max depth, signature
+
+
+def _save(rollups: Dict[int, RollupValues], new: bool = False):
+    if not rollups:
+        return
+    existing = set()
+    if not new:
+        existing = set(AssemblyRollup.objects.filter(pk__in=list(rollups)).values_list('pk', flat=True))
+    objs = [
+        AssemblyRollup(assembly_id=pk, cost=cost, descendants=descendants, max_depth=max_depth, signature=signature)
+        for pk, (cost, descendants, max_depth, signature) in rollups.items()
+    ]
+    AssemblyRollup.objects.bulk_update([obj for obj in objs if obj.pk in existing],
+                                       ['cost', 'descendants', 'max_depth', 'signature'], batch_size=BATCH_SIZE)
+    AssemblyRollup.objects.bulk_create([obj for obj in objs if obj.pk not in existing], batch_size=BATCH_SIZE)
+
+
+def rebuild_rollups(path: str, new: bool = False) -> int:
+    """ Computes rollups of whole subtree of node with given path in one pass over its rows.
+        Existing rollups of the subtree are deleted and created again, updating them row by row
+        (bulk_update) takes time growing with square of their number. Nodes referencing shared sub-assemblies
+        are rolled up from rollups of children of the sub-assemblies, which have to exist.
+
+        Parameters
+        -----------
+        path: str
+            path of subtree root
+        new: bool
+            subtree was just created and doesn't have any rollups yet
+
+        Returns
+        ----------
+        int
+            number of saved rollups
+    """
+    with transaction.atomic():
+        if not new:
+            AssemblyRollup.objects.filter(assembly__path__startswith=path).delete()
+        return _roll_up(path)
+
+
+def _roll_up(path: str) -> int:
+    rollups: Dict[int, RollupValues] = {}
+    saved = 0
+
+    def collect(pk, rollup: NodeRollup):
+        rollups[pk] = (rollup.cost, rollup.descendants, rollup.max_depth, rollup.signature)
+
+    tree_rollup = TreeRollup(Assembly.steplen, on_close=collect)
+    # id of shared sub-assembly: rollups of its children
+    shared = {}
+    rows = Assembly.objects.filter(path__startswith=path).values_list('pk', 'path', 'quantity', 'component__price',
+                                                                      'component__identifier', 'component__name',
+                                                                      'shared')
+    for pk, node_path, quantity, price, identifier, name, shared_id in rows.iterator(chunk_size=BATCH_SIZE):
+        if shared_id is not None and shared_id not in shared:
+            shared[shared_id] = shared_children(shared_id)
+        tree_rollup.add(node_path, quantity, price, key=pk, identity=(identifier, name),
+                        children=shared.get(shared_id, ()))
+        if len(rollups) >= BATCH_SIZE:
+            _save(rollups, new=True)
+            saved += len(rollups)
+            rollups = {}
+    tree_rollup.finish()
+    _save(rollups, new=True)
+    return saved + len(rollups)
+
+
+def update_rollups(paths: Iterable[str]):
+    """ Recomputes rollups of nodes with given paths and of all their ancestors, deepest level first,
+        from rollups of their children. Other nodes are not touched. Paths of nodes which don't exist
+        anymore (deleted or moved) only invalidate their ancestors. Children of shared sub-assemblies
+        are children of nodes referencing them, their rollups have to be updated before.
+
+        Parameters
+        -----------
+        paths: Iterable[str]
+            paths of changed nodes
+    """
+    steplen = Assembly.steplen
+    levels = defaultdict(set)
+    for path in paths:
+        for end in range(steplen, len(path) + 1, steplen):
+            levels[end // steplen].add(path[:end])
+
+    computed: Dict[str, RollupValues] = {}
+    for depth in sorted(levels, reverse=True):
+        for chunk in chunks(sorted(levels[depth]), QUERY_CHUNK_SIZE):
+            nodes = Assembly.objects.filter(path__in=chunk).values_list('pk', 'path', 'quantity', 'component__price',
+                                                                        'component__identifier', 'component__name',
+                                                                        'shared')
+            if not nodes:
+                continue
+            # parent path: [(quantity, cost, descendants, max depth, signature)] of children
+            children = defaultdict(list)
+            for _, path, _, _, _, _, shared_id in nodes:
+                if shared_id is not None:
+                    children[path] = shared_children(shared_id)
+            missing = []
+            rows = Assembly.objects.filter(
+                reduce(operator.or_, (Q(path__startswith=path) for path in chunk)), depth=depth + 1,
+            ).values_list('path', 'quantity', 'rollup__cost', 'rollup__descendants', 'rollup__max_depth',
+                          'rollup__signature')
+            for path, quantity, cost, descendants, max_depth, signature in rows:
+                if path in computed:
+                    cost, descendants, max_depth, signature = computed[path]
+                elif cost is None or not signature:
+                    missing.append((path, quantity))
+                    continue
+                children[path[:-steplen]].append((quantity, cost, descendants, max_depth, signature))
+            for path, quantity in missing:
+                rebuild_rollups(path)
+                rollup = AssemblyRollup.objects.get(assembly__path=path)
+                children[path[:-steplen]].append((quantity, rollup.cost, rollup.descendants, rollup.max_depth,
+                                                  rollup.signature))
+
+            rollups = {}
+            for pk, path, quantity, price, identifier, name, _ in nodes:
+                own_price = price if depth > 1 else 0
+                values = children[path]
+                computed[path] = (
+                    quantity * (own_price + sum(cost for _, cost, _, _, _ in values)),
+                    sum(descendants + 1 for _, _, descendants, _, _ in values),
+                    max((max_depth + 1 for _, _, _, max_depth, _ in values), default=0),
+                    subtree_signature(identifier, name, ((child_quantity, signature)
+                                                         for child_quantity, _, _, _, signature in values)),
+                )
+                rollups[pk] = computed[path]
+            _save(rollups)
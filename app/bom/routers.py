@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = "bom_primary"
+# lag of replica which has replayed everything it received, pg_last_xact_replay_timestamp grows when primary is idle
+REPLICA_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+_state = threading.local()
+# alias: (time of check, healthy)
+_health: Dict[str, Tuple[float, bool]] = {}
+
+
+def check_database(alias: str) -> bool:
+    """ Returns whether database answers and, for replicas of PostgreSQL, whether it lags behind primary
+        at most settings.BOM_REPLICA_MAX_LAG seconds.
+    """
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql" and alias != DEFAULT_DB_ALIAS:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag, = cursor.fetchone()
+                # not a replica (e.g. primary used as replica in development)
+                return lag is None or lag <= settings.BOM_REPLICA_MAX_LAG
+            cursor.execute("SELECT 1")
+            return True
+    except DatabaseError:
+        connection.close()
+        return False
+
+
+def healthy_replicas() -> List[str]:
+    """ Returns aliases of settings.BOM_READ_REPLICAS which passed check_database, every replica is checked
+        at most once in settings.BOM_REPLICA_HEALTH_INTERVAL seconds by each process.
+    """
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.BOM_READ_REPLICAS:
+        checked_at, is_healthy = _health.get(alias, (None, False))
+        if checked_at is None or now - checked_at >= settings.BOM_REPLICA_HEALTH_INTERVAL:
+            is_healthy = check_database(alias)
+            _health[alias] = (now, is_healthy)
+        if is_healthy:
+            healthy.append(alias)
+    return healthy
+
+
+def choose_replica(request) -> Optional[str]:
+    """ Returns alias of random healthy replica for read only request, or None when reads have to stay
+        on primary: there are no healthy replicas or the client wrote recently (see pin_primary).
+    """
+    if PIN_COOKIE in request.COOKIES:
+        return None
+    replicas = healthy_replicas()
+    return random.choice(replicas) if replicas else None
+
+
+def pin_primary(response):
+    """ Makes client read from primary for settings.BOM_REPLICA_PIN_SECONDS, so that it sees its own writes
+        before they are replicated.
+    """
+    response.set_cookie(PIN_COOKIE, "1", max_age=settings.BOM_REPLICA_PIN_SECONDS, httponly=True, samesite="Lax")
+
+
+@contextmanager
+def reading_from(alias: Optional[str]):
+    """ Reads of models are routed to database with given alias inside, to primary when alias is None. """
+    previous = getattr(_state, 'alias', None)
+    _state.alias = alias
+    try:
+        yield
+    finally:
+        _state.alias = previous
+
+
+def read_from(alias: Optional[str], content: Iterable[bytes]) -> Iterator[bytes]:
+    """ Iterates streamed content reading from given database, only while its parts are read. """
+    iterator = iter(content)
+    while True:
+        with reading_from(alias):
+            part = next(iterator, None)
+        if part is None:
+            return
+        yield part
+
+
+class ReplicaRouter:
+    """ Routes reads inside reading_from to the chosen replica, all other reads and every write to primary.
+        Replicas are read only copies of primary, they aren't migrated.
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        # objects read from replica read their relations from primary outside of reading_from
+        return getattr(_state, 'alias', None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str:
+        # objects read from replica would be saved to it otherwise
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, model_name: Optional[str] = None, **hints) -> bool:
+        return db not in settings.BOM_READ_REPLICAS
@@ -1,6 +1,13 @@
+from decimal import Decimal
+
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
 from rest_framework import serializers
 
-from bom.models import Assembly, Component
+from bom.jobs import job_progress
+from bom.costs import COST_QUANTUM
+from bom.importers import get_importer, unknown_format_error
+from bom.models import PROJECTION_FIELDS, Assembly, Component, ImportJob
 
 
 class FileUploadSerializer(serializers.Serializer):
@@ -9,16 +16,191 @@ class FileUploadSerializer(serializers.Serializer):
     class Meta:
         fields = ('file',)
 
+    def validate_file(self, value: UploadedFile) -> UploadedFile:
+        if get_importer(value) is None:
+            raise serializers.ValidationError(unknown_format_error())
+        return value
+
+
+class FileImportSerializer(FileUploadSerializer):
+    token = serializers.CharField(required=False, help_text="Validation-Token header returned by file validation.")
+    deduplicate = serializers.BooleanField(required=False, default=False,
+                                           help_text="Reuse stored trees identical to trees from the file and store "
+                                                     "repeated sub-assemblies once.")
+    target = serializers.PrimaryKeyRelatedField(queryset=Assembly.objects.filter(depth=1, is_shared=False),
+                                                required=False,
+                                                help_text="Id of root of stored tree to patch with the file.")
+
+    class Meta:
+        fields = ('file', 'token', 'deduplicate', 'target',)
+
+    def validate(self, attrs: dict) -> dict:
+        if attrs.get('target') and attrs.get('deduplicate'):
+            raise serializers.ValidationError("Patched tree can't be deduplicated.")
+        return attrs
+
+
+class TreeQuerySerializer(serializers.Serializer):
+    max_depth = serializers.IntegerField(required=False, min_value=0,
+                                         help_text="Number of levels below the item to return.")
+    children = serializers.BooleanField(required=False, default=False,
+                                        help_text="Return only direct children of the item.")
+    fields = serializers.CharField(required=False,
+                                   help_text=f"Comma separated fields to return: {', '.join(PROJECTION_FIELDS)}.")
+
+    def validate_fields(self, value: str) -> tuple:
+        fields = tuple(field.strip() for field in value.split(',') if field.strip())
+        unknown = [field for field in fields if field not in PROJECTION_FIELDS]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown fields: {', '.join(unknown)}")
+        return fields
+
+
+class ProjectionMixin:
+    """ Drops those of projected_fields which are not listed in context['fields']. """
+    projected_fields = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in self.projected_fields:
+                if name not in selected:
+                    fields.pop(name, None)
+        return fields
+
+
+class ComponentSerializer(ProjectionMixin, serializers.ModelSerializer):
+    projected_fields = PROJECTION_FIELDS
 
-class ComponentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Component
         exclude = ('id',)
 
 
-class AssemblySerializer(serializers.ModelSerializer):
+class AssemblySerializer(ProjectionMixin, serializers.ModelSerializer):
+    projected_fields = PROJECTION_FIELDS
     component = ComponentSerializer()
 
     class Meta:
         model = Assembly
-        exclude = ('numchild', 'path',)
+        exclude = ('numchild', 'path', 'shared', 'is_shared',)
+
+
+class AssemblyNodeSerializer(AssemblySerializer):
+    """ Node which can be expanded lazily, cost is multiplied by context['multiplier']
+        (quantity of the parent) like costs of children in dump_bulk. context['depth'] is depth
+        of the listed nodes, children of shared sub-assemblies are listed under referencing nodes.
+    """
+    cost = serializers.SerializerMethodField()
+    numchild = serializers.SerializerMethodField()
+    depth = serializers.SerializerMethodField()
+
+    class Meta(AssemblySerializer.Meta):
+        exclude = ('path', 'shared', 'is_shared',)
+
+    def get_cost(self, assembly: Assembly) -> Decimal:
+        rollup = getattr(assembly, 'rollup', None)
+        cost = rollup.cost if rollup else assembly.price
+        return (self.context.get('multiplier', 1) * cost).quantize(COST_QUANTUM)
+
+    def get_numchild(self, assembly: Assembly) -> int:
+        # children of shared sub-assembly are children of nodes referencing it, see bom.shared
+        return assembly.shared.numchild if assembly.shared_id else assembly.numchild
+
+    def get_depth(self, assembly: Assembly) -> int:
+        return self.context.get('depth', assembly.depth)
+
+
+class ProductUsageSerializer(serializers.Serializer):
+    root = serializers.IntegerField()
+    identifier = serializers.CharField()
+    name = serializers.CharField()
+    quantity = serializers.DecimalField(max_digits=24, decimal_places=8)
+    occurrences = serializers.IntegerField()
+
+
+class WhereUsedSerializer(serializers.Serializer):
+    component = ComponentSerializer()
+    products = ProductUsageSerializer(many=True)
+
+
+class ExplosionQuerySerializer(serializers.Serializer):
+    units = serializers.DecimalField(max_digits=12, decimal_places=3, min_value=Decimal('0.001'), default=Decimal(1),
+                                     help_text="Number of units of the item.")
+
+
+class PartSerializer(serializers.Serializer):
+    identifier = serializers.CharField()
+    name = serializers.CharField()
+    category = serializers.CharField()
+    procurement_type = serializers.CharField()
+    unit = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    quantity = serializers.DecimalField(max_digits=24, decimal_places=5)
+    cost = serializers.DecimalField(max_digits=24, decimal_places=5)
+
+
+class PartGroupSerializer(serializers.Serializer):
+    procurement_type = serializers.CharField()
+    unit = serializers.CharField()
+    quantity = serializers.DecimalField(max_digits=24, decimal_places=5)
+    cost = serializers.DecimalField(max_digits=24, decimal_places=5)
+    parts = PartSerializer(many=True)
+
+
+class ExplosionSerializer(serializers.Serializer):
+    item = serializers.IntegerField()
+    units = serializers.DecimalField(max_digits=12, decimal_places=3)
+    groups = PartGroupSerializer(many=True)
+
+
+class DiffNodeSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    identifier = serializers.CharField()
+    name = serializers.CharField()
+    identifiers = serializers.ListField(child=serializers.CharField(),
+                                        help_text="Identifiers of components on the path from compared item.")
+
+
+class DiffSubtreeSerializer(DiffNodeSerializer):
+    quantity = serializers.DecimalField(max_digits=8, decimal_places=3)
+    descendants = serializers.IntegerField()
+
+
+class QuantityChangeSerializer(DiffNodeSerializer):
+    old_id = serializers.IntegerField()
+    old_quantity = serializers.DecimalField(max_digits=8, decimal_places=3)
+    new_quantity = serializers.DecimalField(max_digits=8, decimal_places=3)
+
+
+class PriceChangeSerializer(DiffNodeSerializer):
+    old_id = serializers.IntegerField()
+    old_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    new_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class TreeDiffSerializer(serializers.Serializer):
+    added = DiffSubtreeSerializer(many=True)
+    removed = DiffSubtreeSerializer(many=True)
+    quantity_changed = QuantityChangeSerializer(many=True)
+    price_changed = PriceChangeSerializer(many=True)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_processed = serializers.SerializerMethodField()
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'status', 'rows_processed', 'rows_per_second', 'errors', 'target', 'changes', 'root',
+                  'created_at', 'started_at', 'finished_at',)
+
+    def get_rows_processed(self, job: ImportJob) -> int:
+        return job_progress(job)
+
+    def get_rows_per_second(self, job: ImportJob) -> float:
+        if not job.started_at:
+            return 0.0
+        seconds = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        return round(job_progress(job) / seconds, 2) if seconds > 0 else 0.0
@@ -1,88 +1,120 @@
-import csv
-import io
-from typing import Tuple, List, Iterable
+import hashlib
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Tuple, List, Iterator, Optional, Callable, Union
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import UploadedFile
 from django.db import transaction
 
+from bom.components import ComponentResolver
 from bom.entities import CSVLineEntity
-from bom.models import Component, Assembly
+from bom.importers import CSVImporter, file_rows, get_importer, unknown_format_error
+from bom.metrics import span, timed
+from bom.models import Assembly
+from bom.rollups import rebuild_rollups
+from bom.shared import SharingTreeBuilder, shared_subtrees
+from bom.signatures import SignatureBuilder, tree_key
+from bom.tree import BATCH_SIZE, TreeBuilder
+from bom.usage import rebuild_usage
+from bom.validation import NO_ERRORS, CheckedRow, checked_rows, level_error, line_chunks, row_errors, \
+    valid_entity, validate_chunk, validated_line
+from bom.versions import bump_tree_versions
 
+VALIDATION_TOKEN_KEY = "bom:validated:{token}"
 
-def validated_line(raw_item: List[str]) -> Tuple[CSVLineEntity, List[str]]:
-    """ Takes line(row) from csv file and transforms it to CSVLineEntity object.
-        Assumes that proper format of file contains following fields in following format:
-        level	item_number	item_name	item_category	unit_of_measure	procurement_type	quantity	Price by Unit
 
+class InvalidFileError(Exception):
+    """ Raised when file given to save_to_db doesn't pass validation, errors are in validate_file format. """
 
-        Parameters
-        -----------
-        raw_item: List[str]
-            line(row) from csv file as a raw list of strings
+    def __init__(self, errors: dict):
+        super().__init__("File is not valid.")
+        self.errors = errors
 
-        Returns
-        ----------
-        CSVLineEntity
-            csv text converted to CSVLineEntity object or None if there were any errors
-        List
-            list of errors if there are any, if not returns empty list
+
+def _is_validated(token: str) -> bool:
+    return cache.get(VALIDATION_TOKEN_KEY.format(token=token)) is not None
+
+
+@lru_cache(maxsize=None)
+def _validation_executor(workers: int) -> Executor:
+    # worker processes only import bom.validation, so they don't need django to be set up
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _validate_in_parallel(lines: Iterator[str], workers: int, chunk_size: int, delimiter: str = ",") -> dict:
+    """ Validates chunks of csv text in worker processes, the calling thread only decodes and splits the file.
+        Only two chunks per worker are in flight, so memory doesn't grow with file size.
+        Errors are merged back in row order, levels of rows at boundaries of chunks are checked here.
     """
-    csv_entity = None
-    errors = []
-
-    if len(raw_item) != 8:
-        errors.append("Each item should have 8 elements.")
-    if not raw_item[0]:
-        errors.append("Field required: level")
-    if not raw_item[1]:
-        errors.append("Field required: identifier")
-    if not raw_item[2]:
-        errors.append("Field required: name")
-    if not raw_item[4]:
-        errors.append("Field required: unit")
-    if not raw_item[5]:
-        errors.append("Field required: procurement_type")
-    if not raw_item[6]:
-        errors.append("Field required: quantity")
-
-    if not errors:
-        csv_entity = CSVLineEntity(depth=int(raw_item[0]),
-                                   identifier=raw_item[1],
-                                   name=raw_item[2],
-                                   category=raw_item[3],
-                                   unit=raw_item[4],
-                                   procurement_type=raw_item[5],
-                                   quantity=float(raw_item[6]),
-                                   price=float(raw_item[7]) if raw_item[7] else 0)
-    return csv_entity, errors
-
-
-def _decode_file(file: UploadedFile) -> Iterable:
-    """ Decodes file uploaded by user.
+    executor = _validation_executor(workers)
+    validation_result, pending = {}, deque()
+    previous_level = -1
+
+    def merge(start: int, future):
+        nonlocal previous_level
+        errors, first_level, last_level = future.result()
+        error = level_error(first_level, previous_level) if start else None
+        if error:
+            key = f"row_{start}"
+            errors.setdefault(key, row_errors(start, []))['verbose:'].append(error)
+            validation_result[key] = errors.pop(key)
+        validation_result.update(errors)
+        previous_level = last_level
+
+    for start, text in line_chunks(lines, chunk_size):
+        pending.append((start, executor.submit(validate_chunk, start, text, delimiter)))
+        if len(pending) >= 2 * workers:
+            merge(*pending.popleft())
+    while pending:
+        merge(*pending.popleft())
+    return validation_result
+
+
+def validate_file(file: UploadedFile, hasher=None) -> dict:
+    """ Validates file
+        File is read by importer of its format (see bom.importers). Csv and tsv files of at least
+        settings.BOM_PARALLEL_VALIDATION_MIN_SIZE bytes are validated in chunks of
+        settings.BOM_VALIDATION_CHUNK_SIZE rows by settings.BOM_VALIDATION_WORKERS processes,
+        other files in the calling thread.
+
         Parameters
         -----------
         file: UploadedFile
             file uploaded by users
+        hasher
+            optional hashlib object, updated with content of file as it is read
 
         Returns
         ----------
-        Iterable
+        Dict
+            dict containing validation results
+
     """
-    decoded_file = file.read().decode()
-    has_header = csv.Sniffer().has_header(decoded_file)
-    io_string = io.StringIO(decoded_file)
-    reader = csv.reader(io_string)
-
-    errors = {}
-    if has_header:
-        next(reader, None)  # skip first row (header)
-    else:
-        errors['file_structure'] = "File doesn't have header."
-    return reader, errors
+    importer = get_importer(file)
+    if importer is None:
+        return {'file_format': unknown_format_error()}
+    workers = settings.BOM_VALIDATION_WORKERS
+    if workers and isinstance(importer, CSVImporter) and file.size >= settings.BOM_PARALLEL_VALIDATION_MIN_SIZE:
+        lines, validation_result = importer.lines(file, hasher)
+        validation_result.update(_validate_in_parallel(lines, workers, settings.BOM_VALIDATION_CHUNK_SIZE,
+                                                       importer.delimiter))
+        return validation_result
 
+    decoded_file, validation_result = importer.rows(file, hasher)
+    for idx, _, errors in checked_rows(decoded_file):
+        if errors:
+            validation_result[f"row_{idx}"] = row_errors(idx, errors)
 
-def validate_file(file: UploadedFile) -> dict:
-    """ Validates file
+    return validation_result
+
+
+def validate_file_with_token(file: UploadedFile) -> Tuple[dict, Optional[str]]:
+    """ Validates file and, if it is valid, remembers hash of its content for
+        settings.BOM_VALIDATION_TOKEN_TIMEOUT seconds, so that save_to_db doesn't have to validate it again.
 
         Parameters
         -----------
@@ -93,70 +125,215 @@ def validate_file(file: UploadedFile) -> dict:
         ----------
         Dict
             dict containing validation results
+        str
+            validation token (sha256 of file content) or None if file is not valid
+    """
+    hasher = hashlib.sha256()
+    validation_result = validate_file(file, hasher)
+    if validation_result:
+        return validation_result, None
 
+    token = hasher.hexdigest()
+    cache.set(VALIDATION_TOKEN_KEY.format(token=token), True, timeout=settings.BOM_VALIDATION_TOKEN_TIMEOUT)
+    return validation_result, token
+
+
+def _stored_copies(file: UploadedFile) -> Tuple[List[Optional[Assembly]], Dict[int, str], Dict[str, Assembly]]:
+    """ Reads file once without saving anything and finds stored trees identical to trees from the file
+        and sub-assemblies to store once (see SharingTreeBuilder) by their signatures: sub-assemblies repeated
+        in the file and those already stored once.
+
+        Returns
+        ----------
+        List[Optional[Assembly]]
+            for every tree of file its stored copy or None, empty list when file is not valid
+        Dict[int, str]
+            signature of every row starting sub-assembly to store once, by index of row
+        Dict[str, Assembly]
+            stored shared sub-assemblies used by the file, by their signatures
     """
-    decoded_file, validation_result = _decode_file(file)
+    decoded_file, validation_result = file_rows(file)
+    if validation_result:
+        return [], {}, {}
+    # signatures of rows with children (not roots) and numbers of their occurrences
+    signatures: Dict[int, str] = {}
+    occurrences = Counter()
 
-    for idx, row in enumerate(decoded_file):
-        entity, errors = validated_line(row)
-        if not entity:
-            validation_result[f"row_{idx}"] = {
-                "row_number": idx,
-                "verbose:": errors
-            }
+    def sign(idx: int, signature: str):
+        signatures[idx] = signature
+        occurrences[signature] += 1
 
-    return validation_result
+    signature_builder = SignatureBuilder(on_close=sign)
+    try:
+        for idx, entity, errors in checked_rows(decoded_file):
+            if errors:
+                return [], {}, {}
+            signature_builder.add(entity.identifier, entity.name, entity.quantity, entity.depth + 1,
+                                  key=idx if entity.depth else None)
+    except ValueError:
+        return [], {}, {}
+    keys = signature_builder.finish()
 
+    roots = Assembly.objects.select_related('rollup').filter(
+        depth=1, is_shared=False, rollup__signature__in={signature for signature, _ in keys})
+    stored = {}
+    # the oldest copy wins
+    for root in roots.order_by('-path'):
+        stored[tree_key(root.rollup.signature, root.quantity)] = root
+    shared = shared_subtrees(occurrences)
+    return ([stored.get(key) for key in keys],
+            {idx: signature for idx, signature in signatures.items()
+             if occurrences[signature] > 1 or signature in shared},
+            shared)
 
-@transaction.atomic
-def save_to_db(file: UploadedFile):
-    decoded_file, validation_result = _decode_file(file)
-    assembly = None
+
+def _parsed_rows(rows: Iterator[List[str]], shared: Optional[dict] = None) -> Iterator[CheckedRow]:
+    # rows of already validated file, levels are not checked and rows are validated again only when they
+    # can't be parsed
+    for idx, row in enumerate(rows):
+        entity = valid_entity(row, shared)
+        if entity is None:
+            yield (idx, *validated_line(row))
+        else:
+            yield idx, entity, NO_ERRORS
+
+
+def file_entities(file: UploadedFile, token: Optional[str] = None,
+                  share_values: bool = False) -> Iterator[Tuple[int, CSVLineEntity]]:
+    """ Reads file in a single pass and yields valid rows.
+        When any row is invalid, remaining rows are only validated and InvalidFileError is raised at the end.
+
+        Parameters
+        -----------
+        file: UploadedFile
+            file uploaded by users
+        token: str
+            token returned by validate_file_with_token, rows of already validated file are only parsed.
+            Token is checked against content of file when it is read to the end.
+        share_values: bool
+            entities with equal texts share them (see bom.validation.valid_entity), for callers which keep
+            many entities
+
+        Returns
+        ----------
+        Iterator[Tuple[int, CSVLineEntity]]
+            index of row and its entity, with depth counted from 1 like Assembly.depth
+
+        Raises
+        ----------
+        InvalidFileError
+            when file is not valid or doesn't match token
+    """
+    hasher = hashlib.sha256() if token else None
+    validated = bool(token) and _is_validated(token)
+    with span("decode"):
+        decoded_file, validation_result = file_rows(file, hasher)
 
     if validation_result:
-        raise Exception("This should already be validated!")
+        raise InvalidFileError(validation_result)
 
-    for idx, row in enumerate(decoded_file):
-        entity, errors = validated_line(row)
+    shared = {} if share_values else None
+    decoded_file = timed("decode", decoded_file)
+    entities = _parsed_rows(decoded_file, shared) if validated else checked_rows(decoded_file, shared=shared)
+    for idx, entity, errors in timed("validate", entities):
         if errors:
-            raise Exception("This should already be validated!")
-
-        component, _ = Component.objects.get_or_create(identifier=entity.identifier,
-                                                       name=entity.name,
-                                                       defaults={
-                                                           'category': entity.category,
-                                                           'unit': entity.unit,
-                                                           'procurement_type': entity.procurement_type,
-                                                           'price': entity.price,
-                                                       })
+            validation_result[f"row_{idx}"] = row_errors(idx, errors)
+        if validation_result:
+            continue
+
         entity.depth += 1
-        if entity.depth == 1:
-            assembly = Assembly.add_root(
-                component=component,
-                quantity=entity.quantity,
-                depth=entity.depth,
-            )
-        else:
-            if assembly.depth == entity.depth:
-                assembly = assembly.add_sibling(
-                    component=component,
-                    quantity=entity.quantity,
-                    depth=entity.depth,
-                )
-            elif (assembly.depth + 1) == entity.depth:
-                assembly = assembly.add_child(
-                    component=component,
-                    quantity=entity.quantity,
-                    depth=entity.depth,
-                )
+        yield idx, entity
+
+    if token and hasher.hexdigest() != token:
+        validation_result['token'] = "Validation token doesn't match uploaded file."
+    if validation_result:
+        raise InvalidFileError(validation_result)
+
+
+def _add_to_tree(entities: List[Tuple[int, CSVLineEntity]], component_resolver: ComponentResolver,
+                 tree_builder: Union[TreeBuilder, SharingTreeBuilder], shared: Dict[int, str]):
+    with span("resolve"):
+        component_resolver.resolve(entity for _, entity in entities)
+    with span("insert"):
+        for idx, entity in entities:
+            if idx in shared:
+                tree_builder.add(component_resolver.get(entity), entity.quantity, entity.depth, shared[idx])
             else:
-                diff = assembly.depth - entity.depth
+                tree_builder.add(component_resolver.get(entity), entity.quantity, entity.depth)
+
+
+@transaction.atomic
+def save_to_db(file: UploadedFile, token: Optional[str] = None,
+               progress: Optional[Callable[[int], None]] = None, deduplicate: bool = False) -> List[Assembly]:
+    """ Validates file and saves assemblies from it to db in a single pass.
+        Rows are processed in batches: components of a batch are resolved with ComponentResolver,
+        tree paths are computed in memory by TreeBuilder and nodes are inserted with bulk_create.
+        Rollups of created trees are computed and their versions are bumped at the end.
+        When any row is invalid, remaining rows are only validated and whole transaction is rolled back.
+        With deduplicate, file is read once more before saving and trees identical to already stored
+        ones (same signature, see bom.signatures) are not saved again, their stored copies are returned.
+        Sub-assemblies of new trees repeated in the file or already stored once are stored once and
+        referenced from their parents, see SharingTreeBuilder.
+
+        Parameters
+        -----------
+        file: UploadedFile
+            file uploaded by users
+        token: str
+            token returned by validate_file_with_token, rows of already validated file are only parsed.
+            Token is checked against content of file when it is read to the end.
+        progress: Callable[[int], None]
+            called after every batch with number of rows processed so far
+        deduplicate: bool
+            reuse stored trees identical to trees from file and store repeated sub-assemblies once
+
+        Returns
+        ----------
+        List[Assembly]
+            root nodes of created (or reused) trees, in order of file
+
+        Raises
+        ----------
+        InvalidFileError
+            when file is not valid or doesn't match token
+    """
+    stored_trees, shared = [], {}
+    if deduplicate:
+        stored_trees, shared, stored_shared = _stored_copies(file)
+        file.seek(0)
+        tree_builder = SharingTreeBuilder(stored_shared)
+    else:
+        tree_builder = TreeBuilder()
+    component_resolver = ComponentResolver()
+    entities = []
+    tree_idx, skipped = -1, False
 
-                for i in range(diff):
-                    assembly = assembly.get_parent()
+    for idx, entity in file_entities(file, token):
+        if entity.depth == 1 and stored_trees:
+            tree_idx += 1
+            skipped = stored_trees[tree_idx] is not None
+        if skipped:
+            continue
+        entities.append((idx, entity))
+        if len(entities) >= BATCH_SIZE:
+            _add_to_tree(entities, component_resolver, tree_builder, shared)
+            entities = []
+            if progress:
+                progress(idx + 1)
 
-                assembly = assembly.add_sibling(
-                    component=component,
-                    quantity=entity.quantity,
-                    depth=entity.depth,
-                )
+    _add_to_tree(entities, component_resolver, tree_builder, shared)
+    with span("insert"):
+        tree_builder.finish()
+    shared_roots = tree_builder.shared_roots if deduplicate else []
+    with span("index"):
+        # rollups of references are computed from rollups of their shared trees
+        for root in shared_roots + tree_builder.roots:
+            rebuild_rollups(root.path, new=True)
+            rebuild_usage(root.path, new=True)
+    bump_tree_versions(root.path for root in tree_builder.roots)
+    if progress:
+        progress(tree_builder.created)
+    if stored_trees:
+        created = iter(tree_builder.roots)
+        return [root or next(created) for root in stored_trees]
+    return tree_builder.roots
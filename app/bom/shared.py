@@ -0,0 +1,164 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from bom.models import Assembly, Component
+from bom.tree import BATCH_SIZE, TreeBuilder
+from bom.utils import chunks
+
+QUERY_CHUNK_SIZE = 500
+
+
+def shared_subtrees(signatures: Iterable[str]) -> Dict[str, Assembly]:
+    """ Returns stored shared sub-assemblies by their signatures, the oldest one when there are more of them. """
+    found = {}
+    for chunk in chunks(list(signatures), QUERY_CHUNK_SIZE):
+        for root in Assembly.objects.select_related('rollup').filter(is_shared=True, rollup__signature__in=chunk):
+            found.setdefault(root.rollup.signature, root)
+    return found
+
+
+def shared_children(shared_id) -> List[tuple]:
+    """ Returns quantity, cost, descendants, max depth and signature of children of shared sub-assembly,
+        which are children of nodes referencing it.
+    """
+    path = Assembly.objects.values_list('path', flat=True).get(pk=shared_id)
+    return list(Assembly.objects.filter(path__startswith=path, depth=2).values_list(
+        'quantity', 'rollup__cost', 'rollup__descendants', 'rollup__max_depth', 'rollup__signature'))
+
+
+def referencing_paths(paths: Iterable[str]) -> Iterator[List[str]]:
+    """ Yields paths of nodes referencing shared sub-assemblies which contain nodes with given paths, directly
+        or through other shared sub-assemblies, one list for every level of nesting. Their trees change together
+        with the sub-assemblies, a level has to be updated before the next one.
+    """
+    steplen = Assembly.steplen
+    root_paths = {path[:steplen] for path in paths}
+    while root_paths:
+        shared = []
+        for chunk in chunks(sorted(root_paths), QUERY_CHUNK_SIZE):
+            shared += Assembly.objects.filter(path__in=chunk, is_shared=True).values_list('pk', flat=True)
+        references = []
+        for chunk in chunks(shared, QUERY_CHUNK_SIZE):
+            references += Assembly.objects.filter(shared__in=chunk).values_list('path', flat=True)
+        if references:
+            yield references
+        root_paths = {path[:steplen] for path in references}
+
+
+class _Capture(NamedTuple):
+    """ Rows of the first occurrence of a shared sub-assembly which isn't stored yet. """
+    signature: str
+    depth: int
+    # component, quantity, depth in the sub-assembly and signature of shared sub-assembly of every node
+    rows: list
+
+
+class SharingTreeBuilder:
+    """ Builds trees like TreeBuilder, with sub-assemblies stored once: every sub-assembly repeated in the file
+        (or already stored this way) is a separate shared tree with is_shared root of quantity 1, nodes where it
+        is used get only their own row, which references the shared tree. Readers place nodes of the shared tree
+        under every referencing node (see Assembly.expand_shared), so the API returns the same trees as if
+        they were copied.
+
+        Node starting a shared sub-assembly is added with its signature, it's written as a reference and rows
+        of its subtree are skipped.
+        Rows of the first occurrence of sub-assembly which isn't stored yet are kept and written as new shared
+        tree when the subtree is complete, shared sub-assemblies nested in it are referenced the same way.
+        References get ids of their shared trees at the end, when all of them are written.
+    """
+
+    def __init__(self, stored: Dict[str, Assembly], batch_size: int = BATCH_SIZE):
+        """ Parameters
+            -----------
+            stored: Dict[str, Assembly]
+                already stored shared sub-assemblies by their signatures, see shared_subtrees
+            batch_size: int
+                number of nodes written at once
+        """
+        self._products = TreeBuilder(batch_size)
+        self._shared_builder = TreeBuilder(batch_size, alongside=self._products)
+        # signature: root of shared tree, None while its rows are captured
+        self._shared: Dict[str, Optional[Assembly]] = dict(stored)
+        self._captures: List[_Capture] = []
+        self._skipped_depth: Optional[int] = None
+        self._references: Dict[str, List[Assembly]] = defaultdict(list)
+
+    @property
+    def roots(self) -> List[Assembly]:
+        """ Roots of added trees, without shared trees. """
+        return self._products.roots
+
+    @property
+    def shared_roots(self) -> List[Assembly]:
+        """ Roots of new shared trees, nested sub-assemblies before the ones containing them. """
+        return self._shared_builder.roots
+
+    @property
+    def created(self) -> int:
+        return self._products.created + self._shared_builder.created
+
+    def _write(self, capture: _Capture):
+        for component, quantity, depth, signature in capture.rows:
+            node = self._shared_builder.add(component, quantity, depth, is_shared=depth == 1)
+            if signature is not None:
+                self._references[signature].append(node)
+        self._shared[capture.signature] = self._shared_builder.roots[-1]
+
+    def _add_node(self, component: Component, quantity: Union[float, Decimal], depth: int,
+                  signature: Optional[str]):
+        if self._captures:
+            capture = self._captures[-1]
+            capture.rows.append((component, quantity, depth - capture.depth + 1, signature))
+            return
+        node = self._products.add(component, quantity, depth)
+        if signature is not None:
+            self._references[signature].append(node)
+
+    def add(self, component: Component, quantity: Union[float, Decimal], depth: int,
+            signature: Optional[str] = None):
+        """ Adds node like TreeBuilder.add.
+
+            Parameters
+            -----------
+            component: Component
+                component of the node
+            quantity: float
+                quantity of the component
+            depth: int
+                depth of node, counted from 1 like Assembly.depth
+            signature: str
+                signature of subtree of the node, when it is a shared sub-assembly (not for roots)
+        """
+        if self._skipped_depth is not None:
+            if depth > self._skipped_depth:
+                return
+            self._skipped_depth = None
+        while self._captures and depth <= self._captures[-1].depth:
+            self._write(self._captures.pop())
+
+        self._add_node(component, quantity, depth, signature)
+        if signature is None:
+            return
+        if signature in self._shared:
+            self._skipped_depth = depth
+        else:
+            self._shared[signature] = None
+            self._captures.append(_Capture(signature, depth, [(component, 1, 1, None)]))
+
+    def finish(self) -> int:
+        """ Writes remaining nodes and sets shared trees of references.
+
+            Returns
+            ----------
+            int
+                number of created nodes
+        """
+        while self._captures:
+            self._write(self._captures.pop())
+        self._products.finish()
+        self._shared_builder.finish()
+        for signature, nodes in self._references.items():
+            for chunk in chunks([node.path for node in nodes], QUERY_CHUNK_SIZE):
+                Assembly.objects.filter(path__in=chunk).update(shared=self._shared[signature])
+        return self.created
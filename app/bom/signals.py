@@ -0,0 +1,136 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from bom.models import Assembly, Component, assemblies_deleted, assembly_moved
+from bom.rollups import update_rollups
+from bom.shared import referencing_paths
+from bom.usage import rebuild_usage
+from bom.versions import bump_tree_versions
+
+_state = threading.local()
+
+
+@contextmanager
+def bulk_changes():
+    """ Assembly signals are ignored inside, caller updates rollups, usage index and versions of changed
+        nodes itself, once for all of them.
+    """
+    _state.bulk = True
+    try:
+        yield
+    finally:
+        _state.bulk = False
+
+
+def _in_bulk() -> bool:
+    return getattr(_state, 'bulk', False)
+
+
+def _update_references(paths, rollups: bool = True):
+    # trees referencing changed shared sub-assemblies (see bom.shared) change with them
+    for references in referencing_paths(paths):
+        if rollups:
+            update_rollups(references)
+        bump_tree_versions(references)
+
+
+@receiver(pre_save, sender=Assembly)
+def assembly_loaded(sender, instance: Assembly, raw=False, **kwargs):
+    # quantity and component are rolled up into ancestors and indexed with the whole subtree
+    instance._old_values = None
+    if instance.pk and not raw and not _in_bulk():
+        instance._old_values = Assembly.objects.filter(pk=instance.pk).values_list('quantity', 'component_id').first()
+
+
+@receiver(post_save, sender=Assembly)
+def assembly_saved(sender, instance: Assembly, raw=False, **kwargs):
+    if raw or _in_bulk():
+        return
+    changed = getattr(instance, '_old_values', None) != (instance.quantity, instance.component_id)
+    if changed:
+        update_rollups([instance.path])
+        rebuild_usage(instance.path)
+    bump_tree_versions([instance.path])
+    _update_references([instance.path], rollups=changed)
+
+
+@receiver(assembly_moved, sender=Assembly)
+def assembly_moved_(sender, old_path: str, new_path: str, **kwargs):
+    if _in_bulk():
+        return
+    update_rollups([old_path, new_path])
+    rebuild_usage(new_path)
+    bump_tree_versions([old_path, new_path])
+    _update_references([old_path, new_path])
+
+
+@receiver(assemblies_deleted, sender=Assembly)
+def assemblies_deleted_(sender, paths, **kwargs):
+    if _in_bulk():
+        return
+    # paths of deleted nodes only invalidate rollups of their ancestors
+    update_rollups(paths)
+    bump_tree_versions(paths)
+    _update_references(paths)
+
+
+@receiver(pre_save, sender=Component)
+def component_loaded(sender, instance: Component, raw=False, **kwargs):
+    # price is rolled up into costs, identifier and name into signatures
+    instance._old_values = None
+    if instance.pk and not raw:
+        instance._old_values = Component.objects.filter(pk=instance.pk).values_list(
+            'price', 'identifier', 'name').first()
+
+
+@receiver(post_save, sender=Component)
+def component_saved(sender, instance: Component, created=False, raw=False, **kwargs):
+    if created or raw:
+        return
+    paths = list(Assembly.objects.filter(component=instance).values_list('path', flat=True))
+    bump_tree_versions(paths)
+    old_values = getattr(instance, '_old_values', None)
+    changed = old_values is not None and old_values != (instance.price, instance.identifier, instance.name)
+    if changed:
+        update_rollups(paths)
+    _update_references(paths, rollups=changed)
+
+
+@receiver(pre_delete, sender=Component)
+def component_deleting(sender, instance: Component, **kwargs):
+    # assemblies using the component are deleted with it (on_delete=CASCADE), not by AssemblyQuerySet
+    instance._assembly_paths = list(Assembly.objects.filter(component=instance).values_list('path', flat=True))
+
+
+@receiver(post_delete, sender=Component)
+def component_deleted(sender, instance: Component, **kwargs):
+    paths = getattr(instance, '_assembly_paths', [])
+    if paths and not _in_bulk():
+        update_rollups(paths)
+        bump_tree_versions(paths)
+        _update_references(paths)
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    """ Closes open connections which stopped working (e.g. database was restarted), so that the request opens
+        a new one instead of failing. Django 4.0 closes persistent connections only after errors of previous
+        request. Every connection is checked at most once in settings.BOM_CONN_CHECK_INTERVAL seconds,
+        or at the start of the next request when its queries failed.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        checked_at = getattr(connection, '_bom_checked_at', None)
+        if connection.errors_occurred or checked_at is None or now - checked_at >= settings.BOM_CONN_CHECK_INTERVAL:
+            connection._bom_checked_at = now
+            if not connection.is_usable():
+                connection.close()
@@ -0,0 +1,95 @@
+import hashlib
+from decimal import Decimal
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+
+QUANTITY_QUANTUM = Decimal('0.001')
+
+
+def _quantity(quantity: Union[float, Decimal]) -> str:
+    # quantities are stored with 3 decimal places, so parsed and stored quantities give the same key
+    return str(Decimal(quantity).quantize(QUANTITY_QUANTUM))
+
+
+def child_entry(quantity: Union[float, Decimal], signature: str) -> str:
+    """ Returns entry of a child in signature of its parent, see entries_signature. """
+    return f"{_quantity(quantity)}\x1f{signature}"
+
+
+def entries_signature(identifier: str, name: str, entries: Iterable[str]) -> str:
+    """ Computes signature like subtree_signature from entries of children made by child_entry. Nodes waiting
+        for their last child keep entries, which take less than half of memory of quantities with signatures.
+    """
+    hasher = hashlib.sha1(f"{identifier}\x1f{name}".encode())
+    for entry in sorted(entries):
+        hasher.update(f"\x1e{entry}".encode())
+    return hasher.hexdigest()
+
+
+def subtree_signature(identifier: str, name: str, children: Iterable[Tuple[Union[float, Decimal], str]]) -> str:
+    """ Computes canonical signature of a subtree from component of its top node and quantities and
+        signatures of its children, in any order. Quantity of the top node itself is not included,
+        so the same sub-assembly used in different quantities has the same signature.
+
+        Parameters
+        -----------
+        identifier: str
+            identifier of component of the top node
+        name: str
+            name of component of the top node
+        children: Iterable[Tuple[Decimal, str]]
+            quantity and signature of every child
+
+        Returns
+        ----------
+        str
+            sha1 hex digest
+    """
+    return entries_signature(identifier, name, (child_entry(quantity, signature) for quantity, signature in children))
+
+
+def tree_key(signature: str, quantity: Union[float, Decimal]) -> Tuple[str, str]:
+    """ Returns key identifying whole tree: signature and quantity of its root. """
+    return signature, _quantity(quantity)
+
+
+class SignatureBuilder:
+    """ Computes signatures of trees from rows given in file order (depth-first, parents before children),
+        without saving them. Rows are placed the same way TreeBuilder places them.
+    """
+
+    def __init__(self, on_close: Optional[Callable[[Any, str], None]] = None):
+        """ Parameters
+            -----------
+            on_close: Callable
+                called with key given to add and signature of a node with children when its subtree is complete
+        """
+        self.on_close = on_close
+        # [identifier, name, quantity, entries of children, key] of open nodes
+        self._stack: List[list] = []
+        self.roots: List[Tuple[str, str]] = []
+
+    def _close(self):
+        identifier, name, quantity, entries, key = self._stack.pop()
+        signature = entries_signature(identifier, name, entries)
+        if self.on_close and entries:
+            self.on_close(key, signature)
+        if self._stack:
+            self._stack[-1][3].append(child_entry(quantity, signature))
+        else:
+            self.roots.append(tree_key(signature, quantity))
+
+    def add(self, identifier: str, name: str, quantity: Union[float, Decimal], depth: int, key: Any = None):
+        """ Adds node with depth counted from 1, see TreeBuilder.add. key is passed to on_close. """
+        if depth > 1 and not self._stack:
+            raise ValueError("First node of a tree has to be a root.")
+        if depth > len(self._stack) + 1:
+            depth = len(self._stack)
+        while len(self._stack) >= depth:
+            self._close()
+        self._stack.append([identifier, name, quantity, [], key])
+
+    def finish(self) -> List[Tuple[str, str]]:
+        """ Closes remaining nodes and returns keys (see tree_key) of all added trees in order. """
+        while self._stack:
+            self._close()
+        return self.roots
@@ -0,0 +1,75 @@
+import json
+from typing import Iterator, List
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from bom.costs import COST_QUANTUM, NodeRollup, TreeRollup
+from bom.models import Assembly
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+
+def _dumps(value) -> str:
+    # same encoding as DRF's JSONRenderer with default settings
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def stream_dump(parent: Assembly, keep_ids: bool = True, with_costs: bool = False, max_depth=None, fields=None,
+                chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """ Writes the tree returned by Assembly.dump_bulk as JSON while path ordered rows are read from
+        server-side cursor, so only the branch from parent to the current node is kept in memory.
+        Brackets are opened and closed when depth of consecutive rows changes. Keys known only when
+        a subtree is complete (cost and total_cost) are written after its children.
+
+        Parameters
+        -----------
+        parent: Assembly
+            top node of dumped tree
+        keep_ids, with_costs, max_depth, fields:
+            see Assembly.dump_bulk
+        chunk_size: int
+            number of rows fetched from database at once
+
+        Returns
+        ----------
+        Iterator[bytes]
+            parts of JSON document, about BUFFER_SIZE each
+    """
+    parts: List[str] = []
+    size = 0
+    # for each open node: whether its children list was already opened
+    has_children: List[bool] = []
+
+    def write(text: str):
+        nonlocal size
+        parts.append(text)
+        size += len(text)
+
+    def close(key, node_rollup: NodeRollup):
+        if has_children.pop():
+            write(']')
+        if with_costs:
+            write(',"cost":' + _dumps(node_rollup.extended_cost))
+        if not has_children:
+            write(',"total_cost":' + _dumps(str(rollup.total.quantize(COST_QUANTUM))))
+        write('}')
+
+    rollup = TreeRollup(Assembly.steplen, on_close=close)
+
+    for path, quantity, price, cost, node in Assembly._dump_nodes(parent, keep_ids, max_depth, fields,
+                                                                  chunk_size=chunk_size):
+        rollup.add(path, quantity, price, cost=cost)
+        if has_children:
+            write(',' if has_children[-1] else ',"children":[')
+            has_children[-1] = True
+        # left open for children and costs
+        write(_dumps(node)[:-1])
+        has_children.append(False)
+        if size >= BUFFER_SIZE:
+            yield ''.join(parts).encode()
+            parts.clear()
+            size = 0
+    rollup.finish()
+    if parts:
+        yield ''.join(parts).encode()
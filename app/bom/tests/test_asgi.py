@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.reverse import reverse
+
+from bom.asgi import ASGIHandler, Workers
+from bom.metrics import REQUEST_QUERIES
+from bom.services import save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+
+async def _get(application, path: str) -> tuple:
+    """ Sends GET request to ASGI application, returns status and messages with parts of body. """
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'query_string': b'', 'headers': [(b'host', b'testserver')], 'server': ('testserver', 80)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status'], messages[1:]
+
+
+class TestASGIHandler(TestCase):
+    def setUp(self) -> None:
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        self.path = reverse('bom:item_details', kwargs={'id': self.root.pk})
+        self.tree = self.client.get(self.path).json()
+        # response of the tree is cached, unless it's streamed
+        cache.clear()
+
+    async def test_responses_are_sent(self):
+        status, messages = await _get(ASGIHandler(), self.path)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(b"".join(message.get('body', b'') for message in messages)), self.tree)
+
+    @override_settings(BOM_STREAMING_MIN_NODES=1)
+    async def test_streamed_trees_are_read_outside_event_loop(self):
+        labels = ("bom:item_details",)
+        count = REQUEST_QUERIES.count(labels)
+
+        status, messages = await _get(ASGIHandler(), self.path)
+
+        self.assertEqual(status, 200)
+        self.assertGreater(len(messages), 1)
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+        self.assertEqual(json.loads(b"".join(message.get('body', b'') for message in messages)), self.tree)
+        self.assertEqual(REQUEST_QUERIES.count(labels), count + 1)
+
+    @override_settings(BOM_STREAMING_MIN_NODES=1, BOM_ASGI_WORKERS=1)
+    async def test_streamed_trees_share_workers_by_parts(self):
+        handler = ASGIHandler()
+
+        responses = await asyncio.gather(_get(handler, self.path), _get(handler, self.path))
+
+        for status, messages in responses:
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(b"".join(message.get('body', b'') for message in messages)), self.tree)
+
+
+async def _serve(name: str, slot, served: list):
+    async with slot:
+        served.append(name)
+
+
+class TestWorkers(SimpleTestCase):
+    async def test_waiting_views_are_served_first_newest_first(self):
+        workers = Workers(size=1, stream_size=1)
+        served = []
+
+        async with workers.view():
+            tasks = [asyncio.create_task(_serve(name, slot, served)) for name, slot in (
+                ("part", workers.part()), ("first view", workers.view()), ("second view", workers.view()))]
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(served, ["second view", "first view", "part"])
+
+    async def test_parts_leave_slots_for_views(self):
+        workers = Workers(size=2, stream_size=1)
+        served = []
+
+        async with workers.part():
+            part = asyncio.create_task(_serve("part", workers.part(), served))
+            await asyncio.sleep(0)
+            async with workers.view():
+                served.append("view")
+        await part
+
+        self.assertEqual(served, ["view", "part"])
+
+    async def test_slot_of_cancelled_request_is_passed_on(self):
+        workers = Workers(size=1, stream_size=1)
+
+        async with workers.view():
+            cancelled = asyncio.create_task(workers.view().__aenter__())
+            await asyncio.sleep(0)
+            cancelled.cancel()
+        view = workers.view()
+        await asyncio.wait_for(view.__aenter__(), timeout=1)
+        await view.__aexit__(None, None, None)
@@ -0,0 +1,63 @@
+from collections import Counter
+
+from django.test import SimpleTestCase
+
+from bom.benchmarks.baseline import compare
+from bom.benchmarks.generator import generate_bom_rows
+from bom.validation import checked_rows
+
+
+def _children_counts(rows) -> Counter:
+    counts, stack = Counter(), []
+    for idx, row in enumerate(rows):
+        level = int(row[0])
+        del stack[level:]
+        if stack:
+            counts[stack[-1]] += 1
+        stack.append(idx)
+    return counts
+
+
+class TestGenerator(SimpleTestCase):
+    def test_same_seed_gives_same_rows(self):
+        self.assertEqual(list(generate_bom_rows(500, seed=3)), list(generate_bom_rows(500, seed=3)))
+        self.assertNotEqual(list(generate_bom_rows(500, seed=3)), list(generate_bom_rows(500, seed=4)))
+
+    def test_width_depth_and_reuse_are_limited(self):
+        rows = list(generate_bom_rows(3_000, max_depth=4, components=20, max_children=15, seed=1))
+
+        self.assertEqual(len(rows), 3_000)
+        self.assertFalse([errors for _, _, errors in checked_rows(rows) if errors])
+        self.assertEqual(max(int(row[0]) for row in rows), 4)
+        self.assertLessEqual(max(_children_counts(rows).values()), 15)
+        self.assertEqual(len({row[1] for row in rows[1:]}), 20)
+
+    def test_too_narrow_tree_is_rejected(self):
+        with self.assertRaises(ValueError):
+            list(generate_bom_rows(100, max_depth=2, max_children=3))
+
+
+class TestBaseline(SimpleTestCase):
+    baseline = {"rows": 1000, "seed": 0, "results": {
+        "import": [{"name": "bulk", "rows": 1000, "seconds": 1.0, "queries": 20, "peak_mb": 10}],
+        "diff": [{"name": "diff", "rows": 500, "seconds": 0.5, "queries": 4},
+                 {"name": "diff", "rows": 1000, "seconds": 1.0, "queries": 4}],
+    }}
+
+    def test_results_within_tolerance_pass(self):
+        results = {
+            "import": [{"name": "bulk", "rows": 1000, "seconds": 1.2, "queries": 18, "peak_mb": 12}],
+            "diff": [{"name": "diff", "rows": 1000, "seconds": 0.1, "queries": 4}],
+            "list": [{"name": "projected", "rows": 1000, "seconds": 5.0, "queries": 100}],
+        }
+
+        self.assertEqual(compare(results, self.baseline, tolerance=0.25), [])
+
+    def test_slower_runs_and_more_queries_are_regressions(self):
+        results = {
+            "import": [{"name": "bulk", "rows": 1000, "seconds": 1.3, "queries": 21, "peak_mb": 10}],
+            "diff": [{"name": "diff", "rows": 500, "seconds": 0.5, "queries": 4}],
+        }
+
+        self.assertEqual(compare(results, self.baseline, tolerance=0.25),
+                         ["import:bulk:1000 seconds 1.0 -> 1.3", "import:bulk:1000 queries 20 -> 21"])
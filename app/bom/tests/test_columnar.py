@@ -0,0 +1,136 @@
+from itertools import islice
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from bom.benchmarks.generator import bom_csv, generate_bom_rows
+from bom.columnar import parse_columns, save_columns_to_db
+from bom.models import Assembly, AssemblyRollup, ComponentUsage
+from bom.services import InvalidFileError, save_to_db, validate_file, validate_file_with_token
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+from bom.validation import checked_rows, row_errors, row_level
+
+
+def _stored_rows(roots) -> list:
+    rows = []
+    for root in roots:
+        nodes = Assembly.objects.filter(path__startswith=root.path).order_by('path')
+        rows.extend(nodes.values_list('path', 'depth', 'numchild', 'quantity', 'component__identifier',
+                                      'component__name', 'component__price'))
+    return [(path[Assembly.steplen:], *row) for path, *row in rows]
+
+
+def _indexes(roots) -> tuple:
+    nodes = Assembly.objects.filter(path__in=[root.path for root in roots])
+    return (sorted(AssemblyRollup.objects.filter(assembly__in=nodes).values_list(
+                'cost', 'descendants', 'max_depth', 'signature')),
+            ComponentUsage.objects.filter(root__in=nodes).count())
+
+
+class TestParseColumns(TestCase):
+    def test_rows_are_parsed_into_typed_columns(self):
+        rows = [["0", "999-0001-00", "headphones", "", "EA", "MTS", "1", ""],
+                ["1", "210-0101-00", "somethingelse", "", "EA", "MTS", "1.12", "0.6"]]
+
+        batch, errors = parse_columns(rows)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(list(batch.levels), [0, 1])
+        self.assertEqual(batch.identifiers, ("999-0001-00", "210-0101-00"))
+        self.assertEqual(list(batch.quantities), [1, 1.12])
+        self.assertEqual(list(batch.prices), [0, 0.6])
+
+    def test_errors_are_the_same_as_errors_of_rows(self):
+        rows = list(generate_bom_rows(400, seed=7))
+        rows[3][6] = "abc"
+        rows[4][1] = ""
+        rows[150][0] = str(int(rows[149][0]) + 2)
+        rows[200] = rows[200][:5]
+        rows[350][6] = "nan"
+        expected = {f"row_{idx}": row_errors(idx, errors) for idx, _, errors in checked_rows(rows) if errors}
+
+        errors = {}
+        for start in range(0, len(rows), 100):
+            batch, batch_errors = parse_columns(rows[start:start + 100], start,
+                                                 row_level(rows[start - 1]) if start else -1)
+            errors.update(batch_errors)
+
+        self.assertEqual(list(expected), ['row_3', 'row_4', 'row_150', 'row_200', 'row_350'])
+        self.assertEqual(errors, expected)
+
+    def test_level_of_first_row_is_checked_against_previous_batch(self):
+        rows = list(islice(generate_bom_rows(300, seed=7), 1, 3))
+
+        batch, errors = parse_columns(rows, start=1, previous_level=0)
+        _, jump_errors = parse_columns(rows, start=1, previous_level=-1)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(batch.levels[0], 1)
+        self.assertEqual(jump_errors, {'row_1': row_errors(1, ["First row has to be at level 0."])})
+
+
+class TestSaveColumnsToDb(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_same_trees_as_save_to_db(self):
+        content = bom_csv(generate_bom_rows(2_500, seed=3))
+
+        expected = save_to_db(SimpleUploadedFile("file.csv", content))
+        roots = save_columns_to_db(SimpleUploadedFile("file.csv", content), batch_size=300)
+
+        self.assertEqual(len(roots), len(expected))
+        self.assertEqual(_stored_rows(roots), _stored_rows(expected))
+        self.assertEqual(_indexes(roots), _indexes(expected))
+        self.assertEqual(Assembly.find_problems(), ([], [], [], [], []))
+
+    def test_trees_are_appended_after_existing_ones(self):
+        first, = save_columns_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        second, = save_columns_to_db(_in_memory_file(file_path=CORRECT_FILE), batch_size=2)
+
+        self.assertEqual(Assembly.get_root_nodes().count(), 2)
+        self.assertEqual(_stored_rows([second]), _stored_rows([first]))
+        self.assertEqual(second.get_descendant_count(), 6)
+
+    def test_roots_are_returned_in_file_order(self):
+        save_columns_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        sizes = [30, 5, 60, 12, 45, 2, 20]
+        rows = [row for idx, size in enumerate(sizes) for row in generate_bom_rows(size, seed=idx)]
+
+        roots = save_columns_to_db(SimpleUploadedFile("file.csv", bom_csv(rows)), batch_size=50)
+
+        self.assertEqual([root.get_descendant_count() + 1 for root in roots], sizes)
+
+    def test_invalid_file_is_not_saved(self):
+        content = open(CORRECT_FILE, encoding="utf-8").read().replace("3,240-0001-00", "5,240-0001-00")
+        file = SimpleUploadedFile("file.csv", content.encode(), content_type="text/csv")
+
+        with self.assertRaises(InvalidFileError) as e:
+            save_columns_to_db(file, batch_size=3)
+
+        self.assertEqual(e.exception.errors, validate_file(file))
+        self.assertEqual(Assembly.objects.count(), 0)
+
+    def test_validated_file_is_checked_against_token(self):
+        token = validate_file_with_token(_in_memory_file(file_path=CORRECT_FILE))[1]
+
+        root, = save_columns_to_db(_in_memory_file(file_path=CORRECT_FILE), token=token)
+        with self.assertRaises(InvalidFileError) as e:
+            save_columns_to_db(_in_memory_file(file_path=CORRECT_FILE), token="0" * 64)
+
+        self.assertEqual(root.get_descendant_count(), 6)
+        self.assertIn('token', e.exception.errors)
+        self.assertEqual(Assembly.objects.count(), 7)
+
+    def test_file_changed_after_validation_is_not_built(self):
+        token = validate_file_with_token(_in_memory_file(file_path=CORRECT_FILE))[1]
+        content = open(CORRECT_FILE, encoding="utf-8").read().replace("0,999-0001-00", "1,999-0001-00")
+        file = SimpleUploadedFile("file.csv", content.encode(), content_type="text/csv")
+
+        with self.assertRaises(InvalidFileError) as e:
+            save_columns_to_db(file, token=token, batch_size=3)
+
+        self.assertIn('token', e.exception.errors)
+        self.assertEqual(Assembly.objects.count(), 0)
@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from bom.benchmarks.generator import bom_csv, generate_bom_rows, mutate_bom_rows
+from bom.diff import diff_trees, keyed_nodes
+from bom.services import save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+
+def _edited_file(*replacements) -> SimpleUploadedFile:
+    content = open(CORRECT_FILE, encoding="utf-8").read()
+    for old, new in replacements:
+        content = content.replace(old, new)
+    return SimpleUploadedFile("file.csv", content.encode(), content_type="text/csv")
+
+
+class TestTreeDiff(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.old, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+    def test_same_trees(self):
+        new, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+        self.assertEqual(diff_trees(self.old, new),
+                         {'added': [], 'removed': [], 'quantity_changed': [], 'price_changed': []})
+
+    def test_changed_tree(self):
+        new, = save_to_db(_edited_file(
+            ("230-0001-00,leather rectange,,EA,MTS,0.55", "230-0001-00,leather rectange,,EA,MTS,0.6"),
+            ("\n2,210-0101-00,somethingelse,,EA,MTS,1.12,0.6", ""),
+            ("2,750-0001-01,covered headmount,,EA,MTS,1,\n", "2,750-0001-01,covered headmount,,EA,MTS,1,\n"
+                                                           "3,400-0001-00,plastic structure headmount,,EA,MTS,2,0.32\n"
+                                                           "3,777-0001-00,screw,,EA,BUY,4,0.01\n"),
+        ))
+
+        diff = diff_trees(self.old, new)
+
+        # first 400-0001-00 of new revision is matched with the only one of old revision
+        self.assertEqual([(node['identifiers'], node['quantity']) for node in diff['added']], [
+            (['800-0001-00', '750-0001-01', '777-0001-00'], Decimal('4.000')),
+            (['800-0001-00', '750-0001-01', '400-0001-00'], Decimal('1.000')),
+        ])
+        self.assertEqual([(node['identifier'], node['id']) for node in diff['removed']],
+                         [('210-0101-00', self.old.pk + 6)])
+        self.assertEqual([(node['identifier'], node['old_quantity'], node['new_quantity'])
+                          for node in diff['quantity_changed']],
+                         [('400-0001-00', Decimal('1.000'), Decimal('2.000')),
+                          ('230-0001-00', Decimal('0.550'), Decimal('0.600'))])
+
+    def test_removed_subtree_is_reported_by_its_top_node(self):
+        new, = save_to_db(_edited_file(("2,750-0001-01", "2,750-0002-01")))
+
+        diff = diff_trees(self.old, new)
+
+        self.assertEqual([(node['identifier'], node['descendants']) for node in diff['removed']],
+                         [('750-0001-01', 3)])
+        self.assertEqual([(node['identifier'], node['descendants']) for node in diff['added']],
+                         [('750-0002-01', 3)])
+
+    def test_diff_same_as_comparison_of_all_nodes(self):
+        rows = list(generate_bom_rows(800, seed=9))
+        old, = save_to_db(SimpleUploadedFile("old.csv", bom_csv(rows)))
+        new, = save_to_db(SimpleUploadedFile("new.csv", bom_csv(mutate_bom_rows(rows, 20, seed=9))))
+        old_nodes = {node.key: node for node in keyed_nodes(old, 100)}
+        new_nodes = {node.key: node for node in keyed_nodes(new, 100)}
+
+        diff = diff_trees(old, new, chunk_size=100)
+
+        added = {key for key in new_nodes.keys() - old_nodes.keys()}
+        removed = {key for key in old_nodes.keys() - new_nodes.keys()}
+        changed = {new_nodes[key].pk for key in new_nodes.keys() & old_nodes.keys()
+                   if new_nodes[key].quantity != old_nodes[key].quantity}
+        self.assertEqual(sum(node['descendants'] + 1 for node in diff['added']), len(added))
+        self.assertEqual(sum(node['descendants'] + 1 for node in diff['removed']), len(removed))
+        self.assertEqual({node['id'] for node in diff['quantity_changed']}, changed)
+        self.assertTrue(added and removed and changed)
+
+    def test_diff_api(self):
+        new, = save_to_db(_edited_file(("2,210-0101-00,somethingelse,,EA,MTS,1.12",
+                                        "2,210-0101-00,somethingelse,,EA,MTS,2")))
+
+        with self.assertNumQueries(6):
+            res = self.client.get(reverse('bom:item_diff', kwargs={'id': new.pk, 'base_id': self.old.pk}))
+        res1 = self.client.get(reverse('bom:item_diff', kwargs={'id': new.pk, 'base_id': 1000}))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['quantity_changed'], [
+            {'id': new.pk + 6, 'identifier': '210-0101-00', 'name': 'somethingelse',
+             'identifiers': ['800-0001-00', '210-0101-00'], 'old_id': self.old.pk + 6,
+             'old_quantity': '1.120', 'new_quantity': '2.000'}])
+        self.assertEqual(res1.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.reference import dump_explode
+from bom.costs import COST_QUANTUM
+from bom.explosion import explode
+from bom.models import Assembly
+from bom.services import save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+
+def _quantities(groups):
+    return {part['identifier']: part['quantity'] for group in groups for part in group['parts']}
+
+
+class TestExplosion(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+    def test_explode_sums_leaf_quantities(self):
+        with self.assertNumQueries(2):
+            groups = explode(self.root, units=10)
+
+        self.assertEqual(len(groups), 1)
+        self.assertEqual((groups[0]['procurement_type'], groups[0]['unit']), ('MTS', 'EA'))
+        self.assertEqual(_quantities(groups), {'210-0101-00': Decimal('11.2'), '230-0001-00': Decimal('5.5'),
+                                               '240-0001-00': Decimal('10'), '400-0001-00': Decimal('10')})
+        self.assertEqual(groups[0]['cost'], Decimal('14.32000'))
+
+    def test_explode_subassembly_ignores_its_own_quantity(self):
+        node = Assembly.objects.get(component__identifier="750-0001-01")
+        node.quantity = 3
+        node.save()
+
+        self.assertEqual(_quantities(explode(node)), {'230-0001-00': Decimal('0.55'), '240-0001-00': Decimal('1'),
+                                                      '400-0001-00': Decimal('1')})
+        self.assertEqual(_quantities(explode(self.root))['240-0001-00'], Decimal('3'))
+
+    def test_explode_same_as_flattened_dump(self):
+        root, = save_to_db(generated_file(500, max_depth=10, seed=4))
+
+        groups = explode(root, units=3)
+        quantities = {(part['identifier'], part['name']): part['quantity']
+                      for group in groups for part in group['parts']}
+
+        self.assertEqual(quantities, {key: quantity.quantize(COST_QUANTUM)
+                                      for key, quantity in dump_explode(root, units=3).items()})
+        self.assertEqual([(group['procurement_type'], group['unit']) for group in groups],
+                         sorted({(group['procurement_type'], group['unit']) for group in groups}))
+
+    def test_explosion_api(self):
+        url = reverse('bom:item_explosion', kwargs={'id': self.root.pk})
+
+        res = self.client.get(url, {'units': 2})
+        res1 = self.client.get(url, {'units': 2, 'format': 'csv'})
+        res2 = self.client.get(url, {'units': 0})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['units'], '2.000')
+        self.assertEqual(res.data['groups'][0]['parts'][0]['quantity'], '2.24000')
+        self.assertEqual(res1['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(res1.content.decode().splitlines()[:2], [
+            "identifier,name,category,procurement_type,unit,price,quantity,cost",
+            "210-0101-00,somethingelse,,MTS,EA,0.60,2.24000,1.34400",
+        ])
+        self.assertEqual(res2.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_explosion_api_isnt_answered_with_details_of_item(self):
+        details = self.client.get(reverse('bom:item_details', kwargs={'id': self.root.pk}))
+        url = reverse('bom:item_explosion', kwargs={'id': self.root.pk})
+
+        res = self.client.get(url)
+        res1 = self.client.get(url, HTTP_IF_NONE_MATCH=details['ETag'])
+
+        self.assertNotEqual(res['ETag'], details['ETag'])
+        self.assertEqual(res.json()['groups'][0]['parts'][0]['quantity'], '1.12000')
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
@@ -0,0 +1,185 @@
+import importlib.util
+import io
+import json
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.reverse import reverse
+
+from bom.benchmarks.generator import HEADER, generate_bom_rows
+from bom.importers import COLUMNS, JSONLinesImporter, TSVImporter, XLSXImporter, file_rows, get_importer
+from bom.models import Assembly, ImportJob
+from bom.services import InvalidFileError, save_to_db, validate_file, validate_file_with_token
+from bom.tests.test_services import CORRECT_FILE
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _correct_rows() -> list:
+    with open(CORRECT_FILE, encoding="utf-8") as file:
+        return [line.split(",") for line in file.read().splitlines()[1:]]
+
+
+def _tsv_file(rows: list) -> SimpleUploadedFile:
+    content = "\n".join("\t".join(row) for row in [HEADER] + rows)
+    return SimpleUploadedFile("file.tsv", content.encode(), content_type="text/tab-separated-values")
+
+
+def _jsonl_file(rows: list) -> SimpleUploadedFile:
+    content = "\n".join(json.dumps(dict(zip(COLUMNS, row))) for row in rows)
+    return SimpleUploadedFile("file.jsonl", content.encode(), content_type="application/jsonl")
+
+
+def _stored_rows() -> list:
+    return list(Assembly.objects.order_by('path').values_list(
+        'path', 'depth', 'numchild', 'quantity', 'component__identifier', 'component__price'))
+
+
+class TestImporterRegistry(TestCase):
+    def test_importer_is_found_by_content_type_then_by_extension(self):
+        self.assertIsInstance(get_importer(SimpleUploadedFile("file", b"", content_type=XLSX)), XLSXImporter)
+        self.assertIsInstance(get_importer(SimpleUploadedFile("file.TSV", b"", content_type="application/vnd.ms-excel")),
+                              TSVImporter)
+        self.assertIsInstance(get_importer(SimpleUploadedFile("file.ndjson", b"")), JSONLinesImporter)
+        self.assertIsNone(get_importer(SimpleUploadedFile("file", b"", content_type="application/octet-stream")))
+
+    def test_file_of_unknown_format_is_rejected(self):
+        file = SimpleUploadedFile("file.txt", open(CORRECT_FILE, "rb").read(), content_type="text/plain")
+
+        res = self.client.post(reverse('bom:file_upload'), {'file': file})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json(), {'file': ["Format of file is not known, upload it with content type or extension "
+                                               "of one of: csv, tsv, json lines, xlsx, parquet, arrow."]})
+        self.assertIn('file_format', validate_file(file))
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_format_without_installed_package_is_rejected(self):
+        file = SimpleUploadedFile("file.xlsx", b"PK", content_type=XLSX)
+
+        with mock.patch("bom.importers.importlib.import_module", side_effect=ImportError):
+            rows, errors = file_rows(file)
+            with self.assertRaises(InvalidFileError) as e:
+                save_to_db(file)
+
+        self.assertEqual(list(rows), [])
+        self.assertEqual(errors, {'file_format': "Reading xlsx files requires openpyxl package."})
+        self.assertEqual(e.exception.errors, errors)
+
+
+class TestTextImporters(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_tsv_file_is_saved_like_csv_file(self):
+        with open(CORRECT_FILE, "rb") as file:
+            save_to_db(SimpleUploadedFile("file.csv", file.read(), content_type="text/csv"))
+        expected = _stored_rows()
+        Assembly.objects.all().delete()
+
+        save_to_db(_tsv_file(_correct_rows()))
+
+        self.assertEqual(_stored_rows(), expected)
+
+    def test_tsv_file_is_validated_in_parallel(self):
+        rows = list(generate_bom_rows(2_000, seed=2))
+        rows[700][6] = "abc"
+        rows[1200][0] = "7"
+
+        serial = validate_file(_tsv_file(rows))
+        with override_settings(BOM_VALIDATION_WORKERS=2, BOM_VALIDATION_CHUNK_SIZE=300,
+                               BOM_PARALLEL_VALIDATION_MIN_SIZE=0):
+            parallel = validate_file(_tsv_file(rows))
+
+        self.assertEqual(list(serial), ['row_700', 'row_1200'])
+        self.assertEqual(parallel, serial)
+
+    def test_json_lines_with_objects_and_arrays(self):
+        rows = _correct_rows()
+        file = _jsonl_file(rows[:3])
+        content = file.read() + ("\n" + "\n".join(json.dumps(row) for row in rows[3:]) + "\n\n").encode()
+
+        parsed, errors = file_rows(SimpleUploadedFile("file.jsonl", content))
+
+        self.assertEqual(errors, {})
+        self.assertEqual(list(parsed), rows)
+
+    def test_invalid_json_lines_are_reported_as_rows(self):
+        rows = _correct_rows()
+        file = _jsonl_file(rows[:2])
+        content = file.read() + b'\n{"level": 2, "item_number": "210-0101-00"\n"text"'
+
+        errors = validate_file(SimpleUploadedFile("file.jsonl", content))
+
+        self.assertEqual(list(errors), ['row_2', 'row_3'])
+        self.assertIn("Each item should have 8 elements.", errors['row_2']['verbose:'])
+
+    def test_validated_json_lines_file_is_saved_with_token(self):
+        results, token = validate_file_with_token(_jsonl_file(_correct_rows()))
+
+        root, = save_to_db(_jsonl_file(_correct_rows()), token=token)
+
+        self.assertEqual(results, {})
+        self.assertEqual(root.get_descendant_count(), 6)
+
+
+@skipUnless(importlib.util.find_spec("openpyxl"), "openpyxl is not installed")
+class TestXLSXImporter(TestCase):
+    def _xlsx_file(self, rows: list) -> SimpleUploadedFile:
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(HEADER)
+        for row in rows:
+            sheet.append([float(value) if idx in (0, 6, 7) and value else value or None
+                          for idx, value in enumerate(row)])
+        content = io.BytesIO()
+        workbook.save(content)
+        return SimpleUploadedFile("file.xlsx", content.getvalue(), content_type=XLSX)
+
+    def test_xlsx_file_is_saved_like_csv_file(self):
+        rows = _correct_rows()
+
+        parsed, errors = file_rows(self._xlsx_file(rows))
+        root, = save_to_db(self._xlsx_file(rows))
+
+        self.assertEqual(errors, {})
+        self.assertEqual([row[:2] + row[6:] for row in parsed], [row[:2] + row[6:] for row in rows])
+        self.assertEqual(root.get_descendant_count(), 6)
+
+
+@skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestArrowImporters(TestCase):
+    def _table(self, rows: list):
+        import pyarrow
+        columns = list(zip(*rows))
+        return pyarrow.table({
+            name: [float(value) if value else None for value in column] if name in ("quantity", "Price by Unit")
+            else [int(value) for value in column] if name == "level" else list(column)
+            for name, column in zip(COLUMNS, columns)
+        })
+
+    def test_parquet_file_is_read_by_row_groups(self):
+        import pyarrow.parquet
+        rows = list(generate_bom_rows(500, seed=1))
+        content = io.BytesIO()
+        pyarrow.parquet.write_table(self._table(rows), content, row_group_size=100)
+
+        parsed, errors = file_rows(SimpleUploadedFile("file.parquet", content.getvalue()))
+
+        self.assertEqual(errors, {})
+        self.assertEqual(validate_file(SimpleUploadedFile("file.parquet", content.getvalue())), {})
+        self.assertEqual([row[:6] for row in parsed], [row[:6] for row in rows])
+
+    def test_arrow_file_without_required_columns_is_rejected(self):
+        import pyarrow.ipc
+        table = self._table(_correct_rows()).drop(["quantity"])
+        content = io.BytesIO()
+        with pyarrow.ipc.new_file(content, table.schema) as writer:
+            writer.write_table(table)
+
+        errors = validate_file(SimpleUploadedFile("file.arrow", content.getvalue()))
+
+        self.assertEqual(errors, {'file_structure': "File doesn't have columns: quantity."})
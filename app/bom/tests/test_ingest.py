@@ -0,0 +1,113 @@
+from unittest import skipIf, skipUnless
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from bom.benchmarks.generator import bom_csv, generate_bom_rows, mutate_bom_rows
+from bom.benchmarks.reference import treebeard_save_to_db
+from bom.columnar import save_columns_to_db
+from bom.ingest import BulkCreateIngest, CopyIngest, _copy_value, get_ingest
+from bom.models import Assembly, AssemblyRollup, Component, ComponentUsage
+from bom.patch import patch_tree
+from bom.services import save_to_db
+
+BACKENDS = ("bom.ingest.BulkCreateIngest", "bom.ingest.CopyIngest")
+IS_POSTGRESQL = connection.vendor == "postgresql"
+
+
+def _stored_rows() -> list:
+    return list(Assembly.objects.order_by('path').values_list(
+        'path', 'depth', 'numchild', 'quantity', 'component__identifier', 'component__name', 'component__price'))
+
+
+def _indexes() -> tuple:
+    return (sorted(AssemblyRollup.objects.values_list('assembly__path', 'cost', 'descendants', 'signature')),
+            sorted(ComponentUsage.objects.values_list('assembly__path', 'component__identifier', 'quantity')))
+
+
+def _file(rows: list) -> SimpleUploadedFile:
+    return SimpleUploadedFile("generated.csv", bom_csv(rows), content_type="text/csv")
+
+
+class TestCopyValue(SimpleTestCase):
+    def test_special_characters_are_escaped(self):
+        self.assertEqual(_copy_value(None), "\\N")
+        self.assertEqual(_copy_value("a\tb\\c\nd\re"), "a\\tb\\\\c\\nd\\re")
+        self.assertEqual(_copy_value(12), "12")
+
+
+class TestIngestParity(TestCase):
+    """ Imports give the same rows and indexes with every ingest backend, with PostgreSQL (SQL_ENGINE)
+        CopyIngest writes with COPY, with SQLite it falls back to bulk_create.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.rows = list(generate_bom_rows(600, max_depth=5, components=150, seed=4))
+        # texts which have to be escaped in COPY
+        self.rows[3][2] = 'tab\tback\\slash "quoted"'
+
+    def _imported(self, save) -> tuple:
+        with self.subTest(save=save.__name__):
+            save(_file(self.rows))
+            save(_file(self.rows[:200]))
+            result = _stored_rows(), _indexes()
+            Assembly.objects.all().delete()
+            Component.objects.all().delete()
+            return result
+
+    def test_imports_write_the_same_rows_with_every_backend(self):
+        expected_rows = self._imported(treebeard_save_to_db)[0]
+
+        for backend in BACKENDS:
+            with override_settings(BOM_INGEST_BACKEND=backend):
+                results = [self._imported(save) for save in (save_to_db, save_columns_to_db)]
+
+            self.assertEqual([rows for rows, _ in results], [expected_rows] * 2)
+            self.assertEqual(results[1][1], results[0][1])
+
+    def test_roots_have_ids(self):
+        for backend in BACKENDS:
+            with override_settings(BOM_INGEST_BACKEND=backend):
+                roots = save_to_db(_file(self.rows))
+
+            self.assertEqual([root.pk for root in roots],
+                             list(Assembly.objects.filter(depth=1).order_by('path').values_list('pk', flat=True)))
+            Assembly.objects.all().delete()
+
+    def test_patch_writes_the_same_rows_with_every_backend(self):
+        revision = mutate_bom_rows(self.rows, 30, seed=1)
+
+        results = []
+        for backend in BACKENDS:
+            with override_settings(BOM_INGEST_BACKEND=backend):
+                root, = save_to_db(_file(self.rows))
+                patch_tree(_file(revision), root)
+            results.append((_stored_rows(), _indexes()))
+            Assembly.objects.all().delete()
+
+        self.assertEqual(results[1], results[0])
+
+
+class TestGetIngest(TestCase):
+    @skipIf(IS_POSTGRESQL, "COPY is supported by PostgreSQL")
+    def test_copy_falls_back_to_bulk_create(self):
+        with override_settings(BOM_INGEST_BACKEND="bom.ingest.CopyIngest"):
+            self.assertEqual(type(get_ingest(100)), BulkCreateIngest)
+
+    @skipUnless(IS_POSTGRESQL, "COPY needs PostgreSQL")
+    def test_copy_is_used_in_transactions(self):
+        with override_settings(BOM_INGEST_BACKEND="bom.ingest.CopyIngest"):
+            self.assertEqual(type(get_ingest(100)), CopyIngest)
+
+    @skipUnless(IS_POSTGRESQL, "COPY needs PostgreSQL")
+    def test_copied_components_get_ids(self):
+        components = [Component(identifier=f"{idx}", name="a\tb\nc", category="", unit="EA",
+                                procurement_type="MTS", price=0.125) for idx in range(3)]
+
+        CopyIngest(100).add_components(components)
+
+        self.assertEqual([(component.pk, component.name) for component in components],
+                         list(Component.objects.order_by('identifier').values_list('pk', 'name')))
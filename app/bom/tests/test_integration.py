@@ -1,17 +1,24 @@
+import tempfile
 from collections import OrderedDict
 from decimal import Decimal
+from unittest import mock
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.reverse import reverse
 
-from bom.models import Assembly
+from bom.models import Assembly, Component, ImportJob
+from bom.services import save_to_db
 from bom.tests.test_services import CORRECT_FILE, INCORRECT_FILE1, INCORRECT_FILE2
 from bom.tests.utils import _in_memory_file
 
 
+@override_settings(BOM_IMPORT_BACKEND="bom.jobs.SyncBackend", MEDIA_ROOT=tempfile.mkdtemp())
 class TestFileAPI(TestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.correct_file = _in_memory_file(file_path=CORRECT_FILE)
         self.incorrect_file1 = _in_memory_file(file_path=INCORRECT_FILE1)
         self.incorrect_file2 = _in_memory_file(file_path=INCORRECT_FILE2)
@@ -42,8 +49,49 @@ class TestFileAPI(TestCase):
 
         assembly = Assembly.objects.all()
         self.assertEqual(assembly.count(), 7)
-        self.assertEqual(res.data, "Uploaded successfully")
-        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(res.data['status'], ImportJob.FINISHED)
+        self.assertEqual(res.data['rows_processed'], 7)
+        self.assertEqual(res.data['root'], assembly.first().pk)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_file_upload_deduplicated(self):
+        res = self.client.post(reverse('bom:file_upload'), {'file': self.correct_file})
+        res1 = self.client.post(reverse('bom:file_upload'), {'file': _in_memory_file(file_path=CORRECT_FILE),
+                                                             'deduplicate': True})
+
+        self.assertEqual(res1.data['status'], ImportJob.FINISHED)
+        self.assertEqual(res1.data['root'], res.data['root'])
+        self.assertEqual(Assembly.objects.count(), 7)
+
+    def test_file_upload_patches_target(self):
+        res = self.client.post(reverse('bom:file_upload'), {'file': self.correct_file})
+        content = open(CORRECT_FILE, encoding="utf-8").read().replace(",0.55,", ",0.6,")
+        res1 = self.client.post(reverse('bom:file_upload'), {'file': SimpleUploadedFile("file.csv", content.encode()),
+                                                             'target': res.data['root']})
+
+        self.assertEqual(res1.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res1.data['status'], ImportJob.FINISHED)
+        self.assertEqual(res1.data['root'], res.data['root'])
+        self.assertEqual(res1.data['changes'], {'inserted': 0, 'updated': 1, 'moved': 0, 'deleted': 0})
+        self.assertEqual(Assembly.objects.count(), 7)
+
+    def test_patched_target_can_not_be_deduplicated(self):
+        res = self.client.post(reverse('bom:file_upload'), {'file': self.correct_file})
+        res1 = self.client.post(reverse('bom:file_upload'), {'file': _in_memory_file(file_path=CORRECT_FILE),
+                                                             'target': res.data['root'], 'deduplicate': True})
+
+        self.assertEqual(res1.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_import_job_api_view(self):
+        res = self.client.post(reverse('bom:file_upload'), {'file': self.correct_file})
+        res1 = self.client.get(res['Location'])
+
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data['id'], res.data['id'])
+        self.assertEqual(res1.data['status'], ImportJob.FINISHED)
+        self.assertEqual(res1.data['errors'], {})
+        self.assertGreater(res1.data['rows_per_second'], 0)
+        self.assertFalse(ImportJob.objects.get().file)
 
     def test_file_upload_successful_not_successful(self):
         res = self.client.post(reverse("bom:file_validate"), {'file': self.incorrect_file1})
@@ -59,6 +107,38 @@ class TestFileAPI(TestCase):
                                      'row_4': {'row_number': 4, 'verbose:': ['Field required: level']}})
         self.assertEqual(res1.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_file_upload_with_validation_token(self):
+        res = self.client.post(reverse("bom:file_validate"), {'file': self.correct_file})
+        token = res['Validation-Token']
+        self.correct_file.seek(0)
+
+        with mock.patch("bom.services.validated_line") as validated_line:
+            res1 = self.client.post(reverse('bom:file_upload'), {'file': self.correct_file, 'token': token})
+
+        validated_line.assert_not_called()
+        self.assertEqual(res1.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res1.data['status'], ImportJob.FINISHED)
+        self.assertEqual(Assembly.objects.count(), 7)
+
+    def test_file_upload_with_token_of_other_file(self):
+        res = self.client.post(reverse("bom:file_validate"), {'file': self.correct_file})
+        res1 = self.client.post(reverse('bom:file_upload'),
+                                {'file': self.incorrect_file2, 'token': res['Validation-Token']})
+
+        self.assertEqual(res1.data['status'], ImportJob.FAILED)
+        self.assertEqual(res1.data['errors']['token'], "Validation token doesn't match uploaded file.")
+        self.assertEqual(Assembly.objects.count(), 0)
+
+    def test_file_upload_of_invalid_file_fails_with_validation_errors(self):
+        res = self.client.post(reverse('bom:file_upload'), {'file': self.incorrect_file2})
+
+        self.assertEqual(res.data['status'], ImportJob.FAILED)
+        self.assertEqual(res.data['errors'], {'row_0': {'row_number': 0, 'verbose:': ['Field required: identifier']},
+                                    'row_1': {'row_number': 1, 'verbose:': ['Field required: quantity']},
+                                    'row_2': {'row_number': 2, 'verbose:': ['Field required: name']},
+                                    'row_4': {'row_number': 4, 'verbose:': ['Field required: level']}})
+        self.assertEqual(Assembly.objects.count(), 0)
+
     def test_get_item_details_api_view(self):
         self.client.post(reverse('bom:file_upload'), {'file': self.correct_file})
         res1 = self.client.get(reverse('bom:item_details', kwargs={'id': 1}))
@@ -90,3 +170,144 @@ class TestFileAPI(TestCase):
             [('identifier', '999-0001-00'), ('name', 'headphonesz'), ('category', ''), ('unit', 'EA'),
              ('procurement_type', 'MTS'), ('price', '0.00')]), 'depth': 1, 'quantity': '1.000'})
 
+
+class TestItemCaching(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        self.other_root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        self.url = reverse('bom:item_details', kwargs={'id': self.root.pk})
+
+    def test_item_details_not_modified(self):
+        res = self.client.get(self.url)
+
+        with self.assertNumQueries(1):
+            res1 = self.client.get(self.url, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res1['ETag'], res['ETag'])
+
+    def test_item_details_served_from_cache(self):
+        res = self.client.get(self.url)
+
+        with self.assertNumQueries(1):
+            res1 = self.client.get(self.url)
+
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data, res.data)
+
+    def test_write_under_root_changes_only_its_etag(self):
+        other_url = reverse('bom:item_details', kwargs={'id': self.other_root.pk})
+        res, other_res = self.client.get(self.url), self.client.get(other_url)
+
+        node = self.root.get_children()[0]
+        node.quantity = 2
+        node.save()
+        res1 = self.client.get(self.url, HTTP_IF_NONE_MATCH=res['ETag'])
+        other_res1 = self.client.get(other_url, HTTP_IF_NONE_MATCH=other_res['ETag'])
+
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res1['ETag'], res['ETag'])
+        self.assertEqual(res1.data['total_cost'], '2.86400')
+        self.assertEqual(other_res1.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_component_change_changes_etags_of_trees_using_it(self):
+        res = self.client.get(self.url)
+
+        component = Component.objects.get(identifier="240-0001-00")
+        component.name = "soft foam"
+        component.save()
+        res1 = self.client.get(self.url, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
+
+    def test_item_list_etag_changes_after_upload(self):
+        res = self.client.get(reverse('bom:item_list'))
+        res1 = self.client.get(reverse('bom:item_list'), HTTP_IF_NONE_MATCH=res['ETag'])
+        save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        res2 = self.client.get(reverse('bom:item_list'), HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res1.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res2.data), 3)
+
+    def test_cached_links_belong_to_host_of_request(self):
+        url = reverse('bom:item_list')
+
+        res = self.client.get(url, {'page_size': 1})
+        res1 = self.client.get(url, {'page_size': 1}, HTTP_HOST="api.example.com", secure=True)
+
+        self.assertTrue(res.data['next'].startswith("http://testserver/"))
+        self.assertTrue(res1.data['next'].startswith("https://api.example.com/"))
+        self.assertEqual(res1['ETag'], res['ETag'])
+
+    def test_missing_item(self):
+        res = self.client.get(reverse('bom:item_details', kwargs={'id': 1000}))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestItemTreeAPI(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        self.node = Assembly.objects.get(component__identifier="800-0001-00")
+
+    def _get(self, item, **params):
+        return self.client.get(reverse('bom:item_details', kwargs={'id': item.pk}), params)
+
+    def test_max_depth(self):
+        with self.assertNumQueries(3):
+            res = self._get(self.root, max_depth=1)
+
+        child, = res.data['children']
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['total_cost'], '1.43200')
+        self.assertEqual(res.data['numchild'], 1)
+        self.assertEqual(child['id'], self.node.pk)
+        self.assertEqual(child['numchild'], 2)
+        self.assertNotIn('children', child)
+
+    def test_fields_projection(self):
+        res = self._get(self.root, fields="identifier,price")
+
+        self.assertEqual(res.data['assembly'], {'component': {'identifier': '999-0001-00', 'price': Decimal('0.00')}})
+        self.assertEqual(res.data['total_cost'], '1.43200')
+
+    def test_unknown_fields(self):
+        res = self._get(self.root, fields="identifier,path")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+    def test_children(self):
+        with self.assertNumQueries(3):
+            res = self._get(self.node, children='true', fields="identifier,quantity")
+
+        self.assertEqual([(child['component'], child['quantity'], child['numchild'], child['cost'])
+                          for child in res.data],
+                         [({'identifier': '750-0001-01'}, '1.000', 3, Decimal('0.76000')),
+                          ({'identifier': '210-0101-00'}, '1.120', 0, Decimal('0.67200'))])
+
+    def test_children_cursor_pagination(self):
+        with self.assertNumQueries(3):
+            res = self._get(self.node, children='true', page_size=1)
+        with self.assertNumQueries(3):
+            res1 = self.client.get(res.data['next'])
+
+        self.assertEqual([child['component']['identifier'] for child in res.data['results']], ['750-0001-01'])
+        self.assertEqual([child['component']['identifier'] for child in res1.data['results']], ['210-0101-00'])
+        self.assertIsNone(res1.data['next'])
+
+    def test_item_list_cursor_pagination(self):
+        save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse('bom:item_list'), {'page_size': 1, 'fields': 'name'})
+        res1 = self.client.get(res.data['next'])
+
+        self.assertEqual([item['id'] for item in res.data['results'] + res1.data['results']],
+                         list(Assembly.objects.filter(depth=1).values_list('pk', flat=True)))
+        self.assertEqual(res.data['results'][0]['component'], {'name': 'headphonesz'})
+        self.assertNotIn('quantity', res.data['results'][0])
@@ -0,0 +1,65 @@
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from bom.jobs import ThreadPoolBackend, job_progress, submit_import
+from bom.models import Assembly, ImportJob
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+
+@override_settings(BOM_IMPORT_BACKEND="bom.jobs.SyncBackend", MEDIA_ROOT=tempfile.mkdtemp())
+class TestSyncImportJobs(TestCase):
+    def test_failed_job_keeps_unexpected_error(self):
+        with mock.patch("bom.jobs.save_to_db", side_effect=RuntimeError("database is gone")):
+            job = submit_import(_in_memory_file(file_path=CORRECT_FILE))
+
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.errors, {"detail": "database is gone"})
+        self.assertIsNotNone(job.finished_at)
+
+    def test_stored_file_is_read_in_format_found_at_upload(self):
+        rows = open(CORRECT_FILE, encoding="utf-8").read().replace(",", "\t")
+        file = SimpleUploadedFile("bom", rows.encode(), content_type="text/tab-separated-values")
+
+        job = submit_import(file)
+
+        self.assertEqual(job.status, ImportJob.FINISHED)
+        self.assertEqual(job.content_type, "text/tab-separated-values")
+        self.assertEqual(Assembly.objects.count(), 7)
+
+    def test_progress_of_running_job_is_read_from_cache(self):
+        job = ImportJob.objects.create(status=ImportJob.RUNNING)
+        cache.set(f"bom:job:{job.pk}:progress", 3000)
+
+        self.assertEqual(job_progress(job), 3000)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestThreadPoolBackend(TransactionTestCase):
+    def test_job_is_imported_in_worker_thread(self):
+        backend = ThreadPoolBackend(max_workers=1)
+
+        with mock.patch("bom.jobs.get_backend", return_value=backend):
+            job = submit_import(_in_memory_file(file_path=CORRECT_FILE))
+        backend._executor.shutdown(wait=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FINISHED)
+        self.assertEqual(job.rows_processed, 7)
+        self.assertEqual(Assembly.objects.count(), 7)
+
+
+@override_settings(BOM_IMPORT_BACKEND="bom.jobs.SyncBackend", MEDIA_ROOT=tempfile.mkdtemp(), BOM_COLUMNAR_IMPORT=True)
+class TestColumnarImportJobs(TestCase):
+    def test_file_is_imported_with_columnar_parser(self):
+        with mock.patch("bom.jobs.save_to_db") as save_to_db:
+            job = submit_import(_in_memory_file(file_path=CORRECT_FILE))
+
+        save_to_db.assert_not_called()
+        self.assertEqual(job.status, ImportJob.FINISHED)
+        self.assertEqual(job.rows_processed, 7)
+        self.assertEqual(Assembly.objects.count(), 7)
@@ -0,0 +1,111 @@
+import tempfile
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.reverse import reverse
+
+from bom.jobs import submit_import
+from bom.metrics import IMPORT_JOBS, IMPORT_PHASE_SECONDS, REQUEST_QUERIES, REQUEST_SECONDS, Histogram, \
+    ImportSpans, import_spans, span, timed
+from bom.models import ImportJob
+from bom.services import save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+
+class TestHistogram(SimpleTestCase):
+    def test_buckets_are_rendered_cumulatively(self):
+        histogram = Histogram("test_seconds", "Test.", ("view",), buckets=(0.1, 1), registry=[])
+        histogram.observe(0.05, ('a"b',))
+        histogram.observe(0.5, ('a"b',))
+        histogram.observe(2, ('a"b',))
+
+        self.assertEqual(histogram.render().splitlines(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{view="a\\"b",le="1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 3',
+            'test_seconds_sum{view="a\\"b"} 2.55',
+            'test_seconds_count{view="a\\"b"} 3',
+        ])
+
+
+class TestImportSpans(SimpleTestCase):
+    def test_nothing_is_measured_outside_import(self):
+        items = iter([1, 2])
+
+        with span("insert"):
+            self.assertIs(timed("decode", items), items)
+
+    def test_time_of_nested_phases_is_not_counted_in_outer_ones(self):
+        def slow(items):
+            for item in items:
+                with span("decode"):
+                    sum(range(20_000))
+                yield item
+
+        with import_spans("test") as spans:
+            with span("insert"):
+                items = list(timed("validate", slow(range(250)), batch_size=100))
+
+        self.assertIsInstance(spans, ImportSpans)
+        self.assertEqual(items, list(range(250)))
+        self.assertEqual(set(spans.seconds), {"decode", "validate", "insert"})
+        self.assertGreater(spans.seconds["decode"], 5 * spans.seconds["validate"])
+        self.assertGreater(spans.seconds["decode"], 5 * spans.seconds["insert"])
+        self.assertEqual(IMPORT_PHASE_SECONDS.count(("test", "decode")), 1)
+
+
+@override_settings(BOM_IMPORT_BACKEND="bom.jobs.SyncBackend", MEDIA_ROOT=tempfile.mkdtemp())
+class TestImportMetrics(TestCase):
+    def test_phases_of_import_jobs_are_recorded(self):
+        for columnar in (False, True):
+            with self.subTest(columnar=columnar), override_settings(BOM_COLUMNAR_IMPORT=columnar):
+                kind = "columnar" if columnar else "rows"
+                counts = {phase: IMPORT_PHASE_SECONDS.count((kind, phase))
+                          for phase in ("decode", "validate", "resolve", "insert", "index")}
+                finished = IMPORT_JOBS.value((kind, ImportJob.FINISHED))
+
+                job = submit_import(_in_memory_file(file_path=CORRECT_FILE))
+
+                self.assertEqual(job.status, ImportJob.FINISHED)
+                self.assertEqual(IMPORT_JOBS.value((kind, ImportJob.FINISHED)), finished + 1)
+                self.assertEqual({phase: IMPORT_PHASE_SECONDS.count((kind, phase)) - count
+                                  for phase, count in counts.items()},
+                                 dict.fromkeys(counts, 1))
+
+
+class TestMetricsMiddleware(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+    def test_requests_are_recorded_by_view(self):
+        ok, not_found = ("bom:item_details", "GET", "2xx"), ("bom:item_details", "GET", "4xx")
+        counts = REQUEST_SECONDS.count(ok), REQUEST_SECONDS.count(not_found)
+
+        self.client.get(reverse('bom:item_details', kwargs={'id': self.root.pk}))
+        self.client.get(reverse('bom:item_details', kwargs={'id': 1000}))
+        res = self.client.get(reverse('metrics'))
+
+        self.assertEqual((REQUEST_SECONDS.count(ok), REQUEST_SECONDS.count(not_found)), (counts[0] + 1, counts[1] + 1))
+        self.assertEqual(res['Content-Type'], "text/plain; version=0.0.4; charset=utf-8")
+        content = res.content.decode()
+        self.assertIn('ravacan_http_request_duration_seconds_count{view="bom:item_details",method="GET",status="2xx"}',
+                      content)
+        self.assertIn('# TYPE ravacan_http_request_db_queries histogram', content)
+
+    @override_settings(BOM_STREAMING_MIN_NODES=1)
+    def test_streamed_responses_are_recorded_when_sent(self):
+        labels = ("bom:item_details",)
+        count, queries = REQUEST_QUERIES.count(labels), REQUEST_QUERIES.sum(labels)
+
+        res = self.client.get(reverse('bom:item_details', kwargs={'id': self.root.pk}))
+        self.assertTrue(res.streaming)
+        self.assertEqual(REQUEST_QUERIES.count(labels), count)
+        b"".join(res.streaming_content)
+
+        self.assertEqual(REQUEST_QUERIES.count(labels), count + 1)
+        # queries of the view and of the streamed content
+        self.assertGreater(REQUEST_QUERIES.sum(labels) - queries, 2)
@@ -2,6 +2,8 @@ from decimal import Decimal
 
 from django.test import TestCase
 
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.reference import serializer_dump_bulk
 from bom.models import Assembly
 from bom.services import save_to_db
 from bom.tests.test_services import CORRECT_FILE
@@ -50,3 +52,68 @@ class TestAssemblyModel(TestCase):
                                            'unit': 'EA', 'procurement_type': 'MTS', 'price': Decimal('0.60')},
                              'quantity': Decimal('1.120')}, 'id': 7}]}]}
                          )
+
+    def test_dump_bulk_tree_same_as_serializer_based_dump(self):
+        root, = save_to_db(generated_file(500, seed=3))
+
+        for args, kwargs in (((root,), {'keep_ids': False}), ((root,), {}), ((), {})):
+            tree, expected = Assembly.dump_bulk(*args, **kwargs), serializer_dump_bulk(*args, **kwargs)
+            del tree['total_cost'], expected['total_cost']  # serializer based dump doesn't multiply quantities
+            self.assertEqual(tree, expected)
+
+    def test_dump_bulk_costs_same_as_brute_force(self):
+        root, = save_to_db(generated_file(300, max_depth=5, seed=4))
+
+        def brute_force_cost(node, item):
+            cost = 0
+            for descendant in node.get_tree(node).select_related('component'):
+                if descendant.depth == 1:
+                    continue
+                extended_quantity = descendant.quantity
+                for ancestor in descendant.get_ancestors().filter(depth__gte=item.depth):
+                    extended_quantity *= ancestor.quantity
+                cost += extended_quantity * descendant.component.price
+            return round(cost, 5)
+
+        def assert_costs(tree, node, item):
+            self.assertEqual(tree['cost'], brute_force_cost(node, item))
+            for child_tree, child in zip(tree.get('children', []), node.get_children()):
+                assert_costs(child_tree, child, item)
+
+        item = root.get_children()[1]
+        for node in (root, item):
+            tree = Assembly.dump_bulk(node, with_costs=True)
+            self.assertEqual(tree['total_cost'], str(brute_force_cost(node, node)))
+            assert_costs(tree, node, node)
+
+    def test_dump_bulk_multiplies_quantities_down_the_path(self):
+        sub_assembly = self.assemblies.get(pk=3)
+        sub_assembly.quantity = 4
+        sub_assembly.save()
+
+        tree = Assembly.dump_bulk(self.assemblies.first(), with_costs=True)
+
+        self.assertEqual(tree['total_cost'], '3.71200')  # 4 * (0.32 + 0.11 + 0.55 * 0.6) + 1.12 * 0.6
+        self.assertEqual(tree['children'][0]['children'][0]['cost'], Decimal('3.04000'))
+
+    def test_dump_bulk_runs_single_query(self):
+        root = self.assemblies.first()
+        with self.assertNumQueries(1):
+            Assembly.dump_bulk(root)
+
+    def test_dump_bulk_max_depth_uses_stored_costs(self):
+        root = self.assemblies.first()
+        with self.assertNumQueries(1):
+            tree = Assembly.dump_bulk(root, with_costs=True, max_depth=2)
+
+        node = tree['children'][0]['children'][0]
+        self.assertEqual(tree['total_cost'], Assembly.dump_bulk(root)['total_cost'])
+        self.assertEqual(node['numchild'], 3)
+        self.assertEqual(node['cost'], Decimal('0.76000'))
+        self.assertNotIn('children', node)
+
+    def test_dump_bulk_fields(self):
+        tree = Assembly.dump_bulk(self.assemblies.first(), fields=('name', 'quantity'))
+
+        self.assertEqual(tree['assembly'], {'component': {'name': 'headphonesz'}, 'quantity': Decimal('1.000')})
+        self.assertEqual(tree['total_cost'], '1.43200')
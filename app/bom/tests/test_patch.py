@@ -0,0 +1,130 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from bom.benchmarks.generator import bom_csv, generate_bom_rows, mutate_bom_rows
+from bom.diff import diff_trees
+from bom.models import Assembly, AssemblyRollup, ComponentUsage
+from bom.patch import patch_tree
+from bom.rollups import rebuild_rollups
+from bom.services import InvalidFileError, save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+from bom.usage import rebuild_usage
+
+HEADER = "level,item_number,item_name,item_category,unit_of_measure,procurement_type,quantity,Price by Unit\n"
+
+
+def _csv_file(content: str) -> SimpleUploadedFile:
+    return SimpleUploadedFile("file.csv", content.encode(), content_type="text/csv")
+
+
+def _nodes(root: Assembly) -> dict:
+    return dict(Assembly.objects.filter(path__startswith=root.path).values_list('pk', 'path'))
+
+
+def _stored_indexes(root: Assembly) -> tuple:
+    nodes = Assembly.objects.filter(path__startswith=root.path)
+    return (
+        sorted(AssemblyRollup.objects.filter(assembly__in=nodes).values_list(
+            'assembly_id', 'cost', 'descendants', 'max_depth', 'signature')),
+        sorted(ComponentUsage.objects.filter(assembly__in=nodes).values_list(
+            'assembly_id', 'component_id', 'root_id', 'quantity')),
+    )
+
+
+class TestPatchTree(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+    def test_same_file_changes_nothing(self):
+        nodes = _nodes(self.root)
+
+        changes = patch_tree(_in_memory_file(file_path=CORRECT_FILE), self.root)
+
+        self.assertEqual(changes, {'inserted': 0, 'updated': 0, 'moved': 0, 'deleted': 0})
+        self.assertEqual(_nodes(self.root), nodes)
+
+    def test_changed_nodes_are_patched_in_place(self):
+        nodes = _nodes(self.root)
+        content = open(CORRECT_FILE, encoding="utf-8").read()
+        content = content.replace("230-0001-00,leather rectange,,EA,MTS,0.55", "230-0001-00,leather rectange,,EA,MTS,0.6")
+        content = content.replace("3,240-0001-00,solid foam,,EA,MTS,1,0.11\n", "")
+        content += "\n3,777-0001-00,screw,,EA,BUY,4,0.01"
+
+        changes = patch_tree(_csv_file(content), self.root)
+
+        self.assertEqual(changes, {'inserted': 1, 'updated': 1, 'moved': 0, 'deleted': 1})
+        patched = _nodes(self.root)
+        solid_foam = self.root.pk + 4
+        del nodes[solid_foam]
+        self.assertEqual({pk: path for pk, path in patched.items() if pk in nodes}, nodes)
+        new, = save_to_db(_csv_file(content))
+        self.assertEqual(diff_trees(new, self.root),
+                         {'added': [], 'removed': [], 'quantity_changed': [], 'price_changed': []})
+        self.assertEqual(Assembly.find_problems(), ([], [], [], [], []))
+
+    def test_moved_subtree_keeps_its_nodes(self):
+        nodes = _nodes(self.root)
+        content = HEADER + ("0,999-0001-00,headphonesz,,EA,MTS,1,\n"
+                            "1,800-0001-00,Assembled headmount,,EA,MTS,1,\n"
+                            "2,210-0101-00,somethingelse,,EA,MTS,1.12,0.6\n"
+                            "1,750-0001-01,covered headmount,,EA,MTS,2,\n"
+                            "2,400-0001-00,plastic structure headmount,,EA,MTS,1,0.32\n"
+                            "2,240-0001-00,solid foam,,EA,MTS,1,0.11\n"
+                            "2,230-0001-00,leather rectange,,EA,MTS,0.55,0.6\n")
+
+        changes = patch_tree(_csv_file(content), self.root)
+
+        self.assertEqual(changes, {'inserted': 0, 'updated': 0, 'moved': 1, 'deleted': 0})
+        self.assertEqual(set(_nodes(self.root)), set(nodes))
+        moved = Assembly.objects.get(pk=self.root.pk + 2)
+        self.assertEqual((moved.depth, moved.quantity, moved.get_parent().pk), (2, 2, self.root.pk))
+        self.assertEqual(Assembly.objects.get(pk=self.root.pk + 6).path, nodes[self.root.pk + 6])
+        new, = save_to_db(_csv_file(content))
+        self.assertEqual(diff_trees(new, self.root),
+                         {'added': [], 'removed': [], 'quantity_changed': [], 'price_changed': []})
+        self.assertEqual(Assembly.find_problems(), ([], [], [], [], []))
+
+    def test_patched_tree_same_as_imported_one(self):
+        rows = list(generate_bom_rows(600, seed=4))
+        root, = save_to_db(SimpleUploadedFile("old.csv", bom_csv(rows)))
+        content = bom_csv(mutate_bom_rows(rows, 15, seed=4))
+
+        changes = patch_tree(SimpleUploadedFile("new.csv", content), root)
+
+        new, = save_to_db(SimpleUploadedFile("new.csv", content))
+        self.assertEqual(diff_trees(new, root),
+                         {'added': [], 'removed': [], 'quantity_changed': [], 'price_changed': []})
+        self.assertLessEqual(changes['inserted'] + changes['updated'] + changes['deleted'], 45)
+        self.assertEqual(Assembly.find_problems(), ([], [], [], [], []))
+        # incrementally maintained rollups and usage index are the same as rebuilt ones
+        stored = _stored_indexes(root)
+        rebuild_rollups(root.path)
+        rebuild_usage(root.path)
+        self.assertEqual(_stored_indexes(root), stored)
+        self.assertEqual(AssemblyRollup.objects.get(assembly=root).signature,
+                         AssemblyRollup.objects.get(assembly=new).signature)
+
+    def test_file_with_more_trees_is_rejected(self):
+        content = open(CORRECT_FILE, encoding="utf-8").read()
+        content += "\n" + content.split("\n", 1)[1]
+
+        with self.assertRaises(InvalidFileError) as e:
+            patch_tree(_csv_file(content), self.root)
+        self.assertIn('file_structure', e.exception.errors)
+
+    def test_tree_changed_while_file_was_read(self):
+        nodes = _nodes(self.root)
+        content = open(CORRECT_FILE, encoding="utf-8").read().replace(",0.55,", ",0.6,")
+
+        with mock.patch('bom.patch._tree_version', side_effect=[1, 2]):
+            with self.assertRaises(InvalidFileError) as e:
+                patch_tree(_csv_file(content), self.root)
+        self.assertIn('root', e.exception.errors)
+        self.assertEqual(_nodes(self.root), nodes)
+        self.assertEqual(Assembly.objects.get(pk=self.root.pk + 5).quantity, Decimal('0.550'))
@@ -0,0 +1,135 @@
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from bom.benchmarks.generator import generated_file
+from bom.models import Assembly, AssemblyRollup, Component
+from bom.rollups import rebuild_rollups
+from bom.services import save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+
+def _stored_rollups():
+    return {rollup.pk: (round(rollup.cost, 5), rollup.descendants, rollup.max_depth, rollup.signature)
+            for rollup in AssemblyRollup.objects.all()}
+
+
+class TestAssemblyRollups(TestCase):
+    def setUp(self) -> None:
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        self.other_root, = save_to_db(generated_file(200, max_depth=4, seed=5))
+
+    def assertRollupsUpToDate(self):
+        stored = _stored_rollups()
+        AssemblyRollup.objects.all().delete()
+        for root in Assembly.get_root_nodes():
+            rebuild_rollups(root.path)
+        self.assertEqual(stored, _stored_rollups())
+
+    def test_rollups_created_on_import(self):
+        self.assertEqual(AssemblyRollup.objects.count(), Assembly.objects.count())
+        self.assertEqual(_stored_rollups()[self.root.pk][:3], (Decimal('1.43200'), 6, 3))
+        self.assertEqual(_stored_rollups()[3][:3], (Decimal('0.76000'), 3, 1))
+        self.assertRollupsUpToDate()
+
+    def test_rebuild_replaces_rollups_of_existing_tree(self):
+        AssemblyRollup.objects.filter(pk=self.other_root.pk).update(cost=0)
+
+        # savepoint, delete, select, 2 inserts (limited number of query parameters of SQLite), release
+        with self.assertNumQueries(6):
+            rebuild_rollups(self.other_root.path)
+
+        self.assertRollupsUpToDate()
+
+    def test_price_change_updates_only_ancestors(self):
+        component = Component.objects.get(identifier="240-0001-00")
+        other_tree = {pk: values for pk, values in _stored_rollups().items() if pk > 7}
+
+        component.price = Decimal("1.11")
+        # old price, save, usages, versions, 4 levels, shared sub-assemblies containing the nodes
+        with self.assertNumQueries(1 + 1 + 1 + 2 + 4 * 4 + 1):
+            component.save()
+
+        self.assertEqual(_stored_rollups()[self.root.pk][0], Decimal('2.43200'))
+        self.assertEqual({pk: values for pk, values in _stored_rollups().items() if pk > 7}, other_tree)
+        self.assertRollupsUpToDate()
+
+    def test_added_node_updates_ancestors(self):
+        node = Assembly.objects.get(pk=3)
+        node.add_child(component=Component.objects.get(identifier="230-0001-00"), quantity=2)
+
+        self.assertEqual(_stored_rollups()[3][:3], (Decimal('1.96000'), 4, 1))
+        self.assertRollupsUpToDate()
+
+    def test_quantity_change_updates_ancestors(self):
+        node = Assembly.objects.get(pk=3)
+        node.quantity = 4
+        node.save()
+
+        self.assertEqual(_stored_rollups()[self.root.pk][0], Decimal('3.71200'))
+        self.assertRollupsUpToDate()
+
+    def test_moved_node_updates_old_and_new_ancestors(self):
+        node = Assembly.objects.get(pk=3)
+        node.move(self.other_root.get_children()[0], pos='last-child')
+
+        self.assertEqual(_stored_rollups()[self.root.pk][:3], (Decimal('0.67200'), 2, 2))
+        self.assertRollupsUpToDate()
+
+    def test_deleted_subtree_updates_ancestors(self):
+        Assembly.objects.get(pk=3).delete()
+
+        self.assertEqual(_stored_rollups()[self.root.pk][:3], (Decimal('0.67200'), 2, 2))
+        self.assertRollupsUpToDate()
+
+    def test_deleting_subtree_doesnt_query_its_nodes_one_by_one(self):
+        def delete_queries(node: Assembly) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                node.delete()
+            return len(queries)
+
+        small, large = delete_queries(self.root), delete_queries(self.other_root)
+
+        # 7 and 200 nodes, django deletes rows in batches of 100
+        self.assertLessEqual(large, small + 1)
+        self.assertEqual(Assembly.objects.count(), 0)
+
+    def test_deleted_component_updates_ancestors(self):
+        Component.objects.get(identifier="240-0001-00").delete()
+
+        self.assertEqual(_stored_rollups()[self.root.pk][:3], (Decimal('1.32200'), 5, 3))
+        self.assertRollupsUpToDate()
+
+    def test_migration_rolls_up_existing_trees(self):
+        stored = _stored_rollups()
+        AssemblyRollup.objects.all().delete()
+
+        import_module('bom.migrations.0004_assemblyrollup').roll_up_existing_trees(apps, None)
+
+        self.assertEqual({pk: values[:3] for pk, values in _stored_rollups().items()},
+                         {pk: values[:3] for pk, values in stored.items()})
+
+    def test_component_rename_updates_signatures(self):
+        signature = _stored_rollups()[self.root.pk][3]
+        component = Component.objects.get(identifier="240-0001-00")
+
+        component.name = "soft foam"
+        component.save()
+
+        self.assertNotEqual(_stored_rollups()[self.root.pk][3], signature)
+        self.assertRollupsUpToDate()
+
+    def test_same_subtrees_have_same_signature(self):
+        other_root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        node = Assembly.objects.get(pk=3)
+        node.quantity = 4
+        node.save()
+
+        signatures = _stored_rollups()
+        self.assertEqual(signatures[3][3], signatures[other_root.pk + 2][3])
+        self.assertNotEqual(signatures[self.root.pk][3], signatures[other_root.pk][3])
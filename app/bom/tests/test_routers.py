@@ -0,0 +1,162 @@
+import tempfile
+from copy import deepcopy
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.reverse import reverse
+
+from bom import routers
+from bom.benchmarks.generator import generated_file
+from bom.models import Assembly, AssemblyRollup, Component, ComponentUsage, TreeVersion
+from bom.routers import PIN_COOKIE, reading_from
+from bom.services import save_to_db
+from bom.signals import check_persistent_connections
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+REPLICA = "replica"
+REPLICATED_MODELS = (Component, Assembly, AssemblyRollup, ComponentUsage, TreeVersion)
+
+
+def _replicate():
+    """ Copies all rows of primary to empty replica, like replication would. """
+    for model in REPLICATED_MODELS:
+        model.objects.using(REPLICA).bulk_create(model.objects.using(DEFAULT_DB_ALIAS).all())
+
+
+@override_settings(BOM_READ_REPLICAS=[REPLICA])
+class ReplicaTestCase(TestCase):
+    """ Adds test database of replica, which is another SQLite (or PostgreSQL) test database filled by
+        the tests themselves, so that it's visible which database the data was read from.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # alias exists only while the tests run, the test runner doesn't know it
+        cls.databases = {DEFAULT_DB_ALIAS, REPLICA}
+        settings_dict = deepcopy(connections.settings[DEFAULT_DB_ALIAS])
+        settings_dict['TEST'].update(NAME=None, MIRROR=None)
+        connections.settings[REPLICA] = settings_dict
+        # replicas aren't migrated by the router, BOM_READ_REPLICAS is overridden for the tests only
+        connections[REPLICA].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].creation.destroy_test_db(connections[REPLICA].settings_dict['NAME'], verbosity=0)
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    def setUp(self) -> None:
+        cache.clear()
+        routers._health.clear()
+        self.replicated, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        _replicate()
+        # not replicated yet
+        self.new, = save_to_db(generated_file(50, seed=1))
+
+    def _item_ids(self) -> set:
+        return {item['id'] for item in self.client.get(reverse('bom:item_list')).json()}
+
+
+class TestReplicaRouting(ReplicaTestCase):
+    def test_item_endpoints_read_from_replica(self):
+        self.assertEqual(self._item_ids(), {self.replicated.pk})
+        for item, status in ((self.new, 404), (self.replicated, 200)):
+            self.assertEqual(self.client.get(reverse('bom:item_details', kwargs={'id': item.pk})).status_code, status)
+
+    @override_settings(BOM_STREAMING_MIN_NODES=1)
+    def test_streamed_trees_are_read_from_replica(self):
+        Assembly.objects.filter(depth=2, path__startswith=self.replicated.path).update(quantity=1000)
+        url = reverse('bom:item_details', kwargs={'id': self.replicated.pk})
+
+        replica_response = self.client.get(url)
+        self.client.cookies[PIN_COOKIE] = "1"
+        primary_response = self.client.get(url)
+
+        self.assertTrue(replica_response.streaming)
+        self.assertNotIn(b'"quantity": 1000', b"".join(replica_response.streaming_content).replace(b'":', b'": '))
+        self.assertIn(b'"quantity": 1000', b"".join(primary_response.streaming_content).replace(b'":', b'": '))
+
+    @override_settings(BOM_IMPORT_BACKEND="bom.jobs.SyncBackend", MEDIA_ROOT=tempfile.mkdtemp())
+    def test_clients_read_their_writes_after_upload(self):
+        res = self.client.post(reverse('bom:file_upload'), {'file': _in_memory_file(file_path=CORRECT_FILE)})
+
+        self.assertEqual(res.cookies[PIN_COOKIE]['max-age'], 15)
+        self.assertEqual(len(self._item_ids()), 3)
+        self.client.get(res['Location'])
+        self.assertIn(PIN_COOKIE, self.client.cookies)
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self._item_ids(), {self.replicated.pk})
+
+    def test_unhealthy_replicas_are_skipped(self):
+        with mock.patch('bom.routers.check_database', return_value=False) as check:
+            self.assertEqual(self._item_ids(), {self.replicated.pk, self.new.pk})
+            self.assertEqual(self._item_ids(), {self.replicated.pk, self.new.pk})
+
+        # health of replica is remembered for BOM_REPLICA_HEALTH_INTERVAL
+        check.assert_called_once_with(REPLICA)
+
+    def test_health_of_databases_is_reported(self):
+        self.assertEqual(self.client.get(reverse('health')).json(), {'databases': {'default': "ok", REPLICA: "ok"}})
+
+        with mock.patch.object(connections[REPLICA], 'cursor', side_effect=routers.DatabaseError):
+            res = self.client.get(reverse('health'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'databases': {'default': "ok", REPLICA: "unavailable"}})
+
+
+class TestReplicaRouter(ReplicaTestCase):
+    def test_writes_and_other_reads_go_to_primary(self):
+        item = Assembly.objects.using(REPLICA).get(pk=self.replicated.pk)
+
+        self.assertEqual(router.db_for_write(Assembly, instance=item), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_read(Assembly, instance=item), DEFAULT_DB_ALIAS)
+        with reading_from(REPLICA):
+            self.assertEqual(router.db_for_read(Assembly), REPLICA)
+            self.assertEqual(Assembly.objects.count(), Assembly.objects.using(DEFAULT_DB_ALIAS).count() - 50)
+        self.assertFalse(router.allow_migrate(REPLICA, 'bom'))
+        self.assertTrue(router.allow_migrate(DEFAULT_DB_ALIAS, 'bom'))
+
+
+def _connection(connection=object()) -> mock.Mock:
+    wrapper = mock.Mock(connection=connection, errors_occurred=False)
+    # not checked yet
+    del wrapper._bom_checked_at
+    return wrapper
+
+
+class TestPersistentConnections(SimpleTestCase):
+    def _check(self, *connections_):
+        with mock.patch('bom.signals.connections') as connections_mock:
+            connections_mock.all.return_value = connections_
+            check_persistent_connections(sender=None)
+
+    def test_broken_connections_are_closed_at_start_of_request(self):
+        broken, working, closed = _connection(), _connection(), _connection(None)
+        broken.is_usable.return_value = False
+
+        self._check(broken, working, closed)
+
+        broken.close.assert_called_once_with()
+        working.close.assert_not_called()
+        closed.is_usable.assert_not_called()
+
+    @override_settings(BOM_CONN_CHECK_INTERVAL=10)
+    def test_connections_are_checked_once_in_interval_or_after_errors(self):
+        connection = _connection()
+
+        with mock.patch('bom.signals.time.monotonic', side_effect=[100, 105, 107, 111]):
+            self._check(connection)
+            self._check(connection)
+            connection.errors_occurred = True
+            self._check(connection)
+            connection.errors_occurred = False
+            self._check(connection)
+
+        # checked at 100, skipped at 105, checked after errors at 107, then 4 seconds passed
+        self.assertEqual(connection.is_usable.call_count, 2)
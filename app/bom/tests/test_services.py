@@ -1,13 +1,20 @@
 import csv
+import hashlib
 import os
 from decimal import Decimal
+from unittest import mock
 
+from django.core.cache import cache
 from django.core.files import File
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
 
+from bom.importers import _decode_file
 from bom.models import Assembly, Component
-from bom.services import validated_line, validate_file, save_to_db
-from bom.tests.utils import _in_memory_file
+from bom.services import validated_line, validate_file, save_to_db, validate_file_with_token, InvalidFileError
+from bom.benchmarks.generator import generate_bom_csv, generated_file
+from bom.tests.utils import _in_memory_file, _peak_memory, _retained_memory
+from bom.validation import NO_ERRORS, checked_rows, valid_entity
 
 CORRECT_FILE = os.path.join(os.path.dirname(__file__), 'files/correct_file.csv')
 INCORRECT_FILE1 = os.path.join(os.path.dirname(__file__), 'files/incorrect_file1_without_header.csv')
@@ -76,6 +83,101 @@ class TestValidateCSV(TestCase):
         self.assertEqual(results['row_2'], {'row_number': 2, 'verbose:': ['Field required: name']})
         self.assertEqual(results['row_4'], {'row_number': 4, 'verbose:': ['Field required: level']})
 
+    def test_validate_line_with_non_numeric_values(self):
+        csv_line, errors = validated_line("one,999-0001-00,headphones,,EA,MTS,1.5x,a".split(","))
+        csv_line1, errors1 = validated_line("-1,999-0001-00,headphones,,EA".split(","))
+
+        self.assertIsNone(csv_line)
+        self.assertEqual(errors, ["Field has to be a non-negative integer: level",
+                                  "Field has to be a number: quantity",
+                                  "Field has to be a number: price"])
+        self.assertIsNone(csv_line1)
+        self.assertIn("Each item should have 8 elements.", errors1)
+        self.assertIn("Field has to be a non-negative integer: level", errors1)
+
+    def test_validate_line_with_non_finite_numbers(self):
+        row = "1,999-0001-00,headphones,,EA,MTS,nan,inf".split(",")
+        content = open(CORRECT_FILE, encoding="utf-8").read().replace(",EA,MTS,1.12,0.6", ",EA,MTS,NaN,0.6")
+
+        csv_line, errors = validated_line(row)
+
+        self.assertIsNone(csv_line)
+        self.assertIsNone(valid_entity(row))
+        self.assertEqual(errors, ["Field has to be a number: quantity", "Field has to be a number: price"])
+        self.assertEqual(validate_file(SimpleUploadedFile("file.csv", content.encode("utf-8"))),
+                         {"row_6": {"row_number": 6, "verbose:": ["Field has to be a number: quantity"]}})
+
+    def test_detect_level_jumps(self):
+        content = open(CORRECT_FILE, encoding="utf-8").read()
+        content = content.replace("0,999-0001-00", "1,999-0001-00").replace("3,240-0001-00", "5,240-0001-00")
+        file = SimpleUploadedFile("file.csv", content.encode(), content_type="text/csv")
+
+        results = validate_file(file)
+
+        self.assertEqual(results, {
+            'row_0': {'row_number': 0, 'verbose:': ["First row has to be at level 0."]},
+            'row_4': {'row_number': 4, 'verbose:': ["Level can be at most one deeper than level of previous row."]},
+        })
+        with self.assertRaises(InvalidFileError):
+            save_to_db(file)
+        self.assertEqual(Assembly.objects.count(), 0)
+
+    def test_parallel_validation_same_as_serial(self):
+        rows = [line.split(",") for line in generate_bom_csv(3_000, seed=5).decode().splitlines()]
+        rows[10][6] = "abc"
+        rows[500][0] = str(int(rows[499][0]) + 2)  # first row of a chunk
+        rows[1000][2] = '"multi\nline name"'
+        rows[1001][1] = ""
+        content = "\n".join(",".join(row) for row in rows).encode()
+
+        serial = validate_file(SimpleUploadedFile("file.csv", content))
+        with override_settings(BOM_VALIDATION_WORKERS=2, BOM_VALIDATION_CHUNK_SIZE=499,
+                               BOM_PARALLEL_VALIDATION_MIN_SIZE=0):
+            parallel = validate_file(SimpleUploadedFile("file.csv", content))
+
+        self.assertEqual(list(serial), ['row_9', 'row_499', 'row_1000'])
+        self.assertEqual(list(parallel.items()), list(serial.items()))
+
+    def test_validate_file_memory_does_not_grow_with_file_size(self):
+        small_file, large_file = generated_file(2_000), generated_file(50_000)
+
+        small_peak = _peak_memory(validate_file, small_file)
+        large_peak = _peak_memory(validate_file, large_file)
+
+        self.assertLess(large_peak, small_peak * 1.5)
+        self.assertLess(large_peak, large_file.size / 4)
+
+    def test_valid_rows_are_buffered_compactly(self):
+        content = generate_bom_csv(20_000, seed=1)
+
+        def buffered_entities(shared=None):
+            decoded_file, _ = _decode_file(SimpleUploadedFile("file.csv", content))
+            rows = checked_rows(decoded_file, shared=shared)
+            return [entity for _, entity, errors in rows if errors is NO_ERRORS]
+
+        entities, retained = _retained_memory(buffered_entities)
+        _, retained_shared = _retained_memory(buffered_entities, shared={})
+
+        self.assertEqual(len(entities), 20_000)
+        self.assertFalse(hasattr(entities[0], "__dict__"))
+        # slotted entity, its floats and texts
+        self.assertLess(retained / len(entities), 400)
+        # texts of components repeated across file are kept once
+        self.assertLess(retained_shared / len(entities), 200)
+
+    def test_decode_file_reads_rows_split_between_chunks(self):
+        content = open(CORRECT_FILE, encoding="utf-8").read().replace("headphonesz", "słuchawki żółte")
+        file = SimpleUploadedFile("file.csv", content.encode("utf-8"), content_type="text/csv")
+
+        with mock.patch("bom.importers.CHUNK_SIZE", 7):
+            decoded_file, errors = _decode_file(file)
+            rows = list(decoded_file)
+
+        self.assertFalse(errors)
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0][2], "słuchawki żółte")
+        self.assertEqual(rows[-1], ["2", "210-0101-00", "somethingelse", "", "EA", "MTS", "1.12", "0.6"])
+
     def test_save_assemblies_to_db(self):
         _file = File(open(CORRECT_FILE))
         file = _in_memory_file(file_path=CORRECT_FILE)
@@ -101,6 +203,43 @@ class TestValidateCSV(TestCase):
             self.assertEqual(assembly.depth, int(row[0]) + 1)
             self.assertEqual(assembly.quantity, Decimal(row[6]))
 
+    def test_save_to_db_memory_does_not_grow_with_file_size(self):
+        small_file, large_file = generated_file(2_000), generated_file(8_000)
+        # first import allocates what is kept for the process (compiled queries, lazy imports)
+        save_to_db(generated_file(100, seed=1))
+
+        small_peak = _peak_memory(save_to_db, small_file)
+        large_peak = _peak_memory(save_to_db, large_file)
+
+        self.assertEqual(Assembly.objects.count(), 10_100)
+        # open nodes keep entries of their children (about 100 bytes each), rows themselves aren't kept
+        self.assertLess((large_peak - small_peak) / 6_000, 200)
+
+    def test_validate_file_with_token_remembers_valid_files_only(self):
+        results, token = validate_file_with_token(_in_memory_file(file_path=CORRECT_FILE))
+        results1, token1 = validate_file_with_token(_in_memory_file(file_path=INCORRECT_FILE2))
+
+        self.assertFalse(results)
+        self.assertEqual(token, hashlib.sha256(open(CORRECT_FILE, "rb").read()).hexdigest())
+        self.assertTrue(results1)
+        self.assertIsNone(token1)
+
+    def test_save_to_db_validates_file_without_token(self):
+        with self.assertRaises(InvalidFileError) as ctx:
+            save_to_db(_in_memory_file(file_path=INCORRECT_FILE2))
+
+        self.assertEqual(ctx.exception.errors, validate_file(_in_memory_file(file_path=INCORRECT_FILE2)))
+        self.assertEqual(Component.objects.count(), 0)
+
+    def test_save_to_db_with_unknown_token_validates_file(self):
+        file = _in_memory_file(file_path=CORRECT_FILE)
+        token = hashlib.sha256(open(CORRECT_FILE, "rb").read()).hexdigest()
+        cache.clear()
+
+        save_to_db(file, token=token)
+
+        self.assertEqual(Assembly.objects.count(), 7)
+
     def test_dont_save_entities_to_db(self):
         file1 = _in_memory_file(file_path=INCORRECT_FILE1)
         file2 = _in_memory_file(file_path=INCORRECT_FILE2)
@@ -114,3 +253,27 @@ class TestValidateCSV(TestCase):
         components = Component.objects.count()
         self.assertEqual(assemblies, 0)
         self.assertEqual(components, 0)
+
+    def test_save_to_db_reuses_existing_components(self):
+        save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+        # savepoint, components, last root, assemblies insert, assemblies read and rollups insert,
+        # assemblies read and usage insert (both in savepoints), tree versions bump, release
+        with self.assertNumQueries(15):
+            save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+        self.assertEqual(Component.objects.count(), 7)
+        self.assertEqual(Assembly.objects.count(), 14)
+        first_tree, second_tree = Assembly.get_root_nodes()
+        self.assertEqual([a.component_id for a in first_tree.get_tree(first_tree)],
+                         [a.component_id for a in second_tree.get_tree(second_tree)])
+
+    def test_save_to_db_creates_components_once_per_identifier_and_name(self):
+        Component.objects.create(identifier="400-0001-00", name="other name", category="", unit="EA",
+                                 procurement_type="MTS", price=1)
+
+        save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+        self.assertEqual(Component.objects.count(), 8)
+        self.assertEqual(Component.objects.get(identifier="400-0001-00", name="plastic structure headmount").price,
+                         Decimal("0.32"))
@@ -0,0 +1,134 @@
+import json
+from decimal import Decimal
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
+
+from bom.diff import diff_trees
+from bom.explosion import explode
+from bom.models import Assembly, AssemblyRollup, Component
+from bom.patch import patch_tree
+from bom.services import save_to_db
+from bom.streaming import stream_dump
+from bom.usage import where_used
+from bom.versions import item_etag
+
+HEADER = "level,item_number,item_name,item_category,unit_of_measure,procurement_type,quantity,Price by Unit\n"
+
+
+def _driver(level: int, quantity=1, magnets=2) -> str:
+    return (f"{level},310-0001-00,driver,,EA,MTS,{quantity},2.00\n"
+            f"{level + 1},311-0001-00,magnet,,EA,MTS,{magnets},0.25\n"
+            f"{level + 1},312-0001-00,coil,,EA,MTS,1,0.40\n")
+
+
+def _speaker(quantity=1, magnets=2) -> str:
+    return (f"1,300-0001-00,speaker,,EA,MTS,{quantity},1.50\n" + _driver(2, magnets=magnets)
+            + "2,320-0001-00,cable,,EA,MTS,0.5,0.10\n")
+
+
+def _earbuds(magnets=2) -> str:
+    return "0,101-0001-00,earbuds,,EA,MTS,1,\n" + _speaker(2, magnets) + _driver(1, quantity=3)
+
+
+# speaker is used three times, driver four times: in every speaker and once directly
+PRODUCTS = ("0,100-0001-00,headphones,,EA,MTS,1,\n" + _speaker(2) + "1,200-0001-00,headband,,EA,MTS,1,3.00\n"
+            + _speaker() + _earbuds())
+
+
+def _csv_file(content: str) -> SimpleUploadedFile:
+    return SimpleUploadedFile("file.csv", (HEADER + content).encode(), content_type="text/csv")
+
+
+def _dump(root: Assembly, **kwargs) -> dict:
+    return Assembly.dump_bulk(root, keep_ids=False, with_costs=True, **kwargs)
+
+
+def _magnet_uses() -> dict:
+    magnet = Component.objects.get(identifier="311-0001-00")
+    return {use['root']: (use['quantity'], use['occurrences']) for use in where_used(magnet.pk)}
+
+
+class TestSharedSubAssemblies(TestCase):
+    def setUp(self) -> None:
+        self.roots = save_to_db(_csv_file(PRODUCTS), deduplicate=True)
+        self.created = Assembly.objects.count()
+        # the same trees with sub-assemblies stored under every parent
+        self.copies = save_to_db(_csv_file(PRODUCTS))
+
+    def assertSameAsCopies(self):
+        for root, copy in zip(self.roots, self.copies):
+            self.assertEqual(_dump(root), _dump(copy))
+            self.assertEqual(AssemblyRollup.objects.get(pk=root.pk).signature,
+                             AssemblyRollup.objects.get(pk=copy.pk).signature)
+
+    def test_repeated_sub_assemblies_are_stored_once(self):
+        # products with references (4 and 3 rows), speaker with reference of driver, driver
+        self.assertEqual(self.created, 4 + 3 + 3 + 3)
+        self.assertEqual(Assembly.objects.filter(is_shared=True).count(), 2)
+        self.assertEqual(AssemblyRollup.objects.count(), Assembly.objects.count())
+        self.assertSameAsCopies()
+        for root, copy in zip(self.roots, self.copies):
+            self.assertEqual(_dump(root, max_depth=2), _dump(copy, max_depth=2))
+
+    def test_readers_see_sub_assemblies_under_every_parent(self):
+        for root, copy in zip(self.roots, self.copies):
+            self.assertEqual(explode(root), explode(copy))
+            self.assertEqual(diff_trees(copy, root),
+                             {'added': [], 'removed': [], 'quantity_changed': [], 'price_changed': []})
+            self.assertEqual(json.loads(b"".join(stream_dump(root, keep_ids=False, with_costs=True))),
+                             json.loads(JSONRenderer().render(_dump(copy))))
+        self.assertEqual(_magnet_uses(), {self.roots[0].pk: (Decimal(6), 2), self.roots[1].pk: (Decimal(10), 2),
+                                          self.copies[0].pk: (Decimal(6), 2), self.copies[1].pk: (Decimal(10), 2)})
+
+    def test_api_returns_trees_without_shared_ones(self):
+        speaker, copy = (Assembly.objects.get(path__startswith=root.path, component__identifier="300-0001-00")
+                         for root in (self.roots[1], self.copies[1]))
+
+        items = self.client.get(reverse('bom:item_list')).json()
+        children, copied_children = (
+            self.client.get(reverse('bom:item_details', kwargs={'id': node.pk}), {'children': 'true'}).json()
+            for node in (speaker, copy))
+        details = self.client.get(reverse('bom:item_details', kwargs={'id': speaker.pk}), {'max_depth': 0}).json()
+
+        self.assertEqual([item['component']['name'] for item in items],
+                         ["headphones", "earbuds", "headphones", "earbuds"])
+        self.assertEqual([{**child, 'id': None} for child in children],
+                         [{**child, 'id': None} for child in copied_children])
+        self.assertEqual(details['numchild'], 2)
+
+    def test_next_import_references_stored_sub_assemblies(self):
+        root, = save_to_db(_csv_file("0,102-0001-00,headset,,EA,MTS,1,\n" + _speaker(3)), deduplicate=True)
+
+        self.assertEqual(Assembly.objects.filter(path__startswith=root.path).count(), 2)
+        self.assertEqual(Assembly.objects.filter(is_shared=True).count(), 2)
+        self.assertEqual(root.rollup.cost, 3 * (Decimal('1.50') + Decimal('2.00') + Decimal('0.50')
+                                                + Decimal('0.40') + Decimal('0.05')))
+
+    def test_change_of_shared_sub_assembly_changes_referencing_trees(self):
+        etags = [item_etag(root.pk) for root in self.roots]
+
+        for node in Assembly.objects.filter(component__identifier="311-0001-00"):
+            node.quantity = 3
+            node.save()
+
+        self.assertSameAsCopies()
+        self.assertEqual(_magnet_uses(), {self.roots[0].pk: (Decimal(9), 2), self.roots[1].pk: (Decimal(15), 2),
+                                          self.copies[0].pk: (Decimal(9), 2), self.copies[1].pk: (Decimal(15), 2)})
+        self.assertNotIn(None, etags)
+        for root, etag in zip(self.roots, etags):
+            self.assertNotEqual(item_etag(root.pk), etag)
+
+    def test_patch_copies_shared_sub_assemblies_into_tree(self):
+        headphones, earbuds = self.roots
+        tree = _dump(headphones)
+
+        changes = patch_tree(_csv_file(_earbuds(magnets=5)), earbuds)
+
+        self.assertEqual(changes, {'inserted': 0, 'updated': 1, 'moved': 0, 'deleted': 0})
+        self.assertFalse(Assembly.objects.filter(path__startswith=earbuds.path, shared__isnull=False).exists())
+        self.assertEqual(_dump(headphones), tree)
+        self.assertEqual(_dump(earbuds), _dump(save_to_db(_csv_file(_earbuds(magnets=5)))[0]))
+        self.assertEqual(_magnet_uses()[earbuds.pk], (Decimal(16), 2))
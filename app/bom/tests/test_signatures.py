@@ -0,0 +1,83 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from rest_framework.reverse import reverse
+
+from bom.benchmarks.generator import generate_bom_csv, generated_file
+from bom.models import Assembly, AssemblyRollup
+from bom.services import save_to_db
+from bom.signatures import SignatureBuilder, subtree_signature, tree_key
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+
+
+def _two_trees_file(quantity="1") -> SimpleUploadedFile:
+    content = open(CORRECT_FILE, encoding="utf-8").read().replace("\n0,999-0001-00,headphonesz,,EA,MTS,1,",
+                                                                   f"\n0,999-0001-00,headphonesz,,EA,MTS,{quantity},")
+    header, rows = content.split("\n", 1)
+    generated = generate_bom_csv(50, seed=8).decode().split("\n", 1)[1]
+    return SimpleUploadedFile("file.csv", f"{header}\n{generated}{rows}".encode(), content_type="text/csv")
+
+
+class TestSignatures(TestCase):
+    def test_signature_ignores_order_of_children(self):
+        self.assertEqual(subtree_signature("a", "b", [(1, "x"), ("0.5", "y")]),
+                         subtree_signature("a", "b", [(0.5, "y"), (1, "x")]))
+        self.assertNotEqual(subtree_signature("a", "b", [(1, "x"), (0.5, "y")]),
+                            subtree_signature("a", "b", [(1, "y"), (0.5, "x")]))
+
+    def test_file_signatures_same_as_stored(self):
+        file = generated_file(500, seed=6)
+        builder = SignatureBuilder()
+        for row in generate_bom_csv(500, seed=6).decode().splitlines()[1:]:
+            level, identifier, name, *_, quantity, _ = row.split(",")
+            builder.add(identifier, name, float(quantity), int(level) + 1)
+
+        root, = save_to_db(file)
+
+        self.assertEqual(builder.finish(), [tree_key(root.rollup.signature, root.quantity)])
+
+    def test_migration_signs_existing_trees(self):
+        save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        save_to_db(generated_file(300, seed=7))
+        signatures = dict(AssemblyRollup.objects.values_list('pk', 'signature'))
+        AssemblyRollup.objects.update(signature="")
+
+        import_module('bom.migrations.0007_subtree_signatures').sign_existing_trees(apps, None)
+
+        self.assertEqual(dict(AssemblyRollup.objects.values_list('pk', 'signature')), signatures)
+
+    def test_deduplicate_reuses_identical_tree(self):
+        root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+        roots = save_to_db(_in_memory_file(file_path=CORRECT_FILE), deduplicate=True)
+
+        self.assertEqual(roots, [root])
+        self.assertEqual(Assembly.objects.count(), 7)
+
+    def test_deduplicate_saves_only_new_trees_of_file(self):
+        root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+
+        roots = save_to_db(_two_trees_file(), deduplicate=True)
+        roots1 = save_to_db(_two_trees_file(quantity="2"), deduplicate=True)
+
+        self.assertEqual(roots[1], root)
+        self.assertEqual(roots1[0], roots[0])
+        self.assertNotIn(roots1[1], (root, roots[0]))
+        self.assertEqual(Assembly.objects.count(), 7 + 50 + 7)
+        self.assertEqual(AssemblyRollup.objects.count(), Assembly.objects.count())
+
+    def test_item_duplicates(self):
+        save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        save_to_db(_two_trees_file())
+        node = Assembly.objects.get(component__identifier="750-0001-01", depth=3, path__startswith="0000000001")
+        node.quantity = 5
+        node.save()
+
+        res = self.client.get(reverse('bom:item_duplicates', kwargs={'id': node.pk}))
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['component']['identifier'], "750-0001-01")
+        self.assertNotEqual(res.data[0]['id'], node.pk)
@@ -0,0 +1,78 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
+
+from bom.benchmarks.generator import generated_file
+from bom.models import Assembly
+from bom.services import save_to_db
+from bom.streaming import stream_dump
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file, _peak_memory
+
+
+def _streamed(*args, **kwargs):
+    return json.loads(b"".join(stream_dump(*args, **kwargs)))
+
+
+def _rendered(*args, **kwargs):
+    return json.loads(JSONRenderer().render(Assembly.dump_bulk(*args, **kwargs)))
+
+
+class TestStreamDump(TestCase):
+    def test_stream_same_as_dump_bulk(self):
+        root, = save_to_db(generated_file(500, seed=3))
+
+        for kwargs in ({}, {'with_costs': True, 'keep_ids': False}, {'max_depth': 2, 'with_costs': True},
+                       {'fields': ('identifier', 'quantity')}):
+            with self.subTest(**kwargs):
+                self.assertEqual(_streamed(root, chunk_size=7, **kwargs), _rendered(root, **kwargs))
+
+    def test_stream_of_leaf(self):
+        save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        leaf = Assembly.objects.get(component__identifier="210-0101-00")
+
+        self.assertEqual(_streamed(leaf, with_costs=True), _rendered(leaf, with_costs=True))
+
+    def test_stream_memory_does_not_grow_with_tree_size(self):
+        small_root, = save_to_db(generated_file(1_000, seed=1))
+        large_root, = save_to_db(generated_file(8_000, seed=2))
+
+        def consume(root):
+            for _ in stream_dump(root, with_costs=True, chunk_size=200):
+                pass
+
+        small_peak = _peak_memory(consume, small_root)
+        large_peak = _peak_memory(consume, large_root)
+        dump_peak = _peak_memory(Assembly.dump_bulk, large_root, with_costs=True)
+
+        self.assertLess(large_peak, small_peak * 1.5)
+        self.assertLess(large_peak, dump_peak / 4)
+
+
+@override_settings(BOM_STREAMING_MIN_NODES=5)
+class TestStreamingItemDetails(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        self.url = reverse('bom:item_details', kwargs={'id': self.root.pk})
+
+    def test_large_tree_is_streamed(self):
+        res = self.client.get(self.url)
+        res1 = self.client.get(self.url, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertTrue(res.streaming)
+        self.assertEqual(json.loads(b"".join(res.streaming_content)),
+                         _rendered(self.root, keep_ids=False, with_costs=True))
+        self.assertEqual(res1.status_code, 304)
+
+    def test_small_subtree_and_children_are_not_streamed(self):
+        node = Assembly.objects.get(component__identifier="750-0001-01")
+
+        res = self.client.get(reverse('bom:item_details', kwargs={'id': node.pk}))
+        res1 = self.client.get(self.url, {'children': 'true'})
+
+        self.assertFalse(res.streaming)
+        self.assertFalse(res1.streaming)
@@ -0,0 +1,64 @@
+from functools import partial
+from unittest import mock
+
+from django.test import TestCase
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.reference import treebeard_save_to_db
+from bom.models import Assembly, Component
+from bom.services import save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+from bom.tree import TreeBuilder
+
+
+def _tree_rows():
+    return list(Assembly.objects.values_list("path", "depth", "numchild", "component__identifier", "quantity"))
+
+
+class TestTreeBuilder(TestCase):
+    def _assert_same_tree_as_treebeard(self, make_file, save=save_to_db):
+        treebeard_save_to_db(make_file())
+        treebeard_save_to_db(make_file())
+        expected = _tree_rows()
+        Assembly.objects.all().delete()
+        Component.objects.all().delete()
+
+        save(make_file())
+        save(make_file())
+
+        self.assertEqual(_tree_rows(), expected)
+
+    def test_save_to_db_creates_same_tree_as_treebeard(self):
+        self._assert_same_tree_as_treebeard(lambda: _in_memory_file(file_path=CORRECT_FILE))
+
+    def test_save_to_db_creates_same_tree_as_treebeard_for_generated_file(self):
+        self._assert_same_tree_as_treebeard(lambda: generated_file(120, max_depth=5, seed=1))
+
+    def test_numchild_fixed_for_nodes_flushed_before_their_children(self):
+        def save(file):
+            with mock.patch("bom.services.TreeBuilder", partial(TreeBuilder, batch_size=3)):
+                save_to_db(file)
+
+        self._assert_same_tree_as_treebeard(lambda: generated_file(100, max_depth=4, seed=2), save=save)
+
+    def test_tree_builder_inserts_nodes_in_batches(self):
+        component = Component.objects.create(identifier="1", name="a", category="", unit="EA",
+                                             procurement_type="MTS", price=1)
+        builder = TreeBuilder(batch_size=2)
+        # last root lookup, 3 inserts, numchild fixes of nodes inserted before their children
+        with self.assertNumQueries(7):
+            for depth in (1, 2, 3, 2, 3):
+                builder.add(component, 1, depth)
+            self.assertEqual(builder.finish(), 5)
+
+        self.assertEqual([(a.path, a.numchild) for a in Assembly.objects.all()],
+                         [("0000000001", 2), ("00000000010000000001", 1),
+                          ("000000000100000000010000000001", 0), ("00000000010000000002", 1),
+                          ("000000000100000000020000000001", 0)])
+
+    def test_tree_builder_requires_root_first(self):
+        component = Component.objects.create(identifier="1", name="a", category="", unit="EA",
+                                             procurement_type="MTS", price=1)
+        with self.assertRaises(ValueError):
+            TreeBuilder().add(component, 1, 2)
@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from bom.benchmarks.generator import generated_file
+from bom.benchmarks.reference import scan_where_used
+from bom.models import Assembly, Component, ComponentUsage
+from bom.services import save_to_db
+from bom.tests.test_services import CORRECT_FILE
+from bom.tests.utils import _in_memory_file
+from bom.usage import where_used
+
+
+def _stored_usage():
+    return {usage.pk: (usage.component_id, usage.root_id, round(usage.quantity, 5))
+            for usage in ComponentUsage.objects.all()}
+
+
+def _scanned_usage():
+    return {pk: (component_id, root_id, round(quantity, 5))
+            for pk, component_id, root_id, quantity in scan_where_used()}
+
+
+class TestComponentUsage(TestCase):
+    def setUp(self) -> None:
+        self.root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        self.other_root, = save_to_db(generated_file(200, max_depth=4, seed=5))
+        self.foam = Component.objects.get(identifier="240-0001-00")
+
+    def assertUsageUpToDate(self):
+        self.assertEqual(_stored_usage(), _scanned_usage())
+
+    def test_usage_indexed_on_import(self):
+        self.assertEqual(ComponentUsage.objects.count(), Assembly.objects.count())
+        self.assertEqual(_stored_usage()[6], (6, self.root.pk, Decimal('0.55000')))
+        self.assertUsageUpToDate()
+
+    def test_quantity_change_updates_subtree(self):
+        node = Assembly.objects.get(pk=3)
+        node.quantity = 4
+        node.save()
+
+        self.assertEqual(_stored_usage()[6][2], Decimal('2.20000'))
+        self.assertUsageUpToDate()
+
+    def test_root_quantity_change_reindexes_tree_with_few_queries(self):
+        self.other_root.quantity = 2
+        # old values, save, rollup, savepoint, delete, select and insert of index entries, release, versions,
+        # shared sub-assemblies containing the node
+        with self.assertNumQueries(1 + 1 + 4 + 1 + 3 + 1 + 2 + 1):
+            self.other_root.save()
+
+        self.assertUsageUpToDate()
+
+    def test_save_without_indexed_changes_keeps_index(self):
+        node = Assembly.objects.get(pk=3)
+        ComponentUsage.objects.filter(pk=node.pk).update(quantity=100)
+
+        node.save()
+
+        self.assertEqual(_stored_usage()[node.pk][2], Decimal('100'))
+
+    def test_added_node_is_indexed(self):
+        Assembly.objects.get(pk=3).add_child(component=self.foam, quantity=2)
+
+        self.assertEqual(where_used(self.foam.pk)[0]['quantity'], Decimal('3'))
+        self.assertUsageUpToDate()
+
+    def test_moved_node_is_indexed_under_new_root(self):
+        Assembly.objects.get(pk=3).move(self.other_root.get_children()[0], pos='last-child')
+
+        self.assertEqual([product['root'] for product in where_used(self.foam.pk)], [self.other_root.pk])
+        self.assertUsageUpToDate()
+
+    def test_deleted_subtree_is_removed(self):
+        Assembly.objects.get(pk=3).delete()
+
+        self.assertEqual(where_used(self.foam.pk), [])
+        self.assertUsageUpToDate()
+
+    def test_where_used_sums_quantities_per_root(self):
+        third_root, = save_to_db(_in_memory_file(file_path=CORRECT_FILE))
+        third_root.get_children()[0].add_child(component=self.foam, quantity=Decimal('0.5'))
+
+        with self.assertNumQueries(1):
+            products = where_used(self.foam.pk)
+
+        self.assertEqual(products, [
+            {'root': self.root.pk, 'identifier': '999-0001-00', 'name': 'headphonesz',
+             'quantity': Decimal('1'), 'occurrences': 1},
+            {'root': third_root.pk, 'identifier': '999-0001-00', 'name': 'headphonesz',
+             'quantity': Decimal('1.5'), 'occurrences': 2},
+        ])
+
+    def test_where_used_api(self):
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse('bom:component_where_used', kwargs={'id': self.foam.pk}))
+        res1 = self.client.get(reverse('bom:component_where_used', kwargs={'id': 1000}))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['component']['identifier'], '240-0001-00')
+        self.assertEqual(res.data['products'], [{'root': self.root.pk, 'identifier': '999-0001-00',
+                                                 'name': 'headphonesz', 'quantity': '1.00000000',
+                                                 'occurrences': 1}])
+        self.assertEqual(res1.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,3 +1,5 @@
+import tracemalloc
+
 from django.core.files import File
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -7,3 +9,23 @@ def _in_memory_file(file_path: str, file_name="file.csv", content_type="text/csv
     encoded_file = _file.read().encode("utf-8")
     file = SimpleUploadedFile(file_name, encoded_file, content_type=content_type)
     return file
+
+
+def _peak_memory(func, *args, **kwargs) -> int:
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _retained_memory(func, *args, **kwargs) -> tuple:
+    """ Returns result of func and memory allocated by it which is still held after it returns. """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func(*args, **kwargs)
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,137 @@
+from decimal import Decimal
+from itertools import count
+from typing import Dict, Iterator, List, Optional, Union
+
+from bom.ingest import get_ingest
+from bom.models import Assembly, Component
+
+BATCH_SIZE = 1000
+QUERY_CHUNK_SIZE = 500
+
+
+def _root_steps() -> Iterator[int]:
+    # steps of paths of new roots, the last stored root is fetched when the first one is taken
+    last_root = Assembly.get_last_root_node()
+    yield from count((Assembly._str2int(last_root.path) if last_root else 0) + 1)
+
+
+class TreeBuilder:
+    """ Builds Assembly trees in memory and writes them with ingest of settings.BOM_INGEST_BACKEND
+        (bulk_create by default, see bom.ingest).
+        Nodes have to be added in the order they appear in a file (depth-first, parents before children).
+        path, depth and numchild are computed the same way as treebeard's add_root/add_child/add_sibling
+        do it, so resulting rows are identical to the ones created node by node.
+
+        Nodes are written in batches. Only ancestors of the currently processed node can still get
+        new children, so numchild of those which were written too early is fixed when they are closed.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, alongside: Optional["TreeBuilder"] = None):
+        """ Parameters
+            -----------
+            batch_size: int
+                number of nodes written at once
+            alongside: TreeBuilder
+                builder writing other trees at the same time, steps of new roots and ingest are shared with it
+        """
+        self.batch_size = batch_size
+        self._stack: List[Assembly] = []
+        self._buffer: List[Assembly] = []
+        self._flushed_numchild: Dict[str, int] = {}
+        self._numchild_updates: Dict[str, int] = {}
+        self._root_steps = _root_steps() if alongside is None else alongside._root_steps
+        self.created = 0
+        self.roots: List[Assembly] = []
+        self._ingest = get_ingest(batch_size) if alongside is None else alongside._ingest
+
+    def _close(self, node: Assembly):
+        flushed_numchild = self._flushed_numchild.pop(node.path, None)
+        if flushed_numchild is not None and flushed_numchild != node.numchild:
+            self._numchild_updates[node.path] = node.numchild
+
+    def add(self, component: Component, quantity: Union[float, Decimal], depth: int,
+            is_shared: bool = False) -> Assembly:
+        """ Adds node to the tree, placing it the same way save_to_db always did:
+            depth 1 starts a new root, deeper rows become children of the last open node one level up.
+            A row jumping more than one level down is added as a sibling of the previous row.
+
+            Parameters
+            -----------
+            component: Component
+                component of the node
+            quantity: float
+                quantity of the component
+            depth: int
+                depth of node, counted from 1 like Assembly.depth
+            is_shared: bool
+                root of shared sub-assembly, see bom.shared
+
+            Returns
+            ----------
+            Assembly
+                unsaved (or already flushed) Assembly node
+        """
+        if depth > 1 and not self._stack:
+            raise ValueError("First node of a tree has to be a root.")
+        if depth > len(self._stack) + 1:
+            depth = len(self._stack)
+
+        while len(self._stack) >= depth:
+            self._close(self._stack.pop())
+
+        if depth == 1:
+            path = Assembly._get_path(None, 1, next(self._root_steps))
+        else:
+            parent = self._stack[-1]
+            parent.numchild += 1
+            path = Assembly._get_path(parent.path, depth, parent.numchild)
+
+        node = Assembly(component=component, quantity=quantity, path=path, depth=depth, numchild=0,
+                        is_shared=is_shared)
+        if depth == 1:
+            self.roots.append(node)
+        self._stack.append(node)
+        self._buffer.append(node)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        return node
+
+    def flush(self):
+        """ Writes buffered nodes to database. """
+        if not self._buffer:
+            return
+        self._ingest.add_assemblies(self._buffer)
+        self.created += len(self._buffer)
+        self._buffer = []
+        for node in self._stack:
+            self._flushed_numchild.setdefault(node.path, node.numchild)
+
+    def finish(self) -> int:
+        """ Writes remaining nodes and fixes numchild of nodes that were written before all their
+            children were known.
+
+            Returns
+            ----------
+            int
+                number of created nodes
+        """
+        self.flush()
+        self._ingest.finish()
+        while self._stack:
+            self._close(self._stack.pop())
+        for path, numchild in self._numchild_updates.items():
+            Assembly.objects.filter(path=path).update(numchild=numchild)
+        self._numchild_updates = {}
+        self._fetch_root_ids()
+        return self.created
+
+    def _fetch_root_ids(self):
+        # ingest which doesn't write through the model (or database which doesn't return ids of inserted rows)
+        roots = [root for root in self.roots if root.pk is None]
+        for start in range(0, len(roots), QUERY_CHUNK_SIZE):
+            chunk = roots[start:start + QUERY_CHUNK_SIZE]
+            ids = dict(Assembly.objects.filter(path__in=[root.path for root in chunk]).values_list('path', 'pk'))
+            for root in chunk:
+                root.pk = ids[root.path]
+                root._state.adding = False
+                root._state.db = Assembly.objects.db
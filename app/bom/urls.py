@@ -7,6 +7,11 @@ app_name = 'bom'
 urlpatterns = [
     path('items/', views.ItemListAPIView.as_view(), name="item_list"),
     path('items/<id>/', views.ItemDetailsAPIView.as_view(), name="item_details"),
+    path('items/<id>/duplicates/', views.ItemDuplicatesAPIView.as_view(), name="item_duplicates"),
+    path('items/<id>/diff/<base_id>/', views.ItemDiffAPIView.as_view(), name="item_diff"),
+    path('items/<id>/explosion/', views.ItemExplosionAPIView.as_view(), name="item_explosion"),
+    path('components/<int:id>/where-used/', views.ComponentWhereUsedAPIView.as_view(), name="component_where_used"),
     path('file/validate/', views.FileValidateAPIView.as_view(), name="file_validate"),
     path('file/upload/', views.FileUploadAPIView.as_view(), name="file_upload"),
+    path('jobs/<uuid:id>/', views.ImportJobAPIView.as_view(), name="job_details"),
 ]
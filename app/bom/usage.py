@@ -0,0 +1,102 @@
+from decimal import Decimal
+from typing import List
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from bom.models import Assembly, ComponentUsage
+
+BATCH_SIZE = 1000
+QUANTITY_QUANTUM = Decimal('0.00000001')
+
+
+def rebuild_usage(path: str, new: bool = False) -> int:
+    """ Indexes components of subtree of node with given path in one pass over its rows.
+        Root and quantity of the subtree top are taken from index entry of its parent, when the parent
+        is not indexed yet whole tree is indexed. Existing entries of the subtree are deleted and created
+        again, updating them row by row (bulk_update) takes time growing with square of their number.
+
+        Parameters
+        -----------
+        path: str
+            path of subtree root
+        new: bool
+            subtree was just created and isn't indexed yet
+
+        Returns
+        ----------
+        int
+            number of saved index entries
+    """
+    steplen = Assembly.steplen
+    parent_path = path[:-steplen]
+    root_id, multiplier = None, Decimal(1)
+    if parent_path:
+        parent = ComponentUsage.objects.filter(assembly__path=parent_path).values_list('root_id', 'quantity').first()
+        if parent is None:
+            return rebuild_usage(path[:steplen])
+        root_id, multiplier = parent
+
+    with transaction.atomic():
+        if not new:
+            ComponentUsage.objects.filter(assembly__path__startswith=path).delete()
+        return _index(path, parent_path, root_id, multiplier)
+
+
+def _index(path: str, parent_path: str, root_id, multiplier: Decimal) -> int:
+    usages: List[ComponentUsage] = []
+    saved = 0
+    # [path, cumulative quantity] of ancestors of current row
+    stack = [(parent_path, multiplier)]
+    rows = Assembly.objects.filter(path__startswith=path).values_list('pk', 'path', 'quantity', 'component_id')
+    for pk, node_path, quantity, component_id in rows.iterator(chunk_size=BATCH_SIZE):
+        while not node_path.startswith(stack[-1][0]):
+            stack.pop()
+        if root_id is None:
+            root_id = pk
+        cumulative = stack[-1][1] * quantity
+        stack.append((node_path, cumulative))
+        usages.append(ComponentUsage(assembly_id=pk, component_id=component_id, root_id=root_id, quantity=cumulative))
+        if len(usages) >= BATCH_SIZE:
+            ComponentUsage.objects.bulk_create(usages)
+            saved += len(usages)
+            usages = []
+    ComponentUsage.objects.bulk_create(usages)
+    return saved + len(usages)
+
+
+def where_used(component_id) -> List[dict]:
+    """ Returns root products containing component, with summed quantity of the component and number
+        of its occurrences in each of them. Served from the index with a single query. Shared sub-assemblies
+        (see bom.shared) are indexed as separate trees, uses in them are uses in trees of nodes referencing
+        them, with quantities of the references, found with one more query for every level of nesting.
+
+        Returns
+        ----------
+        List[dict]
+            dicts with root, identifier, name, quantity and occurrences keys, ordered by root
+    """
+    entries = (
+        ComponentUsage.objects.filter(component_id=component_id)
+        # root of shared sub-assembly is used through its references
+        .exclude(root__is_shared=True, assembly=F('root'))
+        .values('root', 'root__is_shared', identifier=F('root__component__identifier'),
+                name=F('root__component__name'))
+        .annotate(quantity=Sum('quantity'), occurrences=Count('pk'))
+    )
+    products, shared = {}, {}
+    for entry in entries:
+        (shared if entry.pop('root__is_shared') else products)[entry['root']] = entry
+    while shared:
+        references = ComponentUsage.objects.filter(assembly__shared__in=list(shared)).values_list(
+            'assembly__shared', 'root', 'root__is_shared', 'root__component__identifier', 'root__component__name',
+            'quantity')
+        nested = {}
+        for shared_id, root, is_shared, identifier, name, quantity in references:
+            use = shared[shared_id]
+            entry = (nested if is_shared else products).setdefault(
+                root, {'root': root, 'identifier': identifier, 'name': name, 'quantity': Decimal(0), 'occurrences': 0})
+            entry['quantity'] = (entry['quantity'] + use['quantity'] * quantity).quantize(QUANTITY_QUANTUM)
+            entry['occurrences'] += use['occurrences']
+        shared = nested
+    return sorted(products.values(), key=lambda entry: entry['root'])
@@ -0,0 +1,7 @@
+from typing import Iterator, List
+
+
+def chunks(items: List, size: int) -> Iterator[List]:
+    """ Yields consecutive slices of items with at most size elements. """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
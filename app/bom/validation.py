@@ -0,0 +1,228 @@
+import csv
+import io
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from bom.entities import CSVLineEntity
+
+ROW_LENGTH = 8
+# errors of valid rows, shared so that nothing is allocated for them
+NO_ERRORS: Tuple[str, ...] = ()
+# number of distinct texts shared between entities before they are forgotten, so that they don't grow with file
+SHARED_VALUES_LIMIT = 50_000
+
+CheckedRow = Tuple[int, Optional[CSVLineEntity], Sequence[str]]
+
+
+def parsed_line(raw_item: List[str]) -> CSVLineEntity:
+    return CSVLineEntity(depth=int(raw_item[0]),
+                         identifier=raw_item[1],
+                         name=raw_item[2],
+                         category=raw_item[3],
+                         unit=raw_item[4],
+                         procurement_type=raw_item[5],
+                         quantity=float(raw_item[6]),
+                         price=float(raw_item[7]) if raw_item[7] else 0)
+
+
+def row_errors(idx: int, errors: List[str]) -> dict:
+    return {
+        "row_number": idx,
+        "verbose:": errors
+    }
+
+
+def _level(value: str) -> Optional[int]:
+    try:
+        level = int(value)
+    except ValueError:
+        return None
+    return level if level >= 0 else None
+
+
+def row_level(row: List[str]) -> Optional[int]:
+    """ Returns level of csv row, None when it is not valid. """
+    return _level(row[0]) if row else None
+
+
+def _is_number(value: str) -> bool:
+    # float accepts nan and inf, which can't be stored in decimal fields
+    try:
+        return math.isfinite(float(value))
+    except ValueError:
+        return False
+
+
+def validated_line(raw_item: List[str]) -> Tuple[CSVLineEntity, List[str]]:
+    """ Takes line(row) from csv file and transforms it to CSVLineEntity object.
+        Assumes that proper format of file contains following fields in following format:
+        level	item_number	item_name	item_category	unit_of_measure	procurement_type	quantity	Price by Unit
+
+
+        Parameters
+        -----------
+        raw_item: List[str]
+            line(row) from csv file as a raw list of strings
+
+        Returns
+        ----------
+        CSVLineEntity
+            csv text converted to CSVLineEntity object or None if there were any errors
+        List
+            list of errors if there are any, if not returns empty list
+    """
+    csv_entity = None
+    errors = []
+
+    if len(raw_item) != ROW_LENGTH:
+        errors.append("Each item should have 8 elements.")
+        raw_item = (raw_item + [""] * ROW_LENGTH)[:ROW_LENGTH]
+    if not raw_item[0]:
+        errors.append("Field required: level")
+    elif _level(raw_item[0]) is None:
+        errors.append("Field has to be a non-negative integer: level")
+    if not raw_item[1]:
+        errors.append("Field required: identifier")
+    if not raw_item[2]:
+        errors.append("Field required: name")
+    if not raw_item[4]:
+        errors.append("Field required: unit")
+    if not raw_item[5]:
+        errors.append("Field required: procurement_type")
+    if not raw_item[6]:
+        errors.append("Field required: quantity")
+    elif not _is_number(raw_item[6]):
+        errors.append("Field has to be a number: quantity")
+    if raw_item[7] and not _is_number(raw_item[7]):
+        errors.append("Field has to be a number: price")
+
+    if not errors:
+        csv_entity = parsed_line(raw_item)
+    return csv_entity, errors
+
+
+def valid_entity(raw_item: List[str], shared: Optional[Dict[str, str]] = None) -> Optional[CSVLineEntity]:
+    """ Parses row without collecting errors, returns None when row is not valid and has to be validated
+        by validated_line. When shared dict is given (kept by caller for the whole file), text values equal
+        to values of earlier rows are replaced with them, so that components repeated across the file
+        don't keep a copy of their texts for every buffered row.
+    """
+    if len(raw_item) != ROW_LENGTH:
+        return None
+    level, identifier, name, category, unit, procurement_type, quantity, price = raw_item
+    # empty level and quantity don't pass int and float
+    if not (identifier and name and unit and procurement_type):
+        return None
+    if shared is not None:
+        if len(shared) > SHARED_VALUES_LIMIT:
+            shared.clear()
+        identifier, name, category, unit, procurement_type = [
+            shared.setdefault(value, value) for value in (identifier, name, category, unit, procurement_type)]
+    try:
+        entity = CSVLineEntity(int(level), identifier, name, category, unit, procurement_type, float(quantity),
+                               float(price) if price else 0)
+    except ValueError:
+        return None
+    if entity.depth < 0 or not (math.isfinite(entity.quantity) and math.isfinite(entity.price)):
+        return None
+    return entity
+
+
+def level_error(level: Optional[int], previous_level: Optional[int]) -> Optional[str]:
+    """ Checks level of a row against level of the previous row (-1 for the first row of file).
+        Levels which are not known (invalid) are not checked.
+    """
+    if level is None or previous_level is None or level <= previous_level + 1:
+        return None
+    if previous_level < 0:
+        return "First row has to be at level 0."
+    return "Level can be at most one deeper than level of previous row."
+
+
+def checked_rows(rows: Iterable[List[str]], start: int = 0, previous_level: Optional[int] = -1,
+                 shared: Optional[Dict[str, str]] = None) -> Iterator[CheckedRow]:
+    """ Validates rows with validated_line and checks levels of consecutive rows: first row of file has to be
+        at level 0 and a row can be at most one level deeper than the previous one.
+
+        Parameters
+        -----------
+        rows: Iterable[List[str]]
+            csv rows, without header
+        start: int
+            index of the first row in file
+        previous_level: int
+            level of the row preceding the first one, -1 when rows start the file, None when it is not known
+        shared: Dict[str, str]
+            texts shared between entities, see valid_entity, given when entities are kept
+
+        Returns
+        ----------
+        Iterator[Tuple[int, CSVLineEntity, Sequence[str]]]
+            index, entity (None when there are errors) and errors of every row, NO_ERRORS for valid rows
+    """
+    for idx, row in enumerate(rows, start):
+        entity = valid_entity(row, shared)
+        if entity is None:
+            entity, errors = validated_line(row)
+            level = row_level(row)
+        else:
+            errors, level = NO_ERRORS, entity.depth
+        error = level_error(level, previous_level)
+        if error:
+            errors = [*errors, error]
+            entity = None
+        previous_level = level
+        yield idx, entity, errors
+
+
+def validate_chunk(start: int, text: str, delimiter: str = ",") -> Tuple[dict, Optional[int], Optional[int]]:
+    """ Validates chunk of csv text like checked_rows, run in worker processes of parallel validation.
+
+        Parameters
+        -----------
+        start: int
+            index of the first row of chunk in file
+        text: str
+            complete csv rows
+        delimiter: str
+            delimiter of values in rows
+
+        Returns
+        ----------
+        Dict
+            errors of invalid rows in validate_file format, in row order
+        int
+            level of the first row of chunk, None when it is not valid
+        int
+            level of the last row of chunk, None when it is not valid
+    """
+    rows = list(csv.reader(io.StringIO(text, newline=""), delimiter=delimiter))
+    errors = {f"row_{idx}": row_errors(idx, row_errors_)
+              for idx, _, row_errors_ in checked_rows(rows, start, None if start else -1) if row_errors_}
+    first_level = row_level(rows[0]) if rows else None
+    last_level = row_level(rows[-1]) if rows else None
+    return errors, first_level, last_level
+
+
+def line_chunks(lines: Iterable[str], size: int) -> Iterator[Tuple[int, str]]:
+    """ Joins decoded lines of csv file into chunks of about size rows. Chunks end only where a row ends,
+        so that quoted values spanning lines are not split: there an even number of quote characters
+        was read so far.
+
+        Returns
+        ----------
+        Iterator[Tuple[int, str]]
+            index of the first row of chunk and its text
+    """
+    chunk, start, rows, quotes = [], 0, 0, 0
+    for line in lines:
+        chunk.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        rows += 1
+        if rows - start >= size:
+            yield start, "".join(chunk)
+            chunk, start = [], rows
+    if chunk:
+        yield start, "".join(chunk)
@@ -0,0 +1,51 @@
+import hashlib
+from typing import Iterable, Optional
+
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Substr
+
+from bom.models import Assembly, TreeVersion
+
+ROOT_LIST = ""
+
+
+def bump_tree_versions(paths: Iterable[str]):
+    """ Bumps versions of trees containing given paths and version of the list of roots.
+
+        Parameters
+        -----------
+        paths: Iterable[str]
+            paths of changed nodes (or of their ancestors)
+    """
+    root_paths = {path[:Assembly.steplen] for path in paths} | {ROOT_LIST}
+    TreeVersion.objects.bulk_create([TreeVersion(root_path=root_path) for root_path in root_paths],
+                                    ignore_conflicts=True)
+    TreeVersion.objects.filter(root_path__in=root_paths).update(version=F('version') + 1)
+
+
+def _etag(*parts) -> str:
+    return hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def item_etag(item_id, query_string: str = "", endpoint: str = "item") -> Optional[str]:
+    """ Returns ETag of item details, based on path of the item and version of its tree.
+        Found with a single query, tree itself is not read. Other endpoints of the item pass their name,
+        so that their ETags (and cached responses) differ from those of details.
+
+        Returns
+        ----------
+        str
+            etag or None when item doesn't exist
+    """
+    version = TreeVersion.objects.filter(root_path=Substr(OuterRef('path'), 1, Assembly.steplen)).values('version')
+    row = Assembly.objects.filter(pk=item_id).annotate(version=Subquery(version)).values_list('path', 'version').first()
+    if row is None:
+        return None
+    path, version = row
+    return _etag(endpoint, item_id, path, version or 0, query_string)
+
+
+def list_etag(query_string: str = "") -> str:
+    """ Returns ETag of the list of roots. """
+    version = TreeVersion.objects.filter(root_path=ROOT_LIST).values_list('version', flat=True).first()
+    return _etag("list", version or 0, query_string)
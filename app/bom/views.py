@@ -1,11 +1,38 @@
+from functools import cached_property
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
 from drf_spectacular.utils import extend_schema
 from rest_framework import generics, status
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+
+from bom import metrics
+from bom.diff import diff_trees
+from bom.explosion import explode
+from bom.jobs import submit_import
+from bom.models import Assembly, Component, ImportJob
+from bom.pagination import PathCursorPagination
+from bom.renderers import ExplosionCSVRenderer
+from bom.routers import check_database, choose_replica, pin_primary, read_from, reading_from
+from bom.serializers import (FileUploadSerializer, AssemblySerializer, AssemblyNodeSerializer, ExplosionQuerySerializer,
+                             ExplosionSerializer, FileImportSerializer, ImportJobSerializer, TreeDiffSerializer,
+                             TreeQuerySerializer, WhereUsedSerializer)
+from bom.services import validate_file_with_token
+from bom.streaming import stream_dump
+from bom.usage import where_used
+from bom.versions import item_etag, list_etag
 
-from bom.models import Assembly
-from bom.serializers import FileUploadSerializer, AssemblySerializer
-from bom.services import save_to_db, validate_file
+# responses include absolute links (pagination), so they are cached for every scheme and host
+RESPONSE_CACHE_KEY = "bom:response:{origin}:{etag}"
 
 
 class FileValidateAPIView(generics.GenericAPIView):
@@ -19,35 +46,247 @@ class FileValidateAPIView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         file = serializer.validated_data['file']
-        results = validate_file(file)
+        results, token = validate_file_with_token(file)
         if results:
             return Response(status=status.HTTP_400_BAD_REQUEST, data=results)
-        return Response(status=status.HTTP_204_NO_CONTENT, data="Validation successful")
+        return Response(status=status.HTTP_204_NO_CONTENT, data="Validation successful",
+                        headers={'Validation-Token': token})
 
 
 class FileUploadAPIView(generics.GenericAPIView):
-    serializer_class = FileUploadSerializer
+    serializer_class = FileImportSerializer
+
     @extend_schema(
-        request=FileUploadSerializer,
-        responses={204: str},
+        request=FileImportSerializer,
+        responses={202: ImportJobSerializer},
     )
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         file = serializer.validated_data['file']
-        save_to_db(file)
-        return Response(status=status.HTTP_204_NO_CONTENT, data="Uploaded successfully")
+        job = submit_import(file, token=serializer.validated_data.get('token'),
+                            deduplicate=serializer.validated_data['deduplicate'],
+                            target=serializer.validated_data.get('target'))
+        response = Response(status=status.HTTP_202_ACCEPTED, data=ImportJobSerializer(job).data,
+                            headers={'Location': reverse('bom:job_details', kwargs={'id': job.pk}, request=request)})
+        pin_primary(response)
+        return response
+
 
+class ImportJobAPIView(generics.RetrieveAPIView):
+    """ Returns status of import job. Clients polling it keep reading from primary until their import
+        finished and a while after, so that they find imported trees before they are replicated.
+    """
+    serializer_class = ImportJobSerializer
 
-class ItemDetailsAPIView(generics.RetrieveAPIView):
     def get_object(self):
-        return get_object_or_404(Assembly, id=self.kwargs.get('id', None))
+        return get_object_or_404(ImportJob, id=self.kwargs.get('id', None))
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        pin_primary(response)
+        return response
+
+
+class ReplicaReadMixin:
+    """ Reads from a healthy read replica (see bom.routers), including streamed content, unless the client
+        wrote recently and has to see its own writes.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        alias = choose_replica(request)
+        with reading_from(alias):
+            response = super().dispatch(request, *args, **kwargs)
+        if response.streaming:
+            response.streaming_content = read_from(alias, response.streaming_content)
+        return response
+
+
+class ConditionalCacheMixin:
+    """ Answers GET with ETag of current tree version. Requests with matching If-None-Match get 304
+        without reading the tree, other responses are cached under their ETag unless they are streamed.
+    """
+
+    def get_etag(self) -> Optional[str]:
+        raise NotImplementedError
+
+    def get_data(self):
+        raise NotImplementedError
+
+    def get_streaming_content(self):
+        """ Returns iterator of response parts when response is too large to be built and cached. """
+        return None
 
     def get(self, request, *args, **kwargs):
-        tree = Assembly.dump_bulk(self.get_object(), keep_ids=False)
-        return Response(tree)
+        etag = self.get_etag()
+        if etag is None:
+            raise Http404
+        quoted_etag = quote_etag(etag)
+        not_modified = get_conditional_response(request, etag=quoted_etag)
+        if not_modified is not None:
+            not_modified['ETag'] = quoted_etag
+            return not_modified
+
+        key = RESPONSE_CACHE_KEY.format(origin=f"{request.scheme}://{request.get_host()}", etag=etag)
+        data = cache.get(key)
+        if data is None:
+            streaming_content = self.get_streaming_content()
+            if streaming_content is not None:
+                return StreamingHttpResponse(streaming_content, content_type='application/json',
+                                             headers={'ETag': quoted_etag})
+            data = self.get_data()
+            cache.set(key, data, timeout=settings.BOM_RESPONSE_CACHE_TIMEOUT)
+        return Response(data, headers={'ETag': quoted_etag})
+
+
+class TreeQueryMixin:
+    """ Reads max_depth, children and fields query parameters, see TreeQuerySerializer. """
+    pagination_class = PathCursorPagination
+
+    @cached_property
+    def tree_query(self) -> dict:
+        serializer = TreeQuerySerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fields': self.tree_query.get('fields')}
+
+    def get_list_data(self, queryset, **context):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(queryset if page is None else page, many=True,
+                                         context={**self.get_serializer_context(), **context})
+        if page is None:
+            return list(serializer.data)
+        return self.get_paginated_response(serializer.data).data
+
+
+class ItemDetailsAPIView(ReplicaReadMixin, TreeQueryMixin, ConditionalCacheMixin, generics.RetrieveAPIView):
+    """ Returns whole subtree of the item, max_depth levels of it, or its direct children
+        (children=true, optionally paginated with page_size and cursor).
+        Subtrees with at least BOM_STREAMING_MIN_NODES nodes are streamed.
+    """
+    serializer_class = AssemblyNodeSerializer
+
+    def get_object(self):
+        return get_object_or_404(Assembly.objects.select_related('rollup'), id=self.kwargs.get('id', None))
 
+    @cached_property
+    def item(self) -> Assembly:
+        return self.get_object()
 
-class ItemListAPIView(generics.ListAPIView):
+    def get_etag(self) -> Optional[str]:
+        return item_etag(self.kwargs.get('id', None), self.request.META.get('QUERY_STRING', ''))
+
+    def get_dump_kwargs(self) -> dict:
+        max_depth = self.tree_query.get('max_depth')
+        # nodes cut off by max_depth are expanded by their ids
+        return {'keep_ids': max_depth is not None, 'with_costs': True, 'max_depth': max_depth,
+                'fields': self.tree_query.get('fields')}
+
+    def get_streaming_content(self):
+        rollup = getattr(self.item, 'rollup', None)
+        if self.tree_query['children'] or rollup is None or rollup.descendants < settings.BOM_STREAMING_MIN_NODES:
+            return None
+        return stream_dump(self.item, **self.get_dump_kwargs())
+
+    def get_data(self):
+        obj = self.item
+        if self.tree_query['children']:
+            # children of shared sub-assembly are children of nodes referencing it
+            parent = obj.shared if obj.shared_id else obj
+            queryset = Assembly.objects.select_related('component', 'rollup', 'shared').filter(
+                path__startswith=parent.path, depth=parent.depth + 1)
+            return self.get_list_data(queryset, multiplier=obj.quantity, depth=obj.depth + 1)
+        return Assembly.dump_bulk(obj, **self.get_dump_kwargs())
+
+
+class ItemListAPIView(ReplicaReadMixin, TreeQueryMixin, ConditionalCacheMixin, generics.ListAPIView):
+    serializer_class = AssemblySerializer
+    queryset = Assembly.objects.select_related('component').filter(depth=1, is_shared=False)
+
+    def get_etag(self) -> Optional[str]:
+        return list_etag(self.request.META.get('QUERY_STRING', ''))
+
+    def get_data(self):
+        return self.get_list_data(self.filter_queryset(self.get_queryset()))
+
+
+class ItemDuplicatesAPIView(ReplicaReadMixin, generics.ListAPIView):
+    """ Returns other assemblies with subtree identical to subtree of the item (same signature),
+        e.g. sub-assembly repeated in many products. Paginated with page_size and cursor.
+    """
     serializer_class = AssemblySerializer
-    queryset = Assembly.objects.select_related('component').filter(depth=1)
+    pagination_class = PathCursorPagination
+
+    def get_queryset(self):
+        item = get_object_or_404(Assembly.objects.select_related('rollup'), id=self.kwargs.get('id', None))
+        rollup = getattr(item, 'rollup', None)
+        if rollup is None or not rollup.signature:
+            return Assembly.objects.none()
+        return Assembly.objects.select_related('component').filter(
+            rollup__signature=rollup.signature, is_shared=False).exclude(pk=item.pk)
+
+
+class ItemExplosionAPIView(ReplicaReadMixin, ConditionalCacheMixin, generics.GenericAPIView):
+    """ Returns flat buy list of the item: total quantities of leaf components needed for given
+        number of units, grouped by procurement type and unit. format=csv returns it as csv.
+    """
+    serializer_class = ExplosionSerializer
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ExplosionCSVRenderer]
+
+    def get_etag(self) -> Optional[str]:
+        return item_etag(self.kwargs.get('id', None), self.request.META.get('QUERY_STRING', ''), "explosion")
+
+    def get_data(self):
+        query = ExplosionQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        item = get_object_or_404(Assembly, id=self.kwargs.get('id', None))
+        units = query.validated_data['units']
+        return self.get_serializer({'item': item.pk, 'units': units, 'groups': explode(item, units)}).data
+
+
+class ItemDiffAPIView(ReplicaReadMixin, ConditionalCacheMixin, generics.GenericAPIView):
+    """ Compares the item (new revision) with base item (old revision): added and removed subtrees,
+        nodes with changed quantity and nodes with changed price.
+    """
+    serializer_class = TreeDiffSerializer
+
+    def get_etag(self) -> Optional[str]:
+        etags = (item_etag(self.kwargs.get('id', None), self.request.META.get('QUERY_STRING', ''), "diff"),
+                 item_etag(self.kwargs.get('base_id', None)))
+        if None in etags:
+            return None
+        return "-".join(etags)
+
+    def get_data(self):
+        new = get_object_or_404(Assembly, id=self.kwargs.get('id', None))
+        old = get_object_or_404(Assembly, id=self.kwargs.get('base_id', None))
+        return self.get_serializer(diff_trees(old, new)).data
+
+
+class ComponentWhereUsedAPIView(ReplicaReadMixin, generics.RetrieveAPIView):
+    """ Returns root products containing the component with its total quantity in each of them. """
+    serializer_class = WhereUsedSerializer
+
+    def get_object(self):
+        component = get_object_or_404(Component, id=self.kwargs.get('id', None))
+        return {'component': component, 'products': where_used(component.pk)}
+
+
+@require_GET
+def metrics_view(request):
+    """ Returns metrics of requests and imports handled by this process in prometheus text format.
+        Plain django view, so that scrapes don't depend on content negotiation of the api.
+    """
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@require_GET
+def health_view(request):
+    """ Returns whether primary database and read replicas answer (and replicas don't lag too much),
+        503 when primary doesn't. Replicas are checked now, regardless of BOM_REPLICA_HEALTH_INTERVAL.
+    """
+    healthy = {alias: check_database(alias) for alias in (DEFAULT_DB_ALIAS, *settings.BOM_READ_REPLICAS)}
+    databases = {alias: "ok" if is_healthy else "unavailable" for alias, is_healthy in healthy.items()}
+    return JsonResponse({'databases': databases}, status=200 if healthy[DEFAULT_DB_ALIAS] else 503)
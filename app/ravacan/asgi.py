@@ -9,8 +9,10 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from bom.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ravacan.settings')
+# every ASGI request runs in a new thread, persistent connections would be left open by finished threads
+os.environ.setdefault('SQL_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
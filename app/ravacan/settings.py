@@ -39,7 +39,6 @@ INSTALLED_APPS = [
     # 3rd party
     "rest_framework",
     "treebeard",
-    "debug_toolbar",
     'drf_spectacular',
 
     # application
@@ -47,7 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    # records time and database queries of requests for /metrics, first so that time of other middleware counts
+    "bom.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -56,6 +56,10 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
+if DEBUG:
+    # middleware of toolbar is sync only, under ASGI requests would switch between event loop and threads around it
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(1, "debug_toolbar.middleware.DebugToolbarMiddleware")
 
 ROOT_URLCONF = "ravacan.urls"
 
@@ -85,6 +89,27 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD", "ravacan"),
         "HOST": os.environ.get("SQL_HOST", "db"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        # persistent connections, ravacan.asgi sets 0 (threads of ASGI requests don't live long enough to reuse them)
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", 60)),
+    }
+}
+# Read replicas of default database, comma separated hosts (paths of database files with SQLite), item endpoints
+# read from them (bom.routers), unreachable replicas don't wait longer than connect_timeout
+for _idx, _replica in enumerate(filter(None, os.environ.get("SQL_REPLICAS", "").split(",")), start=1):
+    if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+        DATABASES[f"replica{_idx}"] = {**DATABASES["default"], "NAME": _replica, "TEST": {"MIRROR": "default"}}
+    else:
+        DATABASES[f"replica{_idx}"] = {**DATABASES["default"], "HOST": _replica, "TEST": {"MIRROR": "default"},
+                                       "OPTIONS": {"connect_timeout": int(os.environ.get("SQL_CONNECT_TIMEOUT", 2))}}
+DATABASE_ROUTERS = ["bom.routers.ReplicaRouter"]
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "ravacan"),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", 10000)),
+        },
     }
 }
 
@@ -115,6 +140,53 @@ SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True
 }
 
+# How long (in seconds) a validated file can be uploaded without validating it again
+BOM_VALIDATION_TOKEN_TIMEOUT = int(os.environ.get("BOM_VALIDATION_TOKEN_TIMEOUT", 60 * 60))
+# Files of at least this many bytes are validated in chunks of rows by a pool of processes, 0 workers disables it
+BOM_VALIDATION_WORKERS = int(os.environ.get("BOM_VALIDATION_WORKERS", 2))
+BOM_VALIDATION_CHUNK_SIZE = int(os.environ.get("BOM_VALIDATION_CHUNK_SIZE", 20_000))
+BOM_PARALLEL_VALIDATION_MIN_SIZE = int(os.environ.get("BOM_PARALLEL_VALIDATION_MIN_SIZE", 16 * 1024 * 1024))
+
+# Backend running import jobs: bom.jobs.ThreadPoolBackend, bom.jobs.ProcessPoolBackend or bom.jobs.SyncBackend
+BOM_IMPORT_BACKEND = os.environ.get("BOM_IMPORT_BACKEND", "bom.jobs.ThreadPoolBackend")
+BOM_IMPORT_WORKERS = int(os.environ.get("BOM_IMPORT_WORKERS", 2))
+BOM_IMPORT_PROGRESS_TIMEOUT = int(os.environ.get("BOM_IMPORT_PROGRESS_TIMEOUT", 24 * 60 * 60))
+# Readers of uploaded files (bom.importers.Importer), format is found by content type, then by extension,
+# files of unknown formats are rejected. xlsx needs openpyxl, parquet and arrow need pyarrow
+BOM_IMPORTERS = [
+    "bom.importers.CSVImporter",
+    "bom.importers.TSVImporter",
+    "bom.importers.JSONLinesImporter",
+    "bom.importers.XLSXImporter",
+    "bom.importers.ParquetImporter",
+    "bom.importers.ArrowImporter",
+]
+# Import files with columnar parser (bom.columnar), files which are deduplicated or patch a tree are read row by row
+BOM_COLUMNAR_IMPORT = os.environ.get("BOM_COLUMNAR_IMPORT", "false").lower() == "true"
+# Writer of imported rows: bom.ingest.BulkCreateIngest or bom.ingest.CopyIngest (COPY into staging tables,
+# PostgreSQL only, bulk_create is used with other databases)
+BOM_INGEST_BACKEND = os.environ.get("BOM_INGEST_BACKEND", "bom.ingest.BulkCreateIngest")
+
+# How long (in seconds) rendered trees are kept in cache, entries of old tree versions are never read again
+BOM_RESPONSE_CACHE_TIMEOUT = int(os.environ.get("BOM_RESPONSE_CACHE_TIMEOUT", 24 * 60 * 60))
+# Trees with at least this many nodes are streamed as they are read from database instead of being cached
+BOM_STREAMING_MIN_NODES = int(os.environ.get("BOM_STREAMING_MIN_NODES", 10_000))
+# Requests of ASGI process (bom.asgi) running their views or reading parts of streamed trees at once,
+# at most BOM_ASGI_STREAM_WORKERS of them read parts, waiting views are served first. Views are mostly python
+# code sharing the interpreter, more of them at once take longer each, run more processes to use more cores
+BOM_ASGI_WORKERS = int(os.environ.get("BOM_ASGI_WORKERS", 1))
+BOM_ASGI_STREAM_WORKERS = int(os.environ.get("BOM_ASGI_STREAM_WORKERS", 1))
+# Aliases of databases which item endpoints read from, unless client wrote in last BOM_REPLICA_PIN_SECONDS seconds
+BOM_READ_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+BOM_REPLICA_PIN_SECONDS = int(os.environ.get("BOM_REPLICA_PIN_SECONDS", 15))
+# Replicas are checked at most once in this many seconds, those lagging more than BOM_REPLICA_MAX_LAG seconds
+# behind primary (PostgreSQL) are skipped like unreachable ones
+BOM_REPLICA_HEALTH_INTERVAL = int(os.environ.get("BOM_REPLICA_HEALTH_INTERVAL", 10))
+BOM_REPLICA_MAX_LAG = float(os.environ.get("BOM_REPLICA_MAX_LAG", 5))
+# Persistent connections are checked at the start of requests (bom.signals) at most once in this many seconds,
+# or after their queries failed
+BOM_CONN_CHECK_INTERVAL = int(os.environ.get("BOM_CONN_CHECK_INTERVAL", 10))
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "UTC"
 USE_I18N = True
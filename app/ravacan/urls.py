@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from bom.views import health_view, metrics_view
+
 api_urls = [
     path('bom/', include('bom.urls')),
 
@@ -12,5 +15,8 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path('api/', include(api_urls)),
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('__debug__/', include('debug_toolbar.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('health', health_view, name='health'),
 ]
+if settings.DEBUG:
+    urlpatterns.append(path('__debug__/', include('debug_toolbar.urls')))